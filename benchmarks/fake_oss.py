@@ -0,0 +1,410 @@
+"""本地 OSS 替身服务器：实现上传用到的那部分 OSS 协议，用于基准测试和集成测试。
+
+    python benchmarks/fake_oss.py --port 9000 --latency 20 --bandwidth 20M
+    # 然后把配置中的 endpoint 设为 http://127.0.0.1:9000，bucket 随意（至少 3 个字符）
+
+支持 PUT/HEAD 对象（请求体可以是分块传输），分片上传的初始化、上传分片、列出分片、合并和取消。
+对象内容不落盘，只记录大小、ETag (MD5) 和 CRC64，内存占用与上传量无关。
+可以模拟网络条件和故障：
+    --latency      每个请求在响应前额外等待的毫秒数（近似往返时延）
+    --bandwidth    所有连接共享的上行带宽，例如 10M 表示 10 MB/s
+    --error-rate   上传请求按概率返回 503 ServiceUnavailable
+    --reset-rate   上传请求按概率在接收一半数据后直接断开连接
+    --max-inflight 同时进行的上传请求超过这个数时返回 503 SlowDown（模拟限流）
+签名不做校验，任意 AccessKey 都可以。
+"""
+import sys
+import json
+import time
+import uuid
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.etree import ElementTree
+
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_rate(text):
+    """'10M' -> 10485760，支持 K/M/G 后缀；0 或空表示不限速"""
+    if not text:
+        return 0
+    text = str(text).strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+
+class TokenBucket:
+    """所有连接共享的限速器，每秒补充 rate 字节，最多积攒 0.1 秒的量"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(CHUNK_SIZE, rate / 10)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, count):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= count:
+                    self._tokens -= count
+                    return
+                wait = (count - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FakeOssServer:
+    """在后台线程中运行的替身服务器，endpoint 可以直接写进上传配置"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, bandwidth=0, error_rate=0.0,
+                 reset_rate=0.0, max_inflight=0, crc=True, seed=None):
+        self.latency = latency / 1000.0
+        self.limiter = TokenBucket(bandwidth) if bandwidth else None
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.max_inflight = max_inflight
+        self.crc = crc
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.objects = {}   # (bucket, key) -> {'size', 'etag', 'crc'}
+        self.uploads = {}   # upload_id -> {'bucket', 'key', 'parts': {number: {'size', 'etag', 'crc'}}}
+        self.inflight = 0
+        self.stats = {'requests': 0, 'connections': 0, 'bytes_received': 0,
+                      'errors_injected': 0, 'resets_injected': 0, 'throttled': 0}
+
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        # 注入的断开故障会让处理线程写已关闭的连接，不打印这些异常
+        self.httpd.handle_error = lambda request, client_address: None
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        # 轮询间隔决定 stop() 要等多久，测试中频繁启停，取短一些
+        self._thread = threading.Thread(target=self.httpd.serve_forever, kwargs={'poll_interval': 0.05},
+                                        name="fake-oss", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def roll(self, rate):
+        if not rate:
+            return False
+        with self.lock:
+            return self.random.random() < rate
+
+
+def _make_handler(server):
+    from oss2.utils import Crc64
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # 保持连接，客户端的连接池才能复用
+        server_version = "FakeOSS"
+
+        def setup(self):
+            super().setup()
+            server.count('connections')
+
+        def log_message(self, format, *args):
+            pass
+
+        # --- 请求分发 ---
+        def route(self):
+            parts = urlsplit(self.path)
+            # IP 形式的 endpoint 下 oss2 使用路径风格: /bucket/key
+            bucket, _, key = parts.path.lstrip('/').partition('/')
+            return unquote(bucket), unquote(key), {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+
+        def do_HEAD(self):
+            server.count('requests')
+            bucket, key, _ = self.route()
+            self.delay()
+            with server.lock:
+                obj = server.objects.get((bucket, key))
+            if obj is None:
+                return self.reply(404, headers={'x-oss-err': base64.b64encode(
+                    self.error_xml('NoSuchKey', 'The specified key does not exist.')).decode()}, body=None)
+            self.reply(200, headers={'Content-Length': str(obj['size']), **self.object_headers(obj)}, body=None)
+
+        def do_GET(self):
+            server.count('requests')
+            bucket, key, params = self.route()
+            self.drain()
+            self.delay()
+            if 'uploadId' in params:
+                return self.list_parts(bucket, key, params['uploadId'])
+            self.error(400, 'NotImplemented', 'Only HEAD, PUT and multipart uploads are supported.')
+
+        def do_PUT(self):
+            server.count('requests')
+            bucket, key, params = self.route()
+            if not self.admit():
+                return
+            try:
+                received = self.receive()
+                if received is None:
+                    return
+                size, etag, crc = received
+                self.delay()
+                if server.roll(server.error_rate):
+                    server.count('errors_injected')
+                    return self.error(503, 'ServiceUnavailable', 'Injected failure.')
+                meta = {'size': size, 'etag': etag, 'crc': crc,
+                        'content_encoding': self.headers.get('Content-Encoding')}
+                with server.lock:
+                    if 'uploadId' in params:
+                        upload = server.uploads.get(params['uploadId'])
+                        if upload is None:
+                            return self.error(404, 'NoSuchUpload', 'The specified upload does not exist.')
+                        upload['parts'][int(params['partNumber'])] = meta
+                    else:
+                        server.objects[(bucket, key)] = meta
+                self.reply(200, headers=self.object_headers(meta))
+            finally:
+                with server.lock:
+                    server.inflight -= 1
+
+        def do_POST(self):
+            server.count('requests')
+            bucket, key, params = self.route()
+            body = self.drain()
+            self.delay()
+            if 'uploads' in params:
+                upload_id = uuid.uuid4().hex.upper()
+                with server.lock:
+                    server.uploads[upload_id] = {'bucket': bucket, 'key': key, 'parts': {}}
+                return self.reply_xml('InitiateMultipartUploadResult',
+                                      [('Bucket', bucket), ('Key', key), ('UploadId', upload_id)])
+            if 'uploadId' in params:
+                return self.complete(bucket, key, params['uploadId'], body)
+            self.error(400, 'NotImplemented', 'Unsupported POST request.')
+
+        def do_DELETE(self):
+            server.count('requests')
+            _, _, params = self.route()
+            self.drain()
+            self.delay()
+            with server.lock:
+                server.uploads.pop(params.get('uploadId'), None)
+            self.reply(204, body=None)
+
+        # --- 分片上传 ---
+        def list_parts(self, bucket, key, upload_id):
+            with server.lock:
+                upload = server.uploads.get(upload_id)
+                parts = sorted(upload['parts'].items()) if upload else None
+            if parts is None:
+                return self.error(404, 'NoSuchUpload', 'The specified upload does not exist.')
+            fields = [('Bucket', bucket), ('Key', key), ('UploadId', upload_id),
+                      ('NextPartNumberMarker', str(parts[-1][0]) if parts else ''),
+                      ('MaxParts', '1000'), ('IsTruncated', 'false')]
+            for number, meta in parts:
+                fields.append(('Part', [('PartNumber', str(number)), ('ETag', f'"{meta["etag"]}"'),
+                                        ('Size', str(meta['size'])),
+                                        ('LastModified', time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()))]))
+            self.reply_xml('ListPartsResult', fields)
+
+        def complete(self, bucket, key, upload_id, body):
+            numbers = [int(node.findtext('PartNumber')) for node in ElementTree.fromstring(body).iter('Part')]
+            with server.lock:
+                upload = server.uploads.get(upload_id)
+                if upload is None:
+                    return self.error(404, 'NoSuchUpload', 'The specified upload does not exist.')
+                missing = [n for n in numbers if n not in upload['parts']]
+                if missing:
+                    return self.error(400, 'InvalidPart', f'Part {missing[0]} has not been uploaded.')
+                parts = [upload['parts'][n] for n in numbers]
+                crc = None
+                if server.crc:
+                    combiner, crc = Crc64(0), 0
+                    for part in parts:
+                        crc = combiner.combine(crc, part['crc'], part['size'])
+                etag = hashlib.md5(''.join(p['etag'] for p in parts).encode()).hexdigest().upper() + f"-{len(parts)}"
+                meta = {'size': sum(p['size'] for p in parts), 'etag': etag, 'crc': crc}
+                server.objects[(bucket, key)] = meta
+                del server.uploads[upload_id]
+            self.reply_xml('CompleteMultipartUploadResult',
+                           [('Location', f"{server.endpoint}/{bucket}/{key}"), ('Bucket', bucket),
+                            ('Key', key), ('ETag', f'"{etag}"')], headers=self.object_headers(meta))
+
+        # --- 网络条件和故障 ---
+        def admit(self):
+            """限流：同时上传的请求过多时直接返回 SlowDown 并断开（不读请求体）"""
+            with server.lock:
+                server.inflight += 1
+                throttled = server.max_inflight and server.inflight > server.max_inflight
+            if throttled:
+                server.count('throttled')
+                with server.lock:
+                    server.inflight -= 1
+                self.close_connection = True
+                self.error(503, 'SlowDown', 'Please reduce your request rate.', close=True)
+                return False
+            return True
+
+        def delay(self):
+            if server.latency:
+                time.sleep(server.latency)
+
+        def receive(self):
+            """读取请求体并计算 MD5/CRC64；注入断开故障时返回 None"""
+            chunked = self.headers.get('Transfer-Encoding', '').lower() == 'chunked'
+            length = int(self.headers.get('Content-Length') or 0)
+            # 分块传输时总长度未知，在第一个块之后断开
+            reset_at = (1 if chunked else length // 2) if server.roll(server.reset_rate) else None
+            md5 = hashlib.md5()
+            crc = Crc64(0) if server.crc else None
+            received = 0
+            for chunk in (self.read_chunked() if chunked else self.read_body(length)):
+                if server.limiter:
+                    server.limiter.consume(len(chunk))
+                md5.update(chunk)
+                if crc: crc.update(chunk)
+                received += len(chunk)
+                if reset_at is not None and received >= reset_at:
+                    server.count('resets_injected')
+                    self.close_connection = True
+                    self.connection.close()
+                    return None
+            server.count('bytes_received', received)
+            return received, md5.hexdigest().upper(), crc.crc if crc else None
+
+        def read_body(self, length):
+            remaining = length
+            while remaining:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+        def read_chunked(self):
+            """Transfer-Encoding: chunked 的请求体（例如边压缩边上传）"""
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                size = int(line.split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # 跳过 trailer 直到空行
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                yield from self.read_body(size)
+                self.rfile.readline()
+
+        def drain(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        # --- 响应 ---
+        def object_headers(self, meta):
+            headers = {'ETag': f'"{meta["etag"]}"', 'Last-Modified': formatdate(usegmt=True)}
+            if meta.get('crc') is not None:
+                headers['x-oss-hash-crc64ecma'] = str(meta['crc'])
+            if meta.get('content_encoding'):
+                headers['Content-Encoding'] = meta['content_encoding']
+            return headers
+
+        def error_xml(self, code, message):
+            return (f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>{code}</Code>"
+                    f"<Message>{message}</Message><RequestId>{uuid.uuid4().hex}</RequestId></Error>").encode()
+
+        def error(self, status, code, message, close=False):
+            self.reply(status, body=self.error_xml(code, message), content_type='application/xml', close=close)
+
+        def reply_xml(self, root, fields, headers=None):
+            def build(parent, items):
+                for name, value in items:
+                    node = ElementTree.SubElement(parent, name)
+                    if isinstance(value, list):
+                        build(node, value)
+                    else:
+                        node.text = value
+            element = ElementTree.Element(root)
+            build(element, fields)
+            body = b'<?xml version="1.0" encoding="UTF-8"?>' + ElementTree.tostring(element)
+            self.reply(200, headers=headers, body=body, content_type='application/xml')
+
+        def reply(self, status, headers=None, body=b'', content_type=None, close=False):
+            self.send_response(status)
+            self.send_header('x-oss-request-id', uuid.uuid4().hex)
+            self.send_header('Date', formatdate(usegmt=True))
+            if content_type:
+                self.send_header('Content-Type', content_type)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if body is not None and 'Content-Length' not in (headers or {}):
+                self.send_header('Content-Length', str(len(body)))
+            if close:
+                self.send_header('Connection', 'close')
+            self.end_headers()
+            if body and self.command != 'HEAD':
+                self.wfile.write(body)
+
+    return Handler
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 表示随机端口，实际端口打印在第一行")
+    parser.add_argument("--latency", type=float, default=0, help="每个请求额外等待的毫秒数")
+    parser.add_argument("--bandwidth", default="0", help="共享上行带宽，例如 500K、20M；0 不限速")
+    parser.add_argument("--error-rate", type=float, default=0, help="上传请求返回 503 的概率")
+    parser.add_argument("--reset-rate", type=float, default=0, help="上传请求中途断开的概率")
+    parser.add_argument("--max-inflight", type=int, default=0, help="超过这个并发数的上传请求返回 SlowDown")
+    parser.add_argument("--no-crc", action="store_true", help="不计算 CRC64（降低服务器 CPU 占用）")
+    parser.add_argument("--seed", type=int, help="故障注入的随机种子")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    server = FakeOssServer(args.host, args.port, latency=args.latency, bandwidth=parse_rate(args.bandwidth),
+                           error_rate=args.error_rate, reset_rate=args.reset_rate,
+                           max_inflight=args.max_inflight, crc=not args.no_crc, seed=args.seed)
+    # 第一行输出 endpoint，基准脚本从这里读取端口
+    print(json.dumps({"endpoint": server.endpoint}), flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats), file=sys.stderr, flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""启动性能基准：冷启动时导入 src.main 的耗时，以及从启动进程到主窗口首次绘制的耗时。
+
+    python benchmarks/startup.py                    # 运行 5 次，打印中位数
+    python benchmarks/startup.py --check            # 与 startup_baseline.json 比较，变慢超过容差时退出码为 1
+    python benchmarks/startup.py --update-baseline  # 用本机结果更新基线
+    python benchmarks/startup.py --max-shown-ms 600 # 或者直接给出绝对上限
+
+每次测量都启动一个新的解释器（冷启动），默认使用 offscreen 平台，CI 中不需要显示器。
+解释器本身的启动时间单独测量并从比较中扣除，基线在不同机器之间更稳定。
+启动阶段导入了 oss2 也视为退化：它只应在第一次上传或测试连接时导入。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_baseline.json")
+METRICS = ("import_ms", "shown_ms")
+
+
+def child():
+    """在子进程中启动界面，首次绘制主窗口时输出一行 JSON 后退出"""
+    t0 = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import src.main as app_main
+    import_ms = (time.perf_counter() - t0) * 1000
+
+    from PyQt5.QtCore import QObject, QEvent
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+    app.setStyleSheet(app_main.STYLESHEET)
+    window = app_main.MainWindow()
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint:
+                print(json.dumps({"import_ms": import_ms,
+                                  "oss2_loaded": "oss2" in sys.modules}), flush=True)
+                app.exit(0)
+            return False
+
+    first_paint = FirstPaint()
+    window.installEventFilter(first_paint)
+    window.show()
+    sys.exit(app.exec_())
+
+
+def child_env(home):
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    # 使用已配置的临时用户目录，避免首次启动弹出设置窗口或读写本机真实数据
+    env["HOME"] = env["USERPROFILE"] = home
+    with open(os.path.join(home, ".aliyun_oss_uploader_config.json"), 'w', encoding='utf-8') as f:
+        json.dump({"access_key_id": "bench", "access_key_secret": "bench", "bucket_name": "bench"}, f)
+    return env
+
+
+def measure_once(env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+    interpreter_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child"],
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    shown_ms = (time.perf_counter() - start) * 1000
+    _, stderr = proc.communicate(timeout=30)
+    if not line:
+        raise RuntimeError(f"子进程没有输出结果，界面可能启动失败:\n{stderr}")
+    result = json.loads(line)
+    result.update(interpreter_ms=interpreter_ms, shown_ms=shown_ms)
+    return result
+
+
+def measure(runs):
+    with tempfile.TemporaryDirectory() as home:
+        env = child_env(home)
+        samples = [measure_once(env) for _ in range(runs)]
+    report = {key: statistics.median(s[key] for s in samples)
+              for key in ("interpreter_ms",) + METRICS}
+    # 扣除解释器本身启动时间后的应用启动开销
+    report["app_shown_ms"] = report["shown_ms"] - report["interpreter_ms"]
+    report["oss2_loaded"] = any(s["oss2_loaded"] for s in samples)
+    return report
+
+
+def main(argv=None):
+    if argv is None and "--child" in sys.argv:
+        return child()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="与基线比较，退化时退出码为 1")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="允许比基线慢的比例 (默认 30%%)")
+    parser.add_argument("--max-import-ms", type=float, help="导入 src.main 的绝对上限")
+    parser.add_argument("--max-shown-ms", type=float, help="扣除解释器启动后到首次绘制的绝对上限")
+    args = parser.parse_args(argv)
+
+    report = measure(max(1, args.runs))
+    print(f"解释器启动   {report['interpreter_ms']:8.1f} ms")
+    print(f"导入 src.main {report['import_ms']:8.1f} ms")
+    print(f"窗口首次绘制 {report['shown_ms']:8.1f} ms (扣除解释器 {report['app_shown_ms']:.1f} ms)")
+    print(f"启动时导入 oss2: {'是' if report['oss2_loaded'] else '否'}")
+
+    if args.update_baseline:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({"import_ms": round(report["import_ms"], 1),
+                       "app_shown_ms": round(report["app_shown_ms"], 1)}, f, indent=4)
+            f.write("\n")
+        print(f"已更新基线: {BASELINE_FILE}")
+
+    failures = []
+    if report["oss2_loaded"]:
+        failures.append("启动阶段导入了 oss2")
+    if args.max_import_ms is not None and report["import_ms"] > args.max_import_ms:
+        failures.append(f"导入耗时 {report['import_ms']:.1f} ms 超过上限 {args.max_import_ms} ms")
+    if args.max_shown_ms is not None and report["app_shown_ms"] > args.max_shown_ms:
+        failures.append(f"首次绘制耗时 {report['app_shown_ms']:.1f} ms 超过上限 {args.max_shown_ms} ms")
+    if args.check:
+        with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        for key in ("import_ms", "app_shown_ms"):
+            limit = baseline[key] * (1 + args.tolerance)
+            if report[key] > limit:
+                failures.append(f"{key} {report[key]:.1f} ms 超过基线 {baseline[key]} ms 的 {1 + args.tolerance:.0%}")
+
+    for failure in failures:
+        print(f"退化: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""上传性能基准：对本地 OSS 替身服务器 (fake_oss.py) 跑几种典型负载，报告吞吐量、单文件耗时分位数和峰值内存。
+
+    python benchmarks/upload.py                          # 全部负载，打印结果表
+    python benchmarks/upload.py small --scale 0.2        # 只跑小文件负载，规模缩小到 20%
+    python benchmarks/upload.py --latency 50 --bandwidth 20M --error-rate 0.02
+    python benchmarks/upload.py --check                  # 与 upload_baseline.json 比较，退化时退出码为 1
+    python benchmarks/upload.py --update-baseline
+
+负载：
+    small  大量小文件（默认 1000 x 16 KB），主要看每个请求的固定开销和并发调度
+    huge   少量大文件（默认 3 x 64 MB），走分片上传，主要看带宽利用率和内存占用
+    mixed  混合（300 x 16 KB + 40 x 1 MB + 2 x 32 MB）
+
+服务器和每个负载的上传各在独立的进程中运行，峰值内存 (RSS) 只统计上传进程。
+默认网络条件为 20 ms 延迟、不限带宽、无故障，与基线比较时请保持相同的网络条件和 --scale。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "upload_baseline.json")
+FAKE_OSS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_oss.py")
+
+# 名称 -> [(文件数, 单个文件字节数)]
+WORKLOADS = {
+    "small": [(1000, 16 * 1024)],
+    "huge": [(3, 64 * 1024 * 1024)],
+    "mixed": [(300, 16 * 1024), (40, 1024 * 1024), (2, 32 * 1024 * 1024)],
+}
+BLOCK = os.urandom(1024 * 1024)
+
+
+def make_files(root, name, scale):
+    """生成负载文件，返回路径列表；内容由同一个随机块拼成，生成速度快且不可压缩"""
+    folder = os.path.join(root, name)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for group, (count, size) in enumerate(WORKLOADS[name]):
+        for i in range(max(1, int(count * scale))):
+            path = os.path.join(folder, f"{group}_{i}.bin")
+            with open(path, 'wb') as f:
+                remaining = size
+                while remaining:
+                    chunk = BLOCK[:min(remaining, len(BLOCK))]
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            paths.append(path)
+    return paths
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB，macOS 是字节
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def child(args):
+    """在子进程中上传一个负载，输出一行 JSON 结果"""
+    sys.path.insert(0, ROOT)
+    from src.core import UploadEngine, TransferStats
+
+    with open(args.child, 'r', encoding='utf-8') as f:
+        paths = [line.rstrip("\n") for line in f if line.strip()]
+    config = {
+        'access_key_id': 'bench', 'access_key_secret': 'bench',
+        'endpoint': args.endpoint, 'bucket_name': 'bench-bucket',
+        'custom_domain': '', 'upload_path': 'bench', 'use_random_name': False, 'url_expire_time': 0,
+        'upload_concurrency': args.concurrency, 'adaptive_concurrency': not args.fixed,
+        'concurrency_min': 1, 'concurrency_max': args.max_concurrency,
+        'multipart_threshold': 16 * 1024 * 1024, 'multipart_part_size': 8 * 1024 * 1024,
+        'multipart_threads': args.part_threads, 'dedup_enabled': False,
+        'retry_attempts': 5, 'retry_backoff': 0.05,
+    }
+    engine = UploadEngine(config, journal=False, history=False)
+    engine.connect()
+    stats = TransferStats()
+    retries = errors = 0
+    limits = []
+    for event in engine.upload_many(paths):
+        stats.feed(event)
+        if event['type'] == 'retry':
+            retries += 1
+        elif event['type'] == 'error':
+            errors += 1
+        elif event['type'] == 'concurrency':
+            limits.append(event['limit'])
+    result = stats.summary()
+    result.update(retries=retries, errors=errors, peak_rss_mb=peak_rss_mb(),
+                  final_concurrency=limits[-1] if limits else None)
+    print(json.dumps(result), flush=True)
+
+
+def start_server(args):
+    cmd = [sys.executable, FAKE_OSS, "--latency", str(args.latency), "--bandwidth", args.bandwidth,
+           "--error-rate", str(args.error_rate), "--reset-rate", str(args.reset_rate),
+           "--max-inflight", str(args.max_inflight), "--seed", "1"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line:
+        raise RuntimeError(f"替身服务器启动失败:\n{proc.stderr.read()}")
+    return proc, json.loads(line)["endpoint"]
+
+
+def run_workload(args, endpoint, root, name, home):
+    paths = make_files(root, name, args.scale)
+    list_file = os.path.join(root, f"{name}.txt")
+    with open(list_file, 'w', encoding='utf-8') as f:
+        f.write("\n".join(paths))
+    env = dict(os.environ, HOME=home, USERPROFILE=home)
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", list_file, "--endpoint", endpoint,
+           "--concurrency", str(args.concurrency), "--max-concurrency", str(args.max_concurrency),
+           "--part-threads", str(args.part_threads)] + (["--fixed"] if args.fixed else [])
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0 or not proc.stdout.strip():
+        raise RuntimeError(f"负载 {name} 上传失败:\n{proc.stderr}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["throughput_mbps"] = result["throughput"] / (1024 * 1024)
+    return result
+
+
+def print_table(results):
+    print(f"{'负载':<8}{'文件':>7}{'大小 MB':>10}{'用时 s':>9}{'MB/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'RSS MB':>9}{'重试':>6}{'失败':>6}{'并发':>6}")
+    for name, r in results.items():
+        ms = lambda v: f"{v * 1000:.0f}" if v is not None else "-"
+        rss = f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else "-"
+        print(f"{name:<8}{r['files']:>7}{r['bytes'] / 1024 / 1024:>10.1f}{r['wall_time']:>9.2f}"
+              f"{r['throughput_mbps']:>9.1f}{ms(r['p50']):>9}{ms(r['p95']):>9}{rss:>9}"
+              f"{r['retries']:>6}{r['errors']:>6}{r['final_concurrency'] or '-':>6}")
+
+
+def check_baseline(results, tolerance):
+    with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    failures = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if r['throughput_mbps'] < base['throughput_mbps'] * (1 - tolerance):
+            failures.append(f"{name} 吞吐量 {r['throughput_mbps']:.1f} MB/s 低于基线 {base['throughput_mbps']} MB/s "
+                            f"的 {1 - tolerance:.0%}")
+        if r['peak_rss_mb'] is not None and base.get('peak_rss_mb') and \
+                r['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            failures.append(f"{name} 峰值内存 {r['peak_rss_mb']:.0f} MB 超过基线 {base['peak_rss_mb']} MB "
+                            f"的 {1 + tolerance:.0%}")
+    return failures
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("workloads", nargs="*", metavar="WORKLOAD",
+                        help=f"要运行的负载：{', '.join(WORKLOADS)}（默认全部）")
+    parser.add_argument("--scale", type=float, default=1.0, help="按比例缩放文件数，CI 中可以用 0.1")
+    parser.add_argument("--concurrency", type=int, default=3, help="初始并发数")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="自动调整的上限")
+    parser.add_argument("--fixed", action="store_true", help="固定并发数，不自动调整")
+    parser.add_argument("--part-threads", type=int, default=4, help="每个大文件的分片并发数")
+    parser.add_argument("--latency", type=float, default=20, help="替身服务器每个请求的延迟（毫秒）")
+    parser.add_argument("--bandwidth", default="0", help="替身服务器共享带宽，例如 20M；0 不限速")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--reset-rate", type=float, default=0)
+    parser.add_argument("--max-inflight", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是表格")
+    parser.add_argument("--check", action="store_true", help="与基线比较，退化时退出码为 1")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="允许偏离基线的比例 (默认 30%%)")
+    # 子进程参数
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--endpoint", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.child:
+        return child(args)
+    unknown = [name for name in args.workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"未知负载: {', '.join(unknown)}")
+
+    names = args.workloads or list(WORKLOADS)
+    server, endpoint = start_server(args)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as home:
+            for name in names:
+                start = time.perf_counter()
+                results[name] = run_workload(args, endpoint, root, name, home)
+                if not args.json:
+                    print(f"{name} 完成，用时 {time.perf_counter() - start:.1f} 秒", file=sys.stderr)
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+    if args.update_baseline:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({name: {"throughput_mbps": round(r["throughput_mbps"], 1),
+                              "peak_rss_mb": round(r["peak_rss_mb"]) if r["peak_rss_mb"] is not None else None}
+                       for name, r in results.items()}, f, indent=4)
+            f.write("\n")
+        print(f"已更新基线: {BASELINE_FILE}")
+
+    failures = [f"{name} 有 {r['errors']} 个文件上传失败" for name, r in results.items() if r['errors']]
+    if args.check:
+        failures += check_baseline(results, args.tolerance)
+    for failure in failures:
+        print(f"退化: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""命令行上传工具，不依赖 PyQt5，与图形界面共用配置、命名、去重和链接签名逻辑。
+
+用法:
+    python src/cli.py put a.png b.png
+    python -m src.cli put ./dist -j 8 --output jsonl
+    find . -name '*.png' | python src/cli.py put -
+
+标准输出按输入顺序每个文件一行（链接或 JSON），错误信息写到标准错误。
+退出码: 0 全部成功；1 有文件上传失败；2 参数或配置错误；130 被 Ctrl+C 中断。
+"""
+import os
+import sys
+import json
+import argparse
+
+try:
+    from . import core
+except ImportError:
+    # 直接运行 python src/cli.py
+    import core
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+# CI 中常用环境变量传入密钥，优先级高于配置文件
+ENV_OVERRIDES = {
+    "OSS_ACCESS_KEY_ID": "access_key_id",
+    "OSS_ACCESS_KEY_SECRET": "access_key_secret",
+    "OSS_ENDPOINT": "endpoint",
+    "OSS_BUCKET": "bucket_name",
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="oss-uploader", description="上传文件到阿里云 OSS 并输出链接")
+    parser.add_argument("--version", action="version", version=f"%(prog)s {core.VERSION}")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    put = sub.add_parser("put", help="上传文件或文件夹")
+    put.add_argument("paths", nargs="+", metavar="PATH", help="文件或文件夹，- 表示从标准输入逐行读取路径")
+    put.add_argument("-j", "--concurrency", type=int, help="固定同时上传的文件数（默认按配置，可自动调整）")
+    put.add_argument("-o", "--output", choices=["url", "jsonl"], default="url",
+                     help="url: 每行一个链接；jsonl: 每行一个 JSON 对象")
+    put.add_argument("--include", help="文件夹中只上传匹配的文件，例如 '*.png;*.jpg'")
+    put.add_argument("--exclude", help="跳过匹配的文件和目录，例如 '.git;*.tmp'")
+    put.add_argument("--config", help="配置文件路径（默认与图形界面共用）")
+    put.add_argument("--no-dedup", action="store_true", help="不做内容去重，总是重新上传")
+    put.add_argument("--compress", choices=["gzip", "br"],
+                     help="文本类文件（日志、JSON、SVG 等）边压缩边上传并设置 Content-Encoding")
+    put.add_argument("--no-history", action="store_true", help="不写入上传历史记录")
+    put.add_argument("--stats", action="store_true", help="结束时在标准错误输出总字节、用时、吞吐量和耗时分位数")
+    return parser
+
+
+def load_config(args):
+    if args.config and not os.path.isfile(args.config):
+        raise ValueError(f"配置文件不存在: {args.config}")
+    config = core.ConfigManager.load_config(args.config)
+    for env, key in ENV_OVERRIDES.items():
+        if os.environ.get(env):
+            config[key] = os.environ[env]
+    if not config.get('access_key_id') or not config.get('bucket_name'):
+        raise ValueError("未配置 AccessKey 或 Bucket，请先在图形界面中设置，或通过 --config / OSS_* 环境变量提供")
+    if args.concurrency is not None:
+        # 显式指定时固定并发数，不再自动调整
+        config['upload_concurrency'] = args.concurrency
+        config['adaptive_concurrency'] = False
+    if args.compress:
+        config['compress_enabled'] = True
+        config['compress_encoding'] = args.compress
+    if args.no_dedup:
+        config['dedup_enabled'] = False
+    return config
+
+
+def iter_entries(paths, include, exclude):
+    """把命令行参数展开成 (文件路径, 相对目录)，- 表示从标准输入逐行读取路径"""
+    for path in paths:
+        if path == "-":
+            # 逐行读取，上游还在输出时前面的文件就可以开始上传
+            for line in sys.stdin:
+                line = line.rstrip("\r\n")
+                if line:
+                    yield from iter_entries([line], include, exclude)
+        elif os.path.exists(path):
+            yield from core.FolderScanner.iter_files([path], include=include, exclude=exclude)
+        else:
+            # 交给引擎上传时报告“文件不存在”，保证输出顺序与输入一致
+            yield path, ''
+
+
+def cmd_put(args):
+    try:
+        config = load_config(args)
+    except ValueError as e:
+        print(f"oss-uploader: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    engine = core.UploadEngine(config, journal=False, history=not args.no_history)
+    try:
+        engine.connect()
+    except Exception as e:
+        print(f"oss-uploader: 初始化失败: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    include = args.include if args.include is not None else config.get('folder_include', '')
+    exclude = args.exclude if args.exclude is not None else config.get('folder_exclude', '')
+    failures = 0
+
+    def emit(event):
+        if args.output == "jsonl":
+            record = {"path": event['path'], "ok": event['type'] == 'success'}
+            record.update({"url": event['url']} if event['type'] == 'success' else {"error": event['error']})
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+        elif event['type'] == 'success':
+            print(event['url'], flush=True)
+        else:
+            print(f"oss-uploader: 上传失败 {event['path']}: {event['error']}", file=sys.stderr, flush=True)
+
+    # 引擎按完成顺序产出结果，这里按输入顺序输出：后面先完成的等前面的
+    finished, next_index = {}, 0
+    stats = core.TransferStats()
+    events = engine.upload_many(iter_entries(args.paths, include, exclude))
+    try:
+        for event in events:
+            stats.feed(event)
+            if event['type'] not in ('success', 'error'):
+                continue
+            if event['type'] == 'error':
+                failures += 1
+                if event['index'] is None:
+                    emit(event)
+                    continue
+            finished[event['index']] = event
+            while next_index in finished:
+                emit(finished.pop(next_index))
+                next_index += 1
+    except KeyboardInterrupt:
+        # 未开始的任务不再上传，进行中的分片上传在下一个分片前停止
+        engine.stop()
+        events.close()
+        print("oss-uploader: 已中断", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    if args.stats:
+        print(f"oss-uploader: {core.TransferStats.describe_summary(stats.summary())}", file=sys.stderr)
+    return EXIT_FAILED if failures else EXIT_OK
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "put":
+        return cmd_put(args)
+    return EXIT_USAGE
+
+
+if __name__ == "__main__":
+    sys.exit(main())
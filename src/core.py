@@ -0,0 +1,2606 @@
+"""上传核心：配置、历史记录、任务日志、去重索引和上传逻辑。
+
+不依赖 PyQt5，图形界面 (main.py) 和命令行 (cli.py) 共用。
+oss2 导入较慢，只在真正需要访问 OSS 时才导入，命令行启动不受影响。
+警告和错误提示写到标准错误，命令行的标准输出只有上传结果。
+"""
+import os
+import sys
+import json
+import zlib
+import uuid
+import time
+import random
+import queue
+import heapq
+import atexit
+import sqlite3
+import hashlib
+import fnmatch
+import mimetypes
+import datetime
+import getpass
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+
+# --- 常量配置 ---
+CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".aliyun_oss_uploader_config.json")
+HISTORY_FILE = os.path.join(os.path.expanduser("~"), ".aliyun_oss_history.json")  # 旧版历史记录，仅用于迁移
+HISTORY_DB = os.path.join(os.path.expanduser("~"), ".aliyun_oss_history.db")
+JOURNAL_FILE = os.path.join(os.path.expanduser("~"), ".aliyun_oss_jobs.jsonl")
+DEDUP_FILE = os.path.join(os.path.expanduser("~"), ".aliyun_oss_dedup.jsonl")
+IMAGE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".aliyun_oss_image_cache")
+VERSION = "1.5.5"
+
+
+# --- 历史记录 ---
+class HistoryManager:
+    """上传历史存放在 SQLite (WAL 模式) 中，只追加不重写。
+
+    add_record 只把记录放进队列，由后台写入线程攒批后在一个事务里提交
+    (group commit)，上传线程不会被磁盘 IO 阻塞。首次打开数据库时会把旧版
+    JSON 历史文件迁移进来。
+
+    文件名和链接建有 FTS5 全文索引（由触发器增量维护），日期和 Bucket 建有
+    普通索引，搜索不需要读取全部记录。
+    """
+    GROUP_COMMIT_WINDOW = 0.2  # 秒，攒批等待时间
+    GROUP_COMMIT_MAX = 500  # 单个事务最多写入的记录数
+
+    _lock = threading.RLock()
+    _conn = None
+    _db_path = None
+    _fts = None  # 全文索引分词器：'trigram' / 'unicode61'，SQLite 不支持 FTS5 时为 None
+    _queue = None
+    _writer = None
+
+    @staticmethod
+    def _connect():
+        """返回数据库连接（调用方需持有 _lock）"""
+        if HistoryManager._conn is not None and HistoryManager._db_path == HISTORY_DB:
+            return HistoryManager._conn
+        HistoryManager.close()
+        conn = sqlite3.connect(HISTORY_DB, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                url TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_date ON history(date);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        columns = [row['name'] for row in conn.execute("PRAGMA table_info(history)")]
+        if 'bucket' not in columns:
+            conn.execute("ALTER TABLE history ADD COLUMN bucket TEXT NOT NULL DEFAULT ''")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_bucket ON history(bucket)")
+        HistoryManager._fts = HistoryManager._create_fts(conn)
+        HistoryManager._conn, HistoryManager._db_path = conn, HISTORY_DB
+        HistoryManager._migrate_legacy(conn)
+        return conn
+
+    @staticmethod
+    def _create_fts(conn):
+        """创建文件名/链接的全文索引，优先使用支持任意子串匹配的 trigram 分词器"""
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'history_fts'").fetchone()
+        if row:
+            return 'trigram' if 'trigram' in row['sql'] else 'unicode61'
+        for tokenizer in ('trigram', 'unicode61'):
+            try:
+                with conn:
+                    conn.execute("CREATE VIRTUAL TABLE history_fts USING fts5("
+                                 f"filename, url, content='history', content_rowid='id', tokenize='{tokenizer}')")
+                    conn.executescript("""
+                        CREATE TRIGGER history_ai AFTER INSERT ON history BEGIN
+                            INSERT INTO history_fts(rowid, filename, url) VALUES (new.id, new.filename, new.url);
+                        END;
+                        CREATE TRIGGER history_ad AFTER DELETE ON history BEGIN
+                            INSERT INTO history_fts(history_fts, rowid, filename, url)
+                            VALUES ('delete', old.id, old.filename, old.url);
+                        END;
+                    """)
+                    # 为已有记录建立索引
+                    conn.execute("INSERT INTO history_fts(history_fts) VALUES ('rebuild')")
+                return tokenizer
+            except sqlite3.OperationalError:
+                continue
+        return None
+
+    @staticmethod
+    def _load_legacy():
+        if os.path.exists(HISTORY_FILE):
+            try:
+                with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+                    return records if isinstance(records, list) else []
+            except json.JSONDecodeError:
+                # 历史记录文件损坏，返回空列表
+                return []
+            except (IOError, OSError):
+                # 文件读取错误，返回空列表
+                return []
+        return []
+
+    @staticmethod
+    def _migrate_legacy(conn):
+        """一次性把旧版 JSON 历史（新记录在前）导入数据库，导入后重命名旧文件"""
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone():
+            return
+        records = HistoryManager._load_legacy()
+        with conn:
+            conn.executemany("INSERT INTO history (date, filename, url) VALUES (?, ?, ?)",
+                             [(r.get('date', ''), r.get('filename', ''), r.get('url', ''))
+                              for r in reversed(records) if isinstance(r, dict)])
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_migrated', '1')")
+        if records:
+            try:
+                os.replace(HISTORY_FILE, HISTORY_FILE + ".migrated")
+            except (IOError, OSError):
+                pass
+
+    @staticmethod
+    def close():
+        with HistoryManager._lock:
+            if HistoryManager._conn is not None:
+                HistoryManager._conn.close()
+            HistoryManager._conn = HistoryManager._db_path = None
+
+    @staticmethod
+    def _ensure_writer():
+        with HistoryManager._lock:
+            if HistoryManager._writer is None or not HistoryManager._writer.is_alive():
+                HistoryManager._queue = queue.Queue()
+                HistoryManager._writer = threading.Thread(
+                    target=HistoryManager._writer_loop, args=(HistoryManager._queue,),
+                    name="history-writer", daemon=True)
+                HistoryManager._writer.start()
+            return HistoryManager._queue
+
+    @staticmethod
+    def _writer_loop(q):
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + HistoryManager.GROUP_COMMIT_WINDOW
+            while len(batch) < HistoryManager.GROUP_COMMIT_MAX:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0: break
+                try:
+                    batch.append(q.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                with HistoryManager._lock:
+                    conn = HistoryManager._connect()
+                    with conn:
+                        conn.executemany("INSERT INTO history (date, filename, url, bucket) VALUES (?, ?, ?, ?)",
+                                         [(r['date'], r['filename'], r['url'], r.get('bucket', ''))
+                                          for r in batch])
+            except sqlite3.Error as e:
+                print(f"历史记录写入失败: {e}", file=sys.stderr)
+            finally:
+                for _ in batch: q.task_done()
+
+    @staticmethod
+    def flush():
+        """等待队列中的记录全部提交。会阻塞调用线程，界面上的分页和搜索不调用，
+        WAL 模式下读取不受写入影响，最多看不到最近一个攒批窗口内的记录"""
+        q = HistoryManager._queue
+        if q is not None and HistoryManager._writer is not None and HistoryManager._writer.is_alive():
+            q.join()
+
+    @staticmethod
+    def load_history(limit=None):
+        """返回历史记录，新记录在前"""
+        HistoryManager.flush()
+        try:
+            with HistoryManager._lock:
+                conn = HistoryManager._connect()
+                sql = "SELECT date, filename, url FROM history ORDER BY id DESC"
+                rows = conn.execute(sql + " LIMIT ?", (limit,)) if limit else conn.execute(sql)
+                return [dict(row) for row in rows]
+        except sqlite3.Error:
+            return []
+
+    @staticmethod
+    def fetch_page(before_id=None, limit=200, text='', date_from=None, date_to=None, bucket=None):
+        """按 id 倒序分页读取（keyset 分页），before_id 为上一页最后一条的 id。
+
+        text 按空格拆成多个关键词，每个关键词都要出现在文件名或链接中；
+        date_from / date_to 为 "YYYY-MM-DD HH:MM:SS" 字符串（左闭右开）；bucket 为空表示不限。
+        """
+        try:
+            with HistoryManager._lock:
+                conn = HistoryManager._connect()
+                where, params, match_terms = [], [], []
+                for term in (text or '').split():
+                    if HistoryManager._fts == 'trigram' and len(term) >= 3:
+                        match_terms.append('"' + term.replace('"', '""') + '"')
+                    elif HistoryManager._fts == 'unicode61':
+                        match_terms.append('"' + term.replace('"', '""') + '"*')
+                    else:
+                        # trigram 索引无法匹配少于 3 个字符的关键词，退回 LIKE
+                        pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                        where.append("(h.filename LIKE ? ESCAPE '\\' OR h.url LIKE ? ESCAPE '\\')")
+                        params += [pattern, pattern]
+                if match_terms:
+                    # 以全文索引为驱动表并按 rowid 倒序扫描，命中很多时也只读取一页
+                    sql = "SELECT h.id, h.date, h.filename, h.url, h.bucket " \
+                          "FROM history_fts f JOIN history h ON h.id = f.rowid"
+                    order_key = "f.rowid"
+                    where.insert(0, "history_fts MATCH ?")
+                    params.insert(0, " AND ".join(match_terms))
+                else:
+                    sql = "SELECT h.id, h.date, h.filename, h.url, h.bucket FROM history h"
+                    order_key = "h.id"
+                if before_id is not None:
+                    where.append(f"{order_key} < ?")
+                    params.append(before_id)
+                if date_from:
+                    where.append("h.date >= ?")
+                    params.append(date_from)
+                if date_to:
+                    where.append("h.date < ?")
+                    params.append(date_to)
+                if bucket:
+                    where.append("h.bucket = ?")
+                    params.append(bucket)
+                if where:
+                    sql += " WHERE " + " AND ".join(where)
+                sql += f" ORDER BY {order_key} DESC LIMIT ?"
+                params.append(limit)
+                return [dict(row) for row in conn.execute(sql, params)]
+        except sqlite3.Error:
+            return []
+
+    @staticmethod
+    def buckets():
+        """历史记录中出现过的 Bucket 列表"""
+        try:
+            with HistoryManager._lock:
+                conn = HistoryManager._connect()
+                return [row['bucket'] for row in
+                        conn.execute("SELECT DISTINCT bucket FROM history WHERE bucket != '' ORDER BY bucket")]
+        except sqlite3.Error:
+            return []
+
+    @staticmethod
+    def add_record(filename, url, bucket=''):
+        HistoryManager._ensure_writer().put({
+            "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "filename": filename,
+            "url": url,
+            "bucket": bucket or ''
+        })
+
+    @staticmethod
+    def apply_retention(config):
+        """按配置清理过期记录：history_retention_days / history_max_records，0 表示不限制"""
+        days = int(config.get('history_retention_days', 0) or 0)
+        max_records = int(config.get('history_max_records', 0) or 0)
+        if days <= 0 and max_records <= 0:
+            return
+        HistoryManager.flush()
+        try:
+            with HistoryManager._lock:
+                conn = HistoryManager._connect()
+                with conn:
+                    if days > 0:
+                        cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+                        conn.execute("DELETE FROM history WHERE date < ?", (cutoff,))
+                    if max_records > 0:
+                        conn.execute("DELETE FROM history WHERE id <= "
+                                     "(SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)", (max_records,))
+        except sqlite3.Error as e:
+            print(f"历史记录清理失败: {e}", file=sys.stderr)
+
+
+atexit.register(HistoryManager.flush)
+
+
+# --- 上传任务日志 ---
+class JobJournal:
+    """记录上传任务状态的追加式日志，用于崩溃或关闭后断点续传。
+
+    每次状态变化只向 JOURNAL_FILE 追加一行 JSON，读取时按顺序回放：
+        add   -> 任务入队 (path, object_name, size, mtime)
+        start -> 开始上传
+        init -> 分片上传已初始化 (upload_id, part_size)
+        part -> 某个分片已上传完成
+        done / drop -> 上传完成 / 失败后放弃
+    写入中途崩溃最多只会损坏最后一行，回放时直接忽略。
+    程序崩溃不会丢失已写入的行；为了不在每个工作线程上等磁盘，只有 SYNC_OPS 立即 fsync，
+    分片记录每 PART_SYNC_EVERY 条 fsync 一次，start 跟随下一次 fsync。
+    断电时最多丢失最近几个分片的记录，续传时重新上传这几个分片。
+    """
+    SYNC_OPS = ('add', 'init', 'done', 'drop')  # 丢失后会丢任务或重复上传整个文件的记录
+    PART_SYNC_EVERY = 16
+    _lock = threading.Lock()
+    _unsynced_parts = 0
+
+    @staticmethod
+    def _append(entries):
+        with JobJournal._lock:
+            JobJournal._unsynced_parts += sum(1 for entry in entries if entry['op'] == 'part')
+            sync = JobJournal._unsynced_parts >= JobJournal.PART_SYNC_EVERY or \
+                any(entry['op'] in JobJournal.SYNC_OPS for entry in entries)
+            try:
+                with open(JOURNAL_FILE, 'a', encoding='utf-8') as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    f.flush()
+                    if sync:
+                        os.fsync(f.fileno())
+                        JobJournal._unsynced_parts = 0
+            except (IOError, OSError) as e:
+                # 日志只用于续传，写入失败不影响本次上传
+                print(f"任务日志写入失败: {e}", file=sys.stderr)
+
+    @staticmethod
+    def add_jobs(items):
+        """items: [{'path': ..., 'object_name': ...}]，写入日志并返回带 id 的任务列表"""
+        jobs = JobJournal.new_jobs(items)
+        if jobs:
+            JobJournal._append([{"op": "add", "id": j["id"], "path": j["path"], "object_name": j["object_name"],
+                                 "size": j["size"], "mtime": j["mtime"]} for j in jobs])
+        return jobs
+
+    @staticmethod
+    def new_jobs(items):
+        """只创建任务，不写日志"""
+        jobs = []
+        for item in items:
+            job = {"id": uuid.uuid4().hex, "path": item['path'], "object_name": item['object_name'],
+                   "upload_id": None, "part_size": None, "parts": []}
+            try:
+                stat = os.stat(item['path'])
+                job["size"], job["mtime"] = stat.st_size, stat.st_mtime
+            except OSError:
+                job["size"], job["mtime"] = None, None
+            jobs.append(job)
+        return jobs
+
+    @staticmethod
+    def mark(job_id, op, **fields):
+        entry = {"op": op, "id": job_id}
+        entry.update(fields)
+        JobJournal._append([entry])
+
+    @staticmethod
+    def load_pending():
+        """回放日志，返回尚未完成的任务（按入队顺序）"""
+        with JobJournal._lock:
+            return JobJournal._replay()
+
+    @staticmethod
+    def clear_if_idle():
+        """日志里没有未完成任务时删除日志文件，返回是否已删除。
+        回放和删除在同一把锁里完成，期间追加的 add 记录不会被删掉"""
+        with JobJournal._lock:
+            if JobJournal._replay():
+                return False
+            if os.path.exists(JOURNAL_FILE):
+                os.remove(JOURNAL_FILE)
+            return True
+
+    @staticmethod
+    def _replay():
+        """回放日志文件，调用方需持有 _lock"""
+        if not os.path.exists(JOURNAL_FILE):
+            return []
+        jobs = {}
+        try:
+            with open(JOURNAL_FILE, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时写了一半的行
+                        continue
+                    op, job_id = entry.get('op'), entry.get('id')
+                    if op == 'add':
+                        jobs[job_id] = {"id": job_id, "path": entry['path'], "object_name": entry['object_name'],
+                                        "size": entry.get('size'), "mtime": entry.get('mtime'),
+                                        "state": "queued", "upload_id": None, "part_size": None, "parts": []}
+                    elif job_id not in jobs:
+                        continue
+                    elif op == 'start':
+                        jobs[job_id]['state'] = "uploading"
+                    elif op == 'init':
+                        jobs[job_id].update(upload_id=entry['upload_id'], part_size=entry['part_size'], parts=[])
+                    elif op == 'part':
+                        jobs[job_id]['parts'].append(entry['part'])
+                    elif op in ('done', 'drop'):
+                        del jobs[job_id]
+        except (IOError, OSError):
+            return []
+        return list(jobs.values())
+
+    @staticmethod
+    def compact(jobs):
+        """用当前未完成任务重写日志；没有未完成任务时删除日志文件"""
+        with JobJournal._lock:
+            if not jobs:
+                if os.path.exists(JOURNAL_FILE):
+                    os.remove(JOURNAL_FILE)
+                return
+            tmp_path = JOURNAL_FILE + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for job in jobs:
+                    f.write(json.dumps({"op": "add", "id": job['id'], "path": job['path'],
+                                        "object_name": job['object_name'], "size": job.get('size'),
+                                        "mtime": job.get('mtime')}, ensure_ascii=False) + "\n")
+                    if job.get('state') == "uploading":
+                        f.write(json.dumps({"op": "start", "id": job['id']}) + "\n")
+                    if job.get('upload_id'):
+                        f.write(json.dumps({"op": "init", "id": job['id'], "upload_id": job['upload_id'],
+                                            "part_size": job['part_size']}) + "\n")
+                        for part in job.get('parts', []):
+                            f.write(json.dumps({"op": "part", "id": job['id'], "part": part}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, JOURNAL_FILE)
+
+
+# --- 内容去重索引 ---
+class DedupIndex:
+    """记录已上传文件的内容哈希，相同内容再次上传时直接复用已有对象。
+
+    两张表都只在内存中查询，变更以 JSON 行追加到 DEDUP_FILE：
+        files:   "path|size|mtime" -> md5，文件没改动时不用重新计算哈希
+        objects: "endpoint/bucket/md5" -> {object_name, size, crc64, source_size}
+    另外按 "endpoint/bucket|原文件大小" 记录出现过的大小：没有同样大小的对象时不可能重复，
+    上传前不用读一遍文件算哈希，MD5 在上传时由 HashingReader 顺带算出。
+    分片上传的文件没有整个文件的 MD5，改用 crc_digest()（由各分片 CRC64 合并得到）标识内容。
+    """
+    _lock = threading.Lock()
+    _files = None
+    _objects = None
+    _sizes = None
+
+    @staticmethod
+    def _ensure_loaded():
+        if DedupIndex._files is not None:
+            return
+        files, objects = {}, {}
+        if os.path.exists(DEDUP_FILE):
+            try:
+                with open(DEDUP_FILE, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        if entry.get('t') == 'file':
+                            files[entry['key']] = entry['md5']
+                        elif entry.get('t') == 'object':
+                            objects[entry['key']] = entry['object']
+                        elif entry.get('t') == 'forget':
+                            objects.pop(entry['key'], None)
+            except (IOError, OSError):
+                pass
+        # 删除的对象不从 sizes 中去掉，多出的大小只会让那个文件多算一次哈希
+        sizes = {DedupIndex._size_key(key.rsplit('/', 1)[0], obj) for key, obj in objects.items()}
+        DedupIndex._files, DedupIndex._objects, DedupIndex._sizes = files, objects, sizes
+
+    @staticmethod
+    def _size_key(scope, obj):
+        return f"{scope}|{obj.get('source_size', obj.get('size'))}"
+
+    @staticmethod
+    def _append(entry):
+        try:
+            with open(DEDUP_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except (IOError, OSError) as e:
+            print(f"去重索引写入失败: {e}", file=sys.stderr)
+
+    @staticmethod
+    def reset():
+        """丢弃内存中的索引，下次使用时重新从文件加载"""
+        with DedupIndex._lock:
+            DedupIndex._files = DedupIndex._objects = DedupIndex._sizes = None
+
+    @staticmethod
+    def _file_key(path, kind):
+        stat = os.stat(path)
+        key = f"{path}|{stat.st_size}|{stat.st_mtime}"
+        return (key if kind == 'md5' else f"{key}|{kind}"), stat.st_size
+
+    @staticmethod
+    def crc_digest(size, crc64):
+        return f"crc64-{size}-{crc64}"
+
+    @staticmethod
+    def file_hash(path, kind='md5'):
+        """kind 为 'md5' 或 'crc64'（分片上传的文件，见 crc_digest）"""
+        key, size = DedupIndex._file_key(path, kind)
+        with DedupIndex._lock:
+            DedupIndex._ensure_loaded()
+            digest = DedupIndex._files.get(key)
+        if digest:
+            return digest
+
+        if kind == 'crc64':
+            import oss2
+            hasher = oss2.utils.Crc64(0)
+        else:
+            hasher = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        digest = DedupIndex.crc_digest(size, hasher.crc) if kind == 'crc64' else hasher.hexdigest()
+        with DedupIndex._lock:
+            DedupIndex._files[key] = digest
+            DedupIndex._append({"t": "file", "key": key, "md5": digest})
+        return digest
+
+    @staticmethod
+    def remember_file(path, digest, kind='md5'):
+        """记下上传时顺带算出的哈希，下次 file_hash 不用再读文件"""
+        key, _ = DedupIndex._file_key(path, kind)
+        with DedupIndex._lock:
+            DedupIndex._ensure_loaded()
+            if DedupIndex._files.get(key) != digest:
+                DedupIndex._files[key] = digest
+                DedupIndex._append({"t": "file", "key": key, "md5": digest})
+
+    @staticmethod
+    def may_contain(scope, size):
+        """索引中是否有原文件为这个大小的对象；没有时一定不重复"""
+        with DedupIndex._lock:
+            DedupIndex._ensure_loaded()
+            return f"{scope}|{size}" in DedupIndex._sizes
+
+    @staticmethod
+    def lookup(scope, digest):
+        with DedupIndex._lock:
+            DedupIndex._ensure_loaded()
+            return DedupIndex._objects.get(f"{scope}/{digest}")
+
+    @staticmethod
+    def remember(scope, digest, object_name, size, crc64, source_size=None):
+        """size 是 OSS 上对象的大小；图片优化或压缩后与原文件不同时，另记 source_size"""
+        obj = {"object_name": object_name, "size": size, "crc64": None if crc64 is None else str(crc64)}
+        if source_size is not None and source_size != size:
+            obj["source_size"] = source_size
+        with DedupIndex._lock:
+            DedupIndex._ensure_loaded()
+            DedupIndex._objects[f"{scope}/{digest}"] = obj
+            DedupIndex._sizes.add(DedupIndex._size_key(scope, obj))
+            DedupIndex._append({"t": "object", "key": f"{scope}/{digest}", "object": obj})
+
+    @staticmethod
+    def forget(scope, digest):
+        with DedupIndex._lock:
+            DedupIndex._ensure_loaded()
+            if DedupIndex._objects.pop(f"{scope}/{digest}", None) is not None:
+                DedupIndex._append({"t": "forget", "key": f"{scope}/{digest}"})
+
+    @staticmethod
+    def verify(bucket, obj):
+        """HEAD 对象，确认它仍然存在且 CRC64/大小与索引一致"""
+        import oss2
+        try:
+            meta = bucket.head_object(obj['object_name'])
+        except oss2.exceptions.NotFound:
+            return False
+        if obj.get('crc64') is not None and meta.server_crc is not None:
+            return str(meta.server_crc) == obj['crc64']
+        return meta.content_length == obj.get('size')
+
+
+# --- 文件夹遍历 ---
+class FolderScanner:
+    """用 os.scandir 逐层遍历拖入的文件和文件夹，边遍历边产出待上传的文件。
+
+    产出 (文件路径, 相对目录)：相对目录从拖入的文件夹本身算起，
+    例如拖入 photos/ 时 photos/2024/a.png 的相对目录为 "photos/2024"，
+    上传时拼在 upload_path 之后，保留原有的目录结构。
+    """
+
+    @staticmethod
+    def parse_patterns(text):
+        """把 "*.png; *.jpg" 这样以分号或逗号分隔的规则拆成列表"""
+        if isinstance(text, (list, tuple)):
+            return [p.strip() for p in text if p and p.strip()]
+        return [p.strip() for p in (text or '').replace(',', ';').split(';') if p.strip()]
+
+    @staticmethod
+    def matches(name, rel_path, patterns):
+        return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel_path, p) for p in patterns)
+
+    @staticmethod
+    def iter_files(paths, include=(), exclude=(), is_running=None):
+        """include 为空时包含全部文件；exclude 同时用于跳过整个子目录"""
+        include = FolderScanner.parse_patterns(include)
+        exclude = FolderScanner.parse_patterns(exclude)
+        for path in paths:
+            if is_running and not is_running(): return
+            name = os.path.basename(os.path.normpath(path))
+            if os.path.isfile(path):
+                # 直接拖入的文件不受规则限制
+                yield path, ''
+            elif os.path.isdir(path) and not FolderScanner.matches(name, name, exclude):
+                yield from FolderScanner._walk(path, name, include, exclude, is_running)
+
+    @staticmethod
+    def _walk(root, rel_root, include, exclude, is_running):
+        # 显式栈代替递归，目录层级再深也不会超出递归深度
+        stack = [(root, rel_root)]
+        while stack:
+            if is_running and not is_running(): return
+            folder, rel_dir = stack.pop()
+            try:
+                with os.scandir(folder) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                # 无权限或网络盘断开的目录跳过，不影响其他文件
+                print(f"读取文件夹失败: {e}", file=sys.stderr)
+                continue
+            subdirs = []
+            for entry in entries:
+                rel_path = f"{rel_dir}/{entry.name}"
+                if FolderScanner.matches(entry.name, rel_path, exclude):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append((entry.path, rel_path))
+                    elif entry.is_file():
+                        if not include or FolderScanner.matches(entry.name, rel_path, include):
+                            yield entry.path, rel_dir
+                except OSError:
+                    continue
+            # 倒序入栈，保证按名称顺序遍历子目录
+            stack.extend(reversed(subdirs))
+
+
+# --- OSS 客户端缓存 ---
+class ClientCache:
+    """进程内共享的 Bucket 缓存，按 (AccessKey, Endpoint, Bucket) 区分。
+
+    每个 Bucket 带一个独立的 oss2.Session，连接池大小与上传并发匹配，
+    连续几批上传和“测试连接”复用同一批 keep-alive 连接，不用重复 DNS/TCP/TLS 握手。
+    配置中这几个字段变化时（保存或在外部修改了配置文件）清空缓存并关闭旧连接。
+    """
+    FIELDS = ("access_key_id", "access_key_secret", "endpoint", "bucket_name")
+    PREWARM_KEY = ".oss-uploader-prewarm"  # HEAD 一个不存在的对象，只为建立连接
+    PREWARM_TTL = 30  # 秒，这段时间内预热过的连接视为仍然可用
+    _lock = threading.Lock()
+    _clients = {}  # key -> {'bucket', 'session', 'pool_size', 'warmed_at'}
+
+    @staticmethod
+    def normalize_endpoint(endpoint):
+        endpoint = (endpoint or '').strip().rstrip('/')
+        return endpoint if endpoint.startswith('http') else 'https://' + endpoint
+
+    @staticmethod
+    def cache_key(config):
+        return (config['access_key_id'], config['access_key_secret'],
+                ClientCache.normalize_endpoint(config['endpoint']), config['bucket_name'])
+
+    @staticmethod
+    def pool_size(config):
+        """同时在途的请求数：文件并发数（自动调整时取上限）x 每个文件的分片并发数"""
+        files = max(1, int(ConcurrencyController.bounds(config)[2]))
+        parts = max(1, int(config.get('multipart_threads', 1)))
+        return files * parts
+
+    @staticmethod
+    def on_config_changed(config, changed):
+        # 账号、Endpoint 或 Bucket 变了，缓存的连接不再可用；下次 get_bucket 时按新配置重建
+        if changed & set(ClientCache.FIELDS):
+            ClientCache.invalidate()
+
+    @staticmethod
+    def get_bucket(config):
+        """返回共享的 Bucket；配置缺少必需字段时抛出 KeyError"""
+        import oss2
+        key = ClientCache.cache_key(config)
+        pool_size = ClientCache.pool_size(config)
+        with ClientCache._lock:
+            entry = ClientCache._clients.get(key)
+            if entry and entry['pool_size'] >= pool_size:
+                return entry['bucket']
+            session = oss2.Session(pool_size=pool_size)
+            # CRC64 由 HashingReader 在发送时计算并校验，oss2 不必再算一遍
+            bucket = oss2.Bucket(oss2.Auth(key[0], key[1]), key[2], key[3], session=session, enable_crc=False)
+            ClientCache._clients[key] = {'bucket': bucket, 'session': session, 'pool_size': pool_size}
+        if entry:
+            # 并发调大后换成更大的连接池，旧连接关闭
+            ClientCache._close(entry)
+        return bucket
+
+    @staticmethod
+    def prewarm(config, connections=None):
+        """提前完成 DNS 解析和 TCP/TLS 握手，把连接留在连接池里给接下来的上传使用。
+
+        并行发出 connections 个 HEAD 请求（默认等于文件并发数，最多 4 个）各占一条连接，
+        再在已建立的连接上发一次作对照，返回 {'connect_ms', 'saved_ms'}：
+        冷连接请求耗时的中位数，以及它比热连接多花的时间（即第一次上传节省的时间）。
+        最近预热过或配置不完整时返回 None。
+        """
+        import oss2
+        try:
+            bucket = ClientCache.get_bucket(config)
+        except (KeyError, oss2.exceptions.ClientError):
+            return None
+        key = ClientCache.cache_key(config)
+        with ClientCache._lock:
+            entry = ClientCache._clients.get(key)
+            if entry is None or time.monotonic() - entry.get('warmed_at', float('-inf')) < ClientCache.PREWARM_TTL:
+                return None
+            entry['warmed_at'] = time.monotonic()
+        if connections is None:
+            connections = min(4, max(1, int(config.get('upload_concurrency', 1))))
+
+        def head():
+            start = time.perf_counter()
+            try:
+                bucket.object_exists(ClientCache.PREWARM_KEY)
+            except oss2.exceptions.RequestError:
+                # 网络不通：没有建立连接，不算预热
+                return None
+            except oss2.exceptions.OssError:
+                # 403 等服务端错误同样说明连接已经建立
+                pass
+            return (time.perf_counter() - start) * 1000
+
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            cold = [ms for ms in pool.map(lambda _: head(), range(connections)) if ms is not None]
+        if not cold:
+            with ClientCache._lock:
+                entry.pop('warmed_at', None)
+            return None
+        warm = head()
+        connect_ms = sorted(cold)[len(cold) // 2]
+        return {'connect_ms': connect_ms, 'saved_ms': max(0.0, connect_ms - (warm or 0.0))}
+
+    @staticmethod
+    def invalidate():
+        with ClientCache._lock:
+            entries = list(ClientCache._clients.values())
+            ClientCache._clients = {}
+        for entry in entries:
+            ClientCache._close(entry)
+
+    @staticmethod
+    def _close(entry):
+        try:
+            entry['session'].session.close()
+        except Exception as e:
+            print(f"关闭 OSS 连接失败: {e}", file=sys.stderr)
+
+
+# --- 配置管理 ---
+class ConfigManager:
+    """读写配置文件。
+
+    load_config() 在进程内缓存解析结果，只有文件的 mtime 或大小变了才重新读取，
+    save_config() 写入后直接更新缓存；界面各处可以随时调用而不用反复读盘。
+    值有变化时（保存或在外部修改了文件）通知 add_listener() 注册的回调 callback(config, changed_keys)，
+    例如 ClientCache 在账号、Endpoint、Bucket 变化时丢弃旧连接，下次使用时再重建。
+    """
+    _lock = threading.Lock()
+    _cache = {}  # path -> (签名 (mtime_ns, size), 合并了默认值的配置)
+    _listeners = []
+
+    @staticmethod
+    def get_default_config():
+        return {
+            "access_key_id": "",
+            "access_key_secret": "",
+            "endpoint": "oss-cn-hangzhou.aliyuncs.com",
+            "bucket_name": "",
+            "custom_domain": "",
+            "upload_path": "uploads/{username}/{year}/{month}",
+            "use_random_name": False,
+            "auto_copy": True,
+            "url_expire_time": 2592000,
+            "upload_concurrency": 3,
+            "multipart_threshold": 100 * 1024 * 1024,
+            "multipart_part_size": 8 * 1024 * 1024,
+            "multipart_threads": 4,
+            "dedup_enabled": True,
+            "dedup_verify": True,
+            "history_retention_days": 0,
+            "history_max_records": 0,
+            "folder_include": "",
+            "folder_exclude": ".DS_Store;Thumbs.db;desktop.ini",
+            "prewarm_on_launch": True,
+            "adaptive_concurrency": True,
+            "concurrency_min": 1,
+            "concurrency_max": 16,
+            "retry_attempts": 3,
+            "retry_backoff": 0.5,
+            "retry_max_delay": 10,
+            "image_optimize": False,
+            "image_to_webp": True,
+            "image_max_dimension": 0,
+            "image_quality": 85,
+            "image_strip_exif": True,
+            "compress_enabled": False,
+            "compress_encoding": "gzip",
+            "compress_min_size": 1024,
+            "compress_include": Compressor.INCLUDE,
+            "schedule_policy": "sjf",
+            "schedule_large_size": 32 * 1024 * 1024
+        }
+
+    @staticmethod
+    def load_config(path=None):
+        """返回配置的副本，调用方可以随意修改"""
+        path = path or CONFIG_FILE
+        if os.path.exists(path):
+            signature = ConfigManager._signature(path)
+            with ConfigManager._lock:
+                cached = ConfigManager._cache.get(path)
+            if cached and signature is not None and cached[0] == signature:
+                return dict(cached[1])
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                    default = ConfigManager.get_default_config()
+                    default.update(config)
+                    if signature is not None:
+                        ConfigManager._store(path, signature, default)
+                    return dict(default)
+            except json.JSONDecodeError as e:
+                # JSON 解析错误，返回默认配置
+                print(f"配置文件解析失败: {e}", file=sys.stderr)
+                return ConfigManager.get_default_config()
+            except (IOError, OSError) as e:
+                # 文件读取错误，返回默认配置
+                print(f"配置文件读取失败: {e}", file=sys.stderr)
+                return ConfigManager.get_default_config()
+        return ConfigManager.get_default_config()
+
+    @staticmethod
+    def save_config(data):
+        previous = ConfigManager.load_config()
+        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4)
+        config = ConfigManager.get_default_config()
+        config.update(data)
+        signature = ConfigManager._signature(CONFIG_FILE)
+        if signature is None or not ConfigManager._store(CONFIG_FILE, signature, config):
+            # 之前没有缓存时也要通知，例如测试连接时已经按旧账号建立了连接
+            ConfigManager._notify(config, {k for k in set(previous) | set(config)
+                                           if previous.get(k) != config.get(k)})
+
+    @staticmethod
+    def add_listener(callback):
+        """配置变化时调用 callback(config, changed_keys)，在调用 load_config/save_config 的线程中执行"""
+        with ConfigManager._lock:
+            if callback not in ConfigManager._listeners:
+                ConfigManager._listeners.append(callback)
+
+    @staticmethod
+    def remove_listener(callback):
+        with ConfigManager._lock:
+            if callback in ConfigManager._listeners:
+                ConfigManager._listeners.remove(callback)
+
+    @staticmethod
+    def invalidate():
+        """丢弃缓存，下次 load_config 重新读取文件"""
+        with ConfigManager._lock:
+            ConfigManager._cache.clear()
+
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _store(path, signature, config):
+        """更新缓存；与之前缓存的值不同时通知监听者。返回是否有旧的缓存可比较"""
+        with ConfigManager._lock:
+            cached = ConfigManager._cache.get(path)
+            ConfigManager._cache[path] = (signature, dict(config))
+        if cached is None:
+            return False
+        previous = cached[1]
+        changed = {k for k in set(previous) | set(config) if previous.get(k) != config.get(k)}
+        if changed:
+            ConfigManager._notify(config, changed)
+        return True
+
+    @staticmethod
+    def _notify(config, changed):
+        if not changed:
+            return
+        with ConfigManager._lock:
+            listeners = list(ConfigManager._listeners)
+        for callback in listeners:
+            try:
+                callback(dict(config), changed)
+            except Exception as e:
+                print(f"配置变更通知失败: {e}", file=sys.stderr)
+
+    @staticmethod
+    def validate_clipboard_data(text):
+        try:
+            data = json.loads(text)
+            required_keys = ["access_key_id", "access_key_secret", "bucket_name"]
+            if all(k in data for k in required_keys):
+                return data
+        except:
+            pass
+        return None
+
+
+ConfigManager.add_listener(ClientCache.on_config_changed)
+
+
+# --- 失败重试 ---
+class RetryPolicy:
+    """临时性错误的重试策略：指数退避加随机抖动。
+
+    第 n 次重试前等待 uniform(0, min(max_delay, backoff * 2**(n-1))) 秒，
+    并发上传的文件同时遇到网络抖动时不会在同一时刻一起重试。
+    只重试超时、连接错误、5xx、限流和传输校验不一致；本地文件错误和 4xx 直接失败。
+    """
+
+    def __init__(self, retries=3, backoff=0.5, max_delay=10.0):
+        self.retries = max(0, int(retries))
+        self.backoff = max(0.0, float(backoff))
+        self.max_delay = max(0.0, float(max_delay))
+
+    @staticmethod
+    def from_config(config):
+        return RetryPolicy(config.get('retry_attempts', 3), config.get('retry_backoff', 0.5),
+                           config.get('retry_max_delay', 10))
+
+    @staticmethod
+    def is_retryable(error):
+        import oss2
+        if isinstance(error, (oss2.exceptions.RequestError, oss2.exceptions.InconsistentError)):
+            return True
+        return isinstance(error, oss2.exceptions.ServerError) and (
+            error.status >= 500 or error.status in (408, 429))
+
+    def delay(self, attempt):
+        """第 attempt 次重试前的等待秒数"""
+        return random.uniform(0, min(self.max_delay, self.backoff * 2 ** (attempt - 1)))
+
+    def run(self, fn, on_retry=None, is_running=None):
+        """调用 fn()，可重试的错误按策略重试，用完次数后抛出最后一次的错误。
+
+        每次重试前调用 on_retry(attempt, error, delay)；等待期间停止上传时抛出 UploadCancelled。
+        """
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except UploadCancelled:
+                raise
+            except Exception as e:
+                attempt += 1
+                if attempt > self.retries or not self.is_retryable(e):
+                    raise
+                delay = self.delay(attempt)
+                if on_retry: on_retry(attempt, e, delay)
+                deadline = time.monotonic() + delay
+                while time.monotonic() < deadline:
+                    if is_running and not is_running():
+                        raise UploadCancelled()
+                    time.sleep(min(0.1, max(0.0, deadline - time.monotonic())))
+
+
+# --- 边传边校验 ---
+class HashingReader:
+    """交给 oss2 上传的文件读取器：发送的同时计算 MD5 和 CRC64，校验和去重都不用再读一遍文件。
+
+    每次从磁盘读 1 MB，再按 oss2/requests 要求的大小（通常 8 KB）切片返回；
+    offset/size 指定文件中的一段，用于分片上传。全部读完后 md5/crc 才有值，
+    check() 与服务端返回的 CRC64 比较，做到端到端校验而不需要再 GET 一次。
+    每次重试需要新建一个。
+    """
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, path, offset=0, size=None):
+        import oss2
+        self.path = path
+        self.offset = offset
+        self.size = os.path.getsize(path) - offset if size is None else size
+        self.consumed = 0
+        self._md5 = hashlib.md5()
+        self._crc = oss2.utils.Crc64(0)
+        self._file = None
+        self._buffer = b''
+        self._pos = 0
+
+    def __len__(self):
+        # 有长度时 oss2/requests 发送 Content-Length，不使用分块传输
+        return self.size
+
+    def read(self, amt=None):
+        """返回恰好 amt 字节（到结尾时更少），oss2 按请求的长度累计偏移"""
+        remaining = self.size - self.consumed
+        amt = remaining if amt is None or amt < 0 else min(amt, remaining)
+        chunks = []
+        while amt > 0:
+            if self._pos >= len(self._buffer):
+                self._fill()
+            data = self._buffer[self._pos:self._pos + amt]
+            self._pos += len(data)
+            self.consumed += len(data)
+            amt -= len(data)
+            chunks.append(data)
+        if self.consumed >= self.size:
+            self.close()
+        return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+    def _fill(self):
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+            self._file.seek(self.offset)
+        # 整块更新摘要，比按 8 KB 小块调用快得多
+        self._buffer = self._file.read(min(self.BUFFER_SIZE, self.size - self.consumed))
+        self._pos = 0
+        if not self._buffer:
+            raise IOError(f"文件在上传过程中变短了: {self.path}")
+        self._md5.update(self._buffer)
+        self._crc.update(self._buffer)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def md5(self):
+        return self._md5.hexdigest() if self.consumed >= self.size else None
+
+    @property
+    def crc(self):
+        return self._crc.crc if self.consumed >= self.size else None
+
+    @staticmethod
+    def check(operation, crc, result):
+        """本地 CRC64 与服务端返回的不一致时抛出 InconsistentError（按临时性错误重试）；
+        任意一方没有 CRC64 时不比较"""
+        import oss2
+        server_crc = getattr(result, 'crc', None)
+        if crc is not None and isinstance(server_crc, int):
+            oss2.utils.check_crc(operation, crc, server_crc, getattr(result, 'request_id', ''))
+
+
+# --- 分片上传 ---
+class UploadCancelled(Exception):
+    """用户停止上传时抛出，已上传的分片会保留以便续传"""
+
+
+class MultipartUploader:
+    """大文件分片上传：按 part_size 切分后由多个线程并行上传各分片，
+    并把各分片的已上传字节数汇总成整个文件的进度回调。
+
+    传入 checkpoint (upload_id, part_size) 时会先向服务端列出已上传的分片，
+    只上传缺失的部分；on_init / on_part 用于把断点信息写入任务日志。
+    某个分片遇到临时性错误时按 retry_policy 只重试这一个分片，
+    每次重试调用 on_retry(part_number, attempt, error, delay)。
+    """
+
+    def __init__(self, bucket, object_name, file_path, part_size, num_threads,
+                 progress_callback=None, is_running=None,
+                 checkpoint=None, on_init=None, on_part=None,
+                 retry_policy=None, on_retry=None):
+        import oss2
+        self.bucket = bucket
+        self.object_name = object_name
+        self.file_path = file_path
+        self.size = os.path.getsize(file_path)
+        self.part_size = oss2.determine_part_size(self.size, preferred_size=part_size)
+        self.num_threads = max(1, num_threads)
+        self.progress_callback = progress_callback
+        self.is_running = is_running or (lambda: True)
+        self.checkpoint = checkpoint
+        self.on_init = on_init
+        self.on_part = on_part
+        self.retry_policy = retry_policy or RetryPolicy(0)
+        self.on_retry = on_retry
+
+        self._lock = threading.Lock()
+        self._part_consumed = {}  # part_number -> 已上传字节数
+        self._consumed = 0  # 各分片已上传字节数之和，增量维护
+        self._failed = False
+        self.crc = None  # 整个文件的 CRC64，合并分片后才有
+
+    def iter_parts(self):
+        part_number, offset = 1, 0
+        while offset < self.size:
+            size = min(self.part_size, self.size - offset)
+            yield part_number, offset, size
+            part_number += 1
+            offset += size
+
+    def restore_checkpoint(self):
+        """校验断点信息，返回 (upload_id, 已完成分片)；断点失效时返回 (None, [])"""
+        import oss2
+        if not self.checkpoint or not self.checkpoint.get('upload_id'):
+            return None, []
+        upload_id = self.checkpoint['upload_id']
+        self.part_size = self.checkpoint.get('part_size') or self.part_size
+        local_crc = {p['part_number']: p.get('crc') for p in self.checkpoint.get('parts', [])}
+        expected = {number: size for number, _, size in self.iter_parts()}
+        try:
+            finished = [oss2.models.PartInfo(p.part_number, p.etag, size=p.size,
+                                             part_crc=local_crc.get(p.part_number))
+                        for p in oss2.PartIterator(self.bucket, self.object_name, upload_id)
+                        if expected.get(p.part_number) == p.size]
+        except oss2.exceptions.NoSuchUpload:
+            return None, []
+        return upload_id, finished
+
+    def upload(self):
+        import oss2
+        upload_id, parts = self.restore_checkpoint()
+        if upload_id is None:
+            headers = oss2.utils.set_content_type(oss2.CaseInsensitiveDict(), self.file_path)
+            upload_id = self.retry(
+                0, lambda: self.bucket.init_multipart_upload(self.object_name, headers=headers)).upload_id
+            if self.on_init: self.on_init(upload_id, self.part_size)
+
+        done_numbers = set()
+        for part in parts:
+            self._part_consumed[part.part_number] = part.size
+            self._consumed += part.size
+            done_numbers.add(part.part_number)
+        todo = [p for p in self.iter_parts() if p[0] not in done_numbers]
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix="oss-part") as pool:
+            futures = [pool.submit(self.upload_part, upload_id, *part) for part in todo]
+            for future in futures:
+                try:
+                    parts.append(future.result())
+                except Exception as e:
+                    self._failed = True
+                    errors.append(e)
+
+        real_errors = [e for e in errors if not isinstance(e, UploadCancelled)]
+        if real_errors:
+            # 失败时清理服务端已上传的分片，避免产生碎片费用
+            try:
+                self.bucket.abort_multipart_upload(self.object_name, upload_id)
+            except Exception:
+                pass
+            raise real_errors[0]
+        if errors or not self.is_running():
+            # 取消时保留已上传的分片，下次启动可以续传
+            raise UploadCancelled()
+
+        parts.sort(key=lambda p: p.part_number)
+
+        def complete():
+            result = self.bucket.complete_multipart_upload(self.object_name, upload_id, parts)
+            # 各分片的 CRC64 合并成整个文件的，与服务端比较；断点中缺少分片 CRC 时为 None，不比较
+            self.crc = oss2.utils.calc_obj_crc_from_parts(parts)
+            HashingReader.check('multipart upload', self.crc, result)
+            return result
+        return self.retry(0, complete)
+
+    def retry(self, part_number, fn):
+        """按重试策略调用 fn()；part_number 为 0 表示初始化或合并分片的请求"""
+        on_retry = partial(self.on_retry, part_number) if self.on_retry else None
+        return self.retry_policy.run(fn, on_retry=on_retry, is_running=self.is_running)
+
+    def upload_part(self, upload_id, part_number, offset, size):
+        import oss2
+        if self._failed or not self.is_running():
+            raise UploadCancelled()
+
+        def send():
+            # 每次重试都从分片开头重新读取；进度按分片覆盖，不会重复累计
+            if self._failed:
+                raise UploadCancelled()
+            reader = HashingReader(self.file_path, offset, size)
+            try:
+                result = self.bucket.upload_part(
+                    self.object_name, upload_id, part_number, reader,
+                    progress_callback=partial(self._on_part_progress, part_number))
+            finally:
+                reader.close()
+            HashingReader.check('upload part', reader.crc, result)
+            return result, reader.crc
+        result, crc = self.retry(part_number, send)
+        part = oss2.models.PartInfo(part_number, result.etag, size=size,
+                                    part_crc=crc if crc is not None else result.crc)
+        if self.on_part: self.on_part(part)
+        return part
+
+    def _on_part_progress(self, part_number, consumed_bytes, total_bytes):
+        with self._lock:
+            self._consumed += consumed_bytes - self._part_consumed.get(part_number, 0)
+            self._part_consumed[part_number] = consumed_bytes
+            consumed = self._consumed
+        if self.progress_callback:
+            self.progress_callback(consumed, self.size)
+
+
+# --- 进度汇总 ---
+class ProgressAggregator:
+    """汇总各工作线程的进度回调。
+
+    oss2 每传一小块数据就回调一次，这里只记录每个文件的最新字节数并标记变化，
+    由上传线程按固定频率 drain() 一次性取出，合并成一个信号发给界面。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = {}  # index -> (consumed, total)
+        self._dirty = set()
+
+    def update(self, idx, consumed, total):
+        with self._lock:
+            if self._latest.get(idx) == (consumed, total):
+                return
+            self._latest[idx] = (consumed, total)
+            self._dirty.add(idx)
+
+    def drain(self):
+        """返回自上次 drain 以来有变化的 [(index, consumed, total)]"""
+        with self._lock:
+            changed = [(idx,) + self._latest[idx] for idx in sorted(self._dirty)]
+            self._dirty.clear()
+        return changed
+
+
+# --- 自适应并发 ---
+class ConcurrencyController:
+    """按实测吞吐量自动调整同时上传的文件数（AIMD）。
+
+    每个采样窗口统计一次总吞吐量：窗口内并发已经用满时加 1 试探，
+    下一个窗口吞吐量提高不到 GAIN 就退回原值并保持 HOLD_WINDOWS 个窗口再试；
+    出现超时、连接错误、5xx 或限流（429/503）时立即减半，同一个采样窗口内最多减一次，
+    避免一批并发请求同时失败时连续减半到下限。
+    limit 始终在 [minimum, maximum] 之间，关闭自动调整时上下限都等于初始值。
+    """
+    INTERVAL = 1.0      # 采样窗口，秒
+    GAIN = 0.05         # 吞吐量至少提高 5% 才算加并发有效
+    BACKOFF = 0.5       # 拥塞时乘以的系数
+    HOLD_WINDOWS = 5    # 试探无效后保持不变的窗口数
+    CEILING = 64        # 设置界面可选的最大并发数，工作池按它准备线程
+
+    def __init__(self, initial, minimum=None, maximum=None, clock=time.monotonic):
+        self.minimum = max(1, int(minimum or 1))
+        self.maximum = max(self.minimum, int(maximum or initial))
+        self.limit = min(self.maximum, max(self.minimum, int(initial)))
+        self.in_flight = 0
+        self.throughput = 0.0  # 最近一个窗口的总吞吐量，字节/秒
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._bytes = 0
+        self._window_start = clock()
+        self._saturated = False
+        self._baseline = None  # 加并发之前那个窗口的吞吐量
+        self._hold = 0
+        self._last_backoff = None
+        self._changed = True   # 让第一次 poll() 报告初始值
+
+    @staticmethod
+    def bounds(config, concurrency=None):
+        """从配置得到 (初始值, 下限, 上限)；旧配置没有 adaptive_concurrency 时保持固定并发。
+        concurrency 显式给出时作为初始值，上下限仍取配置"""
+        initial = max(1, int(config.get('upload_concurrency', 1)))
+        if not config.get('adaptive_concurrency', False):
+            minimum = maximum = initial
+        else:
+            minimum = max(1, int(config.get('concurrency_min', 1)))
+            maximum = max(minimum, int(config.get('concurrency_max', initial)))
+            initial = min(maximum, max(minimum, initial))
+        if concurrency is None:
+            return initial, minimum, maximum
+        initial = max(1, int(concurrency))
+        if minimum == maximum:
+            minimum = maximum = initial
+        return initial, min(minimum, initial), max(maximum, initial)
+
+    @staticmethod
+    def from_config(config, concurrency=None):
+        return ConcurrencyController(*ConcurrencyController.bounds(config, concurrency))
+
+    def set_bounds(self, initial, minimum, maximum):
+        """运行中修改了配置：当前并发限制在新的上下限之间，关闭自动调整（上下限相等）时直接取新值"""
+        with self._cond:
+            self.minimum = max(1, int(minimum))
+            self.maximum = max(self.minimum, int(maximum))
+            self._baseline = None
+            self._hold = 0
+            self._set_limit(initial if self.minimum == self.maximum else self.limit)
+            # 上限调大后 _set_limit 可能没变，也要唤醒等待名额的调度线程
+            self._cond.notify_all()
+
+    @staticmethod
+    def is_congestion(error):
+        """超时、连接错误、5xx 和限流说明链路或服务端已经饱和；其余错误（权限、文件不存在等）与并发无关"""
+        import oss2
+        if isinstance(error, oss2.exceptions.RequestError):
+            return True
+        return isinstance(error, oss2.exceptions.ServerError) and (error.status >= 500 or error.status == 429)
+
+    def acquire(self, timeout=None):
+        """占用一个并发名额；超时返回 False"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < self.limit, timeout):
+                return False
+            self.in_flight += 1
+            if self.in_flight >= self.limit:
+                self._saturated = True
+            return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def add_bytes(self, count):
+        with self._cond:
+            self._bytes += count
+
+    def on_congestion(self):
+        """乘性减：并发减半，已经在途的任务照常完成，新任务等名额降下来再开始"""
+        with self._cond:
+            now = self._clock()
+            if self._last_backoff is not None and now - self._last_backoff < self.INTERVAL:
+                return
+            self._last_backoff = now
+            self._hold = 1  # 退避后先观察一个窗口，再从新的并发数开始试探
+            self._baseline = None
+            new_limit = max(self.minimum, int(self.limit * self.BACKOFF))
+            if new_limit != self.limit:
+                self.limit = new_limit
+                self._changed = True
+            self._reset_window()
+
+    def poll(self):
+        """采样窗口结束时调整一次；limit 自上次 poll 以来有变化时返回 True"""
+        with self._cond:
+            elapsed = self._clock() - self._window_start
+            if elapsed >= self.INTERVAL:
+                self.throughput = self._bytes / elapsed
+                self._adjust(self.throughput)
+                self._reset_window()
+            changed, self._changed = self._changed, False
+            return changed
+
+    def _adjust(self, throughput):
+        if self._hold:
+            self._hold -= 1
+        elif self._baseline is not None:
+            # 上个窗口刚加过并发：有提升就继续加，否则退回并保持一段时间
+            if throughput >= self._baseline * (1 + self.GAIN) and self.limit < self.maximum:
+                self._baseline = throughput
+                self._set_limit(self.limit + 1)
+            else:
+                if throughput < self._baseline * (1 + self.GAIN):
+                    self._set_limit(self.limit - 1)
+                self._baseline = None
+                self._hold = self.HOLD_WINDOWS
+        elif self._saturated and throughput > 0 and self.limit < self.maximum:
+            # 并发没用满时瓶颈不在这里（例如还在遍历文件夹），不加
+            self._baseline = throughput
+            self._set_limit(self.limit + 1)
+
+    def _set_limit(self, value):
+        value = min(self.maximum, max(self.minimum, value))
+        if value != self.limit:
+            self.limit = value
+            self._changed = True
+            self._cond.notify_all()
+
+    def _reset_window(self):
+        self._bytes = 0
+        self._window_start = self._clock()
+        self._saturated = self.in_flight >= self.limit
+
+
+# --- 传输统计 ---
+class RateEstimator:
+    """滑动窗口速率：用最近 window 秒内的 (时间, 累计字节) 采样估算字节/秒。
+
+    没有新数据时分母随时间增长，速率自然下降，不会一直显示停顿前的速度。
+    """
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self._samples = deque()
+
+    def add(self, now, total_bytes):
+        self._samples.append((now, total_bytes))
+        self._trim(now)
+
+    def rate(self, now):
+        self._trim(now)
+        if not self._samples:
+            return 0.0
+        start_time, start_bytes = self._samples[0]
+        elapsed = now - start_time
+        return max(0.0, (self._samples[-1][1] - start_bytes) / elapsed) if elapsed > 0 else 0.0
+
+    def _trim(self, now):
+        # 保留窗口起点之前的最后一个采样，作为计算增量的基准
+        while len(self._samples) > 1 and self._samples[1][0] <= now - self.window:
+            self._samples.popleft()
+
+
+class TransferStats:
+    """一批上传的传输统计，由 UploadEngine 的事件驱动（见 feed），可在任意线程读取。
+
+    每个文件和整批各有一个滑动窗口速率，用来估算剩余时间；
+    整批结束后 summary() 给出总字节数、用时、有效吞吐量和单文件耗时的 p50/p95。
+    持续接收新文件的队列中，没有文件在传的空闲时间不计入用时。
+    续传的文件第一次进度就包含服务端已有的分片，这部分计入进度但不计入速度和吞吐量。
+    """
+    WINDOW = 5.0  # 秒，当前速度的滑动窗口
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._files = {}  # index -> {'size', 'consumed', 'baseline', 'started', 'finished', 'ok', 'rate', 'ratio'}
+        self._bytes_total = 0   # 已入队文件的总字节数（失败的文件不计入）
+        self._bytes_done = 0    # 各文件已上传字节数之和
+        self._resumed = 0       # 其中续传前服务端已有的字节数
+        self._batch_rate = RateEstimator(self.WINDOW)
+        self._saved = 0         # 图片优化和压缩少传的字节数
+        self._started = None
+        self._finished = None
+        self._running = 0       # 已开始、未结束的文件数
+        self._idle = 0.0        # 队列空闲（没有文件在传）的累计秒数
+
+    def feed(self, event):
+        """处理一个引擎事件，返回值无意义；未知事件忽略"""
+        kind = event['type']
+        if kind == 'queued':
+            self.queue(event['files'])
+        elif kind == 'started':
+            self.start(event['index'], resumed=event.get('resumed', False))
+        elif kind == 'progress':
+            self.update(event['updates'])
+        elif kind == 'optimized':
+            self.shrink(event['index'], event['original'], event['size'])
+        elif kind == 'compressed':
+            self.compressed(event['index'], event['original'], event['size'])
+        elif kind in ('success', 'error', 'cancelled') and event.get('index') is not None:
+            self.finish(event['index'], ok=kind == 'success')
+
+    def queue(self, files):
+        """files: [(index, size)]，size 未知时为 None"""
+        with self._lock:
+            for idx, size in files:
+                self._files[idx] = {'size': size or 0, 'consumed': 0, 'baseline': 0, 'started': None,
+                                    'finished': None, 'ok': None, 'rate': None, 'ratio': None}
+                self._bytes_total += size or 0
+
+    def start(self, idx, resumed=False):
+        """resumed 为 True 时，第一次进度中的字节数作为服务端已有的部分（基准）"""
+        with self._lock:
+            now = self._clock()
+            info = self._file(idx)
+            if info['started'] is None:
+                if not self._running and self._finished is not None:
+                    self._idle += now - self._finished
+                self._running += 1
+            info['started'] = now
+            if resumed:
+                info['baseline'] = None
+            info['rate'] = RateEstimator(self.WINDOW)
+            info['rate'].add(now, info['consumed'] - (info['baseline'] or 0))
+            if self._started is None:
+                self._started = now
+                self._batch_rate.add(now, self._bytes_done - self._resumed)
+
+    def update(self, updates):
+        """updates: [(index, consumed, total)]，与引擎的 progress 事件相同"""
+        with self._lock:
+            now = self._clock()
+            for idx, consumed, total in updates:
+                info = self._file(idx)
+                if total and total != info['size']:
+                    self._bytes_total += total - info['size']
+                    info['size'] = total
+                if info['baseline'] is None:
+                    info['baseline'] = consumed
+                    self._resumed += consumed
+                # 重试时已上传字节数会回落，按差值增减
+                self._bytes_done += consumed - info['consumed']
+                info['consumed'] = consumed
+                if info['rate'] is not None:
+                    info['rate'].add(now, consumed - info['baseline'])
+            self._batch_rate.add(now, self._bytes_done - self._resumed)
+
+    def shrink(self, idx, original, size):
+        """文件在上传前被替换成更小的版本（例如优化后的图片），按新大小计算进度并记下节省的字节"""
+        with self._lock:
+            info = self._file(idx)
+            self._bytes_total += size - info['size']
+            info['size'] = size
+            self._saved += max(0, original - size)
+
+    def compressed(self, idx, original, size):
+        """文件压缩后上传完成；进度按原文件计算，这里只记下压缩率和节省的字节"""
+        with self._lock:
+            self._file(idx)['ratio'] = size / original if original else None
+            self._saved += max(0, original - size)
+
+    def finish(self, idx, ok=True):
+        with self._lock:
+            now = self._clock()
+            info = self._file(idx)
+            if info['started'] is not None and info['finished'] is None:
+                self._running -= 1
+            info['finished'], info['ok'] = now, ok
+            if info['baseline'] is None:
+                # 续传时所有分片都已在服务端，没有进度回调
+                info['baseline'] = info['size'] if ok else info['consumed']
+                self._resumed += info['baseline'] - info['consumed']
+            if ok:
+                self._bytes_done += info['size'] - info['consumed']
+                info['consumed'] = info['size']
+            else:
+                # 失败或取消的文件不再计入剩余字节
+                self._bytes_total -= info['size'] - info['consumed']
+            self._finished = now
+            self._batch_rate.add(now, self._bytes_done - self._resumed)
+
+    def row(self, idx):
+        """单个文件的 {'consumed', 'total', 'speed', 'eta', 'elapsed', 'done', 'ratio'}；不在本批次中时返回 None。
+        ratio 是压缩后与原文件的大小之比，没有压缩时为 None"""
+        with self._lock:
+            info = self._files.get(idx)
+            if info is None:
+                return None
+            now = info['finished'] or self._clock()
+            elapsed = now - info['started'] if info['started'] is not None else None
+            if info['finished'] is not None:
+                speed = (info['size'] - info['baseline']) / elapsed if info['ok'] and elapsed else 0.0
+            else:
+                speed = info['rate'].rate(now) if info['rate'] else 0.0
+            remaining = info['size'] - info['consumed']
+            return {'consumed': info['consumed'], 'total': info['size'], 'speed': speed,
+                    'eta': remaining / speed if speed and info['finished'] is None else None,
+                    'elapsed': elapsed, 'done': info['finished'] is not None, 'ratio': info['ratio']}
+
+    def snapshot(self):
+        """整批的当前状态：文件数、已传/总字节、当前与平均速度、剩余时间（秒，无法估算时为 None）"""
+        with self._lock:
+            now = self._clock()
+            elapsed = self._active_time(now)
+            speed = self._batch_rate.rate(now)
+            remaining = max(0, self._bytes_total - self._bytes_done)
+            return {
+                'files': len(self._files),
+                'done': sum(1 for f in self._files.values() if f['ok']),
+                'failed': sum(1 for f in self._files.values() if f['ok'] is False),
+                'bytes_done': self._bytes_done,
+                'bytes_total': self._bytes_total,
+                'speed': speed,
+                'avg_speed': (self._bytes_done - self._resumed) / elapsed if elapsed > 0 else 0.0,
+                'eta': remaining / speed if speed else None,
+                'elapsed': elapsed,
+            }
+
+    def summary(self):
+        """整批结束后的汇总：成功/失败文件数、总字节、用时、有效吞吐量、单文件耗时 p50/p95、节省的字节数"""
+        with self._lock:
+            finished = [f for f in self._files.values() if f['ok']]
+            latencies = sorted(f['finished'] - f['started'] for f in finished if f['started'] is not None)
+            wall_time = self._active_time(self._finished) if self._finished else 0.0
+            total = sum(f['size'] for f in finished)
+            sent = total - sum(f['baseline'] for f in finished)
+            return {
+                'files': len(finished),
+                'failed': sum(1 for f in self._files.values() if f['ok'] is False),
+                'bytes': total,
+                'wall_time': wall_time,
+                'throughput': sent / wall_time if wall_time > 0 else 0.0,
+                'p50': TransferStats.percentile(latencies, 50),
+                'p95': TransferStats.percentile(latencies, 95),
+                'saved_bytes': self._saved,
+            }
+
+    def _active_time(self, now):
+        """从第一个文件开始到 now 的秒数，扣除队列空闲的时间"""
+        if self._started is None:
+            return 0.0
+        if not self._running and self._finished is not None:
+            now = min(now, self._finished)  # 当前也是空闲，到最后一个文件结束为止
+        return max(0.0, now - self._started - self._idle)
+
+    def _file(self, idx):
+        if idx not in self._files:
+            self._files[idx] = {'size': 0, 'consumed': 0, 'baseline': 0, 'started': None,
+                                'finished': None, 'ok': None, 'rate': None, 'ratio': None}
+        return self._files[idx]
+
+    @staticmethod
+    def percentile(values, pct):
+        """已排序列表的百分位数（最近秩法），空列表返回 None"""
+        if not values:
+            return None
+        rank = max(1, -(-len(values) * pct // 100))
+        return values[int(rank) - 1]
+
+    @staticmethod
+    def format_size(count):
+        for unit in ("B", "KB", "MB", "GB"):
+            if abs(count) < 1024 or unit == "GB":
+                return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+            count /= 1024
+
+    @staticmethod
+    def format_duration(seconds):
+        if seconds is None:
+            return "--"
+        if seconds < 60:
+            return f"{seconds:.1f} 秒" if seconds < 10 else f"{seconds:.0f} 秒"
+        minutes, seconds = divmod(int(seconds), 60)
+        if minutes < 60:
+            return f"{minutes} 分 {seconds} 秒"
+        return f"{minutes // 60} 小时 {minutes % 60} 分"
+
+    @staticmethod
+    def describe_summary(summary):
+        """汇总的单行中文描述，界面状态栏和命令行共用"""
+        text = (f"{summary['files']} 个文件，{TransferStats.format_size(summary['bytes'])}，"
+                f"用时 {TransferStats.format_duration(summary['wall_time'])}，"
+                f"平均 {TransferStats.format_size(summary['throughput'])}/s")
+        if summary['p50'] is not None:
+            text += (f"，单文件耗时 p50 {TransferStats.format_duration(summary['p50'])}"
+                     f" / p95 {TransferStats.format_duration(summary['p95'])}")
+        if summary.get('saved_bytes'):
+            text += f"，节省流量 {TransferStats.format_size(summary['saved_bytes'])}"
+        if summary['failed']:
+            text += f"，失败 {summary['failed']} 个"
+        return text
+
+
+# --- 图片优化 ---
+class ImageOptimizer:
+    """上传前在进程池中重新编码图片：PNG/BMP 转 WebP、限制最长边、调整质量、去掉 EXIF。
+
+    需要 Pillow（可选依赖），未安装时直接上传原图。编码在子进程中进行，能用满所有核心；
+    UploadEngine 在等待上传名额前就提交后面几个文件的编码，编码第 N+1 个文件与上传第 N 个重叠。
+    结果按 (原图内容, 规则) 的哈希缓存在 IMAGE_CACHE_DIR，重复拖入同一张图不会再编码；
+    编码后没有变小时仍然上传原图。
+    """
+    EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tif', '.tiff')
+    TO_WEBP = ('.png', '.bmp', '.tif', '.tiff')  # 无损格式转 WebP 收益最大；JPEG 保持原格式
+    CACHE_LIMIT = 500 * 1024 * 1024  # 缓存目录超过这个大小时删除最久未用的文件
+    PRUNE_EVERY = 100  # 界面的上传队列一直开着，每用掉这么多个编码结果检查一次缓存大小
+
+    _lock = threading.Lock()
+    _pool = None
+    _available = None
+    _since_prune = 0
+    _pinned = {}  # 正在上传的缓存文件 -> 引用数，清理缓存时跳过
+
+    @staticmethod
+    def available():
+        """是否安装了 Pillow；只检查一次"""
+        if ImageOptimizer._available is None:
+            # 只查找不导入，打开设置窗口时不用加载 Pillow
+            import importlib.util
+            ImageOptimizer._available = importlib.util.find_spec("PIL") is not None
+        return ImageOptimizer._available
+
+    @staticmethod
+    def rules(config):
+        """从配置得到编码规则 (转 WebP, 最长边, 质量, 去 EXIF)；未开启或没有 Pillow 时返回 None"""
+        if not config.get('image_optimize', False):
+            return None
+        if not ImageOptimizer.available():
+            print("未安装 Pillow，跳过图片优化", file=sys.stderr)
+            return None
+        return (bool(config.get('image_to_webp', True)), int(config.get('image_max_dimension', 0)),
+                int(config.get('image_quality', 85)), bool(config.get('image_strip_exif', True)))
+
+    @staticmethod
+    def wants(path):
+        return os.path.splitext(path)[1].lower() in ImageOptimizer.EXTENSIONS
+
+    @staticmethod
+    def submit(path, rules):
+        """提交到共享进程池，返回 Future，结果见 encode()"""
+        with ImageOptimizer._lock:
+            if ImageOptimizer._pool is None:
+                ImageOptimizer._pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+            pool = ImageOptimizer._pool
+        return pool.submit(ImageOptimizer.encode, path, rules, IMAGE_CACHE_DIR)
+
+    @staticmethod
+    def shutdown():
+        with ImageOptimizer._lock:
+            pool, ImageOptimizer._pool = ImageOptimizer._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def encode(path, rules, cache_dir):
+        """在子进程中运行：返回 (优化后的文件, 原大小, 新大小)，没有变小时返回 (None, 原大小, 原大小)"""
+        to_webp, max_dimension, quality, strip_exif = rules
+        original_size = os.path.getsize(path)
+        ext = os.path.splitext(path)[1].lower()
+        out_ext = '.webp' if to_webp and ext in ImageOptimizer.TO_WEBP else ext
+
+        sha = hashlib.sha256(repr(rules).encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        out = os.path.join(cache_dir, sha.hexdigest() + out_ext)
+        if os.path.exists(out):
+            os.utime(out)  # 记录最近使用时间，清理缓存时保留常用的
+            size = os.path.getsize(out)
+            return (out, original_size, size) if size < original_size else (None, original_size, original_size)
+
+        from PIL import Image, ImageOps
+        with Image.open(path) as img:
+            exif = img.info.get('exif')
+            icc = img.info.get('icc_profile')
+            # 按 EXIF 方向旋转后再去掉 EXIF，手机照片不会躺倒
+            img = ImageOps.exif_transpose(img) if strip_exif else img.copy()
+            if max_dimension and max(img.size) > max_dimension:
+                img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            options = {}
+            if out_ext == '.webp':
+                fmt, options = 'WEBP', {'quality': quality, 'method': 4}
+            elif out_ext in ('.jpg', '.jpeg'):
+                fmt, options = 'JPEG', {'quality': quality, 'optimize': True, 'progressive': True}
+                if img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+            elif out_ext == '.png':
+                fmt, options = 'PNG', {'optimize': True}
+            else:
+                fmt = Image.registered_extensions().get(out_ext) or img.format
+            if icc:
+                options['icc_profile'] = icc
+            if exif and not strip_exif:
+                options['exif'] = exif
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{out}.{os.getpid()}.tmp"
+            img.save(tmp, fmt, **options)
+        os.replace(tmp, out)
+        size = os.path.getsize(out)
+        return (out, original_size, size) if size < original_size else (None, original_size, original_size)
+
+    @staticmethod
+    def rename(object_name, optimized_path):
+        """格式变了（例如 PNG 转 WebP）时替换对象名的扩展名"""
+        new_ext = os.path.splitext(optimized_path)[1]
+        base, ext = os.path.splitext(object_name)
+        return base + new_ext if ext.lower() != new_ext else object_name
+
+    @staticmethod
+    def pin(path):
+        """标记缓存文件正在使用；文件已经不存在时返回 False"""
+        with ImageOptimizer._lock:
+            if not os.path.exists(path):
+                return False
+            ImageOptimizer._pinned[path] = ImageOptimizer._pinned.get(path, 0) + 1
+            return True
+
+    @staticmethod
+    def unpin(path):
+        with ImageOptimizer._lock:
+            count = ImageOptimizer._pinned.pop(path, 0) - 1
+            if count > 0:
+                ImageOptimizer._pinned[path] = count
+
+    @staticmethod
+    def note_encoded():
+        """用掉一个编码结果；累计 PRUNE_EVERY 个后在当前线程清理一次缓存"""
+        with ImageOptimizer._lock:
+            ImageOptimizer._since_prune += 1
+            if ImageOptimizer._since_prune < ImageOptimizer.PRUNE_EVERY:
+                return
+            ImageOptimizer._since_prune = 0
+        ImageOptimizer.prune_cache()
+
+    @staticmethod
+    def prune_cache(limit=None):
+        """缓存目录超过 limit 字节时，按最近使用时间从旧到新删除，跳过正在上传的文件"""
+        limit = ImageOptimizer.CACHE_LIMIT if limit is None else limit
+        try:
+            entries = [e for e in os.scandir(IMAGE_CACHE_DIR) if e.is_file()]
+        except OSError:
+            return
+        total = sum(e.stat().st_size for e in entries)
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            if total <= limit:
+                break
+            with ImageOptimizer._lock:
+                if entry.path in ImageOptimizer._pinned:
+                    continue
+                try:
+                    total -= entry.stat().st_size
+                    os.remove(entry.path)
+                except OSError as e:
+                    print(f"清理图片缓存失败: {e}", file=sys.stderr)
+
+
+atexit.register(ImageOptimizer.shutdown)
+
+
+# --- 传输压缩 ---
+class Compressor:
+    """日志、JSON、SVG 等文本类文件边读边压缩后上传，并设置 Content-Encoding，浏览器下载时自动解压。
+
+    按文件名规则（compress_include）或文本类 MIME 类型、并且不小于 compress_min_size 时压缩。
+    gzip 使用标准库；br 需要安装 brotli（可选依赖），未安装时退回 gzip。
+    """
+    ENCODINGS = ('gzip', 'br')
+    INCLUDE = "*.txt;*.log;*.json;*.csv;*.svg;*.html;*.htm;*.css;*.js;*.xml;*.md"
+    # 规则之外也压缩的 MIME 类型
+    TEXT_TYPES = ('application/json', 'application/xml', 'application/javascript', 'image/svg+xml')
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 5  # 默认的 11 太慢，上传时会成为瓶颈
+
+    @staticmethod
+    def rules(config):
+        """从配置得到 (编码, 文件名规则, 最小字节数)；未开启时返回 None"""
+        if not config.get('compress_enabled', False):
+            return None
+        encoding = config.get('compress_encoding', 'gzip')
+        if encoding not in Compressor.ENCODINGS:
+            encoding = 'gzip'
+        if encoding == 'br':
+            import importlib.util
+            if importlib.util.find_spec("brotli") is None:
+                print("未安装 brotli，改用 gzip 压缩", file=sys.stderr)
+                encoding = 'gzip'
+        return (encoding, FolderScanner.parse_patterns(config.get('compress_include', Compressor.INCLUDE)),
+                int(config.get('compress_min_size', 1024)))
+
+    @staticmethod
+    def choose(path, rules):
+        """这个文件要用的编码，不压缩时返回 None"""
+        encoding, patterns, min_size = rules
+        name = os.path.basename(path)
+        mime, content_encoding = mimetypes.guess_type(name)
+        if content_encoding:
+            # app.log.gz、style.css.br 已经压缩过，再压缩一遍还会设置错误的 Content-Encoding
+            return None
+        mime = mime or ''
+        if not (FolderScanner.matches(name, name, patterns) or
+                mime.startswith('text/') or mime in Compressor.TEXT_TYPES):
+            return None
+        try:
+            return encoding if os.path.getsize(path) >= min_size else None
+        except OSError:
+            return None  # 交给上传时报告文件错误
+
+    @staticmethod
+    def new(encoding):
+        """返回有 compress(bytes) 和 flush() 的流式压缩器"""
+        if encoding == 'br':
+            import brotli
+            compressor = brotli.Compressor(quality=Compressor.BROTLI_QUALITY)
+            return CompressionStream.BrotliAdapter(compressor)
+        # wbits=31: 带 gzip 头和尾
+        return zlib.compressobj(Compressor.GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+class CompressionStream:
+    """边读边压缩的可迭代对象，交给 oss2 后以分块传输 (chunked) 上传，大文件也只占一个块的内存。
+
+    进度按已读取的原文件字节回调，压缩前后的字节数在 consumed / size 中；
+    与 HashingReader 一样顺带算出原文件的 MD5 和发送内容的 CRC64。
+    重试时需要新建一个，已经迭代过的不能再用。
+    """
+    CHUNK_SIZE = 256 * 1024
+
+    class BrotliAdapter:
+        def __init__(self, compressor):
+            self._compressor = compressor
+
+        def compress(self, data):
+            return self._compressor.process(data)
+
+        def flush(self):
+            return self._compressor.finish()
+
+    def __init__(self, path, encoding, progress_callback=None):
+        import oss2
+        self.path = path
+        self.encoding = encoding
+        self.progress_callback = progress_callback
+        self.consumed = 0  # 已读取的原文件字节
+        self.size = 0      # 已产出的压缩后字节
+        self.md5 = None    # 原文件的 MD5，读完后才有
+        self.crc = None    # 压缩后内容的 CRC64，读完后才有，用于与服务端比较
+        self._crc = oss2.utils.Crc64(0)
+
+    def __iter__(self):
+        compressor = Compressor.new(self.encoding)
+        md5 = hashlib.md5()
+        total = os.path.getsize(self.path)
+        with open(self.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                self.consumed += len(chunk)
+                md5.update(chunk)
+                data = compressor.compress(chunk)
+                if data:
+                    self.size += len(data)
+                    self._crc.update(data)
+                    yield data
+                if self.progress_callback:
+                    self.progress_callback(min(self.consumed, total), total)
+        data = compressor.flush()
+        self.size += len(data)
+        self._crc.update(data)
+        self.md5, self.crc = md5.hexdigest(), self._crc.crc
+        if data:
+            yield data
+
+
+# --- 上传调度 ---
+class UploadScheduler:
+    """决定等待中的文件以什么顺序开始上传。
+
+    policy 为 'sjf' 时小文件先传（最短作业优先），'fifo' 时按加入顺序；
+    set_priority() 设置的优先级（1 优先、0 普通、-1 最后）在两种策略下都先于大小和顺序。
+    不小于 large_size 的文件走单独的大文件通道：同时最多占用 limit - 1 个名额，给新来的小文件留一个
+    （输入结束且没有小文件在等时不再保留）；
+    有小文件在等时，只有大文件通道空着才再开始一个大文件，保证大文件一直在传、不会被小文件饿死。
+    线程安全：输入线程 add()，调度线程 take()，工作线程 finish()。
+    """
+    POLICIES = ('sjf', 'fifo')
+
+    def __init__(self, policy='sjf', large_size=32 * 1024 * 1024):
+        self.policy = policy if policy in self.POLICIES else 'sjf'
+        self.large_size = large_size
+        self._cond = threading.Condition()
+        self._small = []      # 堆: [key, index, job, removed]
+        self._large = []
+        self._entries = {}    # index -> 等待中的堆元素
+        self._priority = {}   # index -> 优先级，可以在文件加入之前设置
+        self._running_large = set()
+        self._seq = 0
+        self._closed = False
+
+    @staticmethod
+    def from_config(config):
+        return UploadScheduler(*UploadScheduler.settings(config))
+
+    @staticmethod
+    def settings(config):
+        """从配置得到 (policy, large_size)"""
+        return config.get('schedule_policy', 'sjf'), int(config.get('schedule_large_size', 32 * 1024 * 1024))
+
+    def add(self, index, job):
+        with self._cond:
+            self._seq += 1
+            entry = [None, index, job, False]
+            entry[0] = self._key(index, job, self._seq)
+            heapq.heappush(self._lane(job), entry)
+            self._entries[index] = entry
+            self._cond.notify_all()
+
+    def close(self):
+        """输入结束，等待中的文件取完后 take() 返回 False"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def take(self, limit, timeout=None):
+        """取下一个可以开始的文件 (index, job)；limit 是当前的并发上限。
+        暂时没有可以开始的文件时等待，超时返回 None，输入结束且全部取完时返回 False"""
+        with self._cond:
+            end = None if timeout is None else time.monotonic() + timeout
+            while True:
+                lane = self._pick(max(1, limit))
+                if lane is not None:
+                    break
+                if self._closed and not self._entries:
+                    return False
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            entry = heapq.heappop(lane)
+            del self._entries[entry[1]]
+            if self._is_large(entry[2]):
+                self._running_large.add(entry[1])
+            return entry[1], entry[2]
+
+    def finish(self, index):
+        """文件上传结束（无论成败），大文件通道空出名额"""
+        with self._cond:
+            self._running_large.discard(index)
+            self._cond.notify_all()
+
+    def set_policy(self, policy, large_size):
+        """运行中修改了配置：等待中的文件按新的策略和大文件阈值重新排序，已经开始的不受影响"""
+        with self._cond:
+            self.policy = policy if policy in self.POLICIES else 'sjf'
+            self.large_size = large_size
+            entries = list(self._entries.values())
+            self._small, self._large = [], []
+            for entry in entries:
+                # 保留原来的加入序号，按添加顺序时仍然先来先传
+                new = [self._key(entry[1], entry[2], entry[0][2]), entry[1], entry[2], False]
+                self._lane(entry[2]).append(new)
+                self._entries[entry[1]] = new
+            heapq.heapify(self._small)
+            heapq.heapify(self._large)
+            self._cond.notify_all()
+
+    def set_priority(self, index, priority):
+        """调整还没开始的文件的优先级；已经开始或结束的返回 False"""
+        with self._cond:
+            self._priority[index] = priority
+            entry = self._entries.get(index)
+            if entry is None:
+                return False
+            # 堆元素不能原地修改，标记旧元素作废后重新加入
+            entry[3] = True
+            lane = self._lane(entry[2])
+            new = [(-priority,) + entry[0][1:], index, entry[2], False]
+            heapq.heappush(lane, new)
+            self._entries[index] = new
+            self._cond.notify_all()
+            return True
+
+    def pending(self):
+        with self._cond:
+            return len(self._entries)
+
+    def upcoming(self, count):
+        """按当前顺序预览接下来最多 count 个等待中的文件 [(index, job)]（不取出），
+        小文件在前；只遍历堆顶附近的元素，不随队列长度变慢"""
+        with self._cond:
+            result = []
+            for lane in (self._small, self._large):
+                frontier = [(lane[0][0], 0)] if lane else []
+                while frontier and len(result) < count:
+                    _, i = heapq.heappop(frontier)
+                    if not lane[i][3]:
+                        result.append((lane[i][1], lane[i][2]))
+                    for child in (2 * i + 1, 2 * i + 2):
+                        if child < len(lane):
+                            heapq.heappush(frontier, (lane[child][0], child))
+            return result
+
+    def _key(self, index, job, seq):
+        size = (job.get('size') or 0) if self.policy == 'sjf' else 0
+        return -self._priority.get(index, 0), size, seq
+
+    def _is_large(self, job):
+        return bool(self.large_size) and (job.get('size') or 0) >= self.large_size
+
+    def _lane(self, job):
+        return self._large if self._is_large(job) else self._small
+
+    def _pick(self, limit):
+        """返回下一个文件所在的堆，没有可以开始的文件时返回 None"""
+        for lane in (self._small, self._large):
+            while lane and lane[0][3]:
+                heapq.heappop(lane)
+        small = self._small[0] if self._small else None
+        large = self._large[0] if self._large else None
+        # 输入已结束且没有小文件在等时，大文件可以用满所有名额
+        cap = limit if self._closed and small is None else max(1, limit - 1)
+        if large is not None and len(self._running_large) < cap:
+            # 只有一个名额时不让大文件挡住小文件
+            if small is None or (limit > 1 and (not self._running_large or large[0][0] < small[0][0])):
+                return self._large
+        return self._small if small is not None else None
+
+
+class UploadEngine:
+    """不依赖 Qt 的上传引擎，图形界面、命令行和嵌入使用的服务共用。
+
+    单个文件: upload(job) 走 命名 -> 去重 -> 普通/分片上传 -> 生成链接 -> 记录历史；
+    批量: upload_many() 同步产出事件，aupload_many() 是对应的 asyncio 异步迭代器。
+    journal=False 时不写任务日志，命令行上传不会出现在界面的续传提示里。
+
+    事件都是 dict，按 'type' 区分：
+        queued    -> {'files': [(index, size), ...]}，一批任务创建后、开始上传前；size 未知时为 None
+        started   -> {'index', 'path', 'resumed'}，任务开始上传；resumed 表示从任务日志中的断点续传
+        progress  -> {'updates': [(index, consumed, total), ...]}，最多每 progress_interval 秒一次
+        success   -> {'index', 'path', 'url'}
+        error     -> {'index', 'path', 'error'}，读取输入本身失败时 index 为 None
+        cancelled -> {'index', 'path'}，停止后未完成的任务（保留在任务日志中）
+        optimized -> {'index', 'path', 'original', 'size'}，图片优化后上传的是更小的文件
+        compressed -> {'index', 'path', 'encoding', 'original', 'size'}，压缩上传完成，紧接着是 success
+        retry     -> {'index', 'path', 'retries', 'error', 'delay'}，临时性错误后即将重试，
+                     retries 是这个文件累计的重试次数（分片上传时包括各分片的重试）
+        concurrency -> {'limit', 'throughput'}，开始时和自动调整并发数后各一次，吞吐量单位字节/秒
+    """
+    PROGRESS_INTERVAL = 1 / 30
+    CONCURRENCY_FIELDS = ('upload_concurrency', 'adaptive_concurrency', 'concurrency_min', 'concurrency_max')
+
+    def __init__(self, config, journal=True, history=True, is_running=None):
+        self.journal = journal
+        self.history = history
+        self._is_running = is_running
+        self._stopped = threading.Event()
+        self.bucket = None
+        self.domain = ''
+        self._reconnect = False
+        self.scheduler = None
+        self.controller = None
+        self._concurrency = None  # upload_many 显式指定的并发数
+        self.apply_config(config)
+
+    def apply_config(self, config):
+        self.config = config
+        self.retry = RetryPolicy.from_config(config)
+        self.image_rules = ImageOptimizer.rules(config)
+        self.compression = Compressor.rules(config)
+        self.expire_time = int(config.get('url_expire_time', 2592000))
+
+    def reconfigure(self, config, changed):
+        """ConfigManager 的监听回调：之后开始的文件按新配置命名和上传，正在上传的不受影响；
+        账号、Endpoint 或 Bucket 变了时在下一个文件开始前重新取 Bucket。
+        并发上下限和上传顺序同样作用于进行中的批次，等待中的文件按新顺序重新排列"""
+        self.apply_config(config)
+        if changed & set(ClientCache.FIELDS):
+            self._reconnect = True
+        controller, scheduler = self.controller, self.scheduler
+        if controller and changed & set(self.CONCURRENCY_FIELDS):
+            controller.set_bounds(*ConcurrencyController.bounds(config, self._concurrency))
+            # 连接池按并发上限建立，上限调大时下一个文件开始前换成更大的连接池
+            self._reconnect = True
+        if scheduler and changed & {'schedule_policy', 'schedule_large_size'}:
+            scheduler.set_policy(*UploadScheduler.settings(config))
+
+    def is_running(self):
+        return not self._stopped.is_set() and (self._is_running is None or self._is_running())
+
+    def stop(self):
+        """不再开始新任务，进行中的分片上传在下一个分片前停止"""
+        self._stopped.set()
+
+    def set_priority(self, index, priority):
+        """调整当前批次中还没开始的文件的优先级（1 优先、0 普通、-1 最后），可在任意线程调用；
+        文件已经开始上传或没有进行中的批次时返回 False"""
+        scheduler = self.scheduler
+        return scheduler.set_priority(index, priority) if scheduler else False
+
+    def connect(self):
+        """取共享的 Bucket 并确定链接域名；配置缺失时抛出 KeyError，oss2 初始化失败时抛出 OssError"""
+        self.bucket = ClientCache.get_bucket(self.config)
+
+        domain = (self.config.get('custom_domain') or '').strip()
+        if domain:
+            if not domain.startswith('http'): domain = 'https://' + domain
+            if domain.endswith('/'): domain = domain[:-1]
+        else:
+            # 如果没有自定义域名，使用默认 Endpoint
+            clean_endpoint = self.config['endpoint'].replace('http://', '').replace('https://', '')
+            domain = f"https://{self.config['bucket_name']}.{clean_endpoint}"
+        self.domain = domain
+        return self.bucket
+
+    def get_object_name(self, original_path, rel_dir=''):
+        filename = os.path.basename(original_path)
+        ext = os.path.splitext(filename)[1]
+
+        if self.config.get('use_random_name'):
+            final_name = f"{uuid.uuid4().hex}{ext}"
+        else:
+            final_name = filename
+
+        path_pattern = self.config.get('upload_path', '') or ''
+        now = datetime.datetime.now()
+        username = getpass.getuser()
+
+        folder = path_pattern.replace("{username}", username) \
+            .replace("{year}", now.strftime("%Y")) \
+            .replace("{month}", now.strftime("%m")) \
+            .replace("{day}", now.strftime("%d"))
+        # 从文件夹上传时保留相对目录结构
+        if rel_dir:
+            folder = f"{folder.strip('/')}/{rel_dir.replace(os.sep, '/').strip('/')}"
+        folder = folder.strip('/')
+        if folder: return f"{folder}/{final_name}"
+        return final_name
+
+    def create_jobs(self, entries):
+        """[(path, rel_dir)] -> 任务列表，开启任务日志时同时写入日志"""
+        items = [{'path': p, 'object_name': self.get_object_name(p, rel_dir)} for p, rel_dir in entries]
+        if self.journal:
+            return JobJournal.add_jobs(items)
+        return JobJournal.new_jobs(items)
+
+    def mark(self, job, op, **fields):
+        if self.journal:
+            JobJournal.mark(job['id'], op, **fields)
+
+    def upload(self, job, progress_callback=None, retry_callback=None):
+        """上传单个任务，返回链接。停止时抛出 UploadCancelled（任务保留在日志中），
+        重试用完后把任务标记为放弃并抛出最后一次的错误。
+
+        每次重试前调用 retry_callback(error, delay, part_number)，普通上传时 part_number 为 0。
+        """
+        if not self.is_running():
+            raise UploadCancelled()
+        file_path = job['path']
+        try:
+            object_name = job['object_name']
+            self.mark(job, 'start')
+
+            # 内容去重：相同内容已经在当前 Bucket 中时直接复用已有对象。
+            # 索引里没有同样大小的对象时不可能重复，跳过上传前的哈希，改用上传时顺带算出的 MD5；
+            # 分片上传的文件用各分片 CRC64 合并出的整个文件的 CRC64
+            dedup = self.config.get('dedup_enabled', False)
+            size = os.path.getsize(file_path)
+            kind = 'crc64' if self.is_multipart(size) else 'md5'
+            digest = DedupIndex.file_hash(file_path, kind) \
+                if dedup and DedupIndex.may_contain(self.dedup_scope(), size) else None
+            duplicate = self.find_duplicate(digest) if digest else None
+            if duplicate:
+                object_name = duplicate['object_name']
+                if progress_callback: progress_callback(size, size)
+            else:
+                result = self.transfer_file(job, progress_callback, retry_callback)
+                if dedup and not digest:
+                    if job.get('md5'):
+                        digest = job['md5']
+                        DedupIndex.remember_file(file_path, digest)
+                    elif job.get('crc64') is not None:
+                        digest = DedupIndex.crc_digest(size, job['crc64'])
+                        DedupIndex.remember_file(file_path, digest, 'crc64')
+                # 上传的不是原文件（优化后的图片）或断点中缺少分片 CRC 时没有原文件的哈希，
+                # 不为了建索引再读一遍文件
+                if dedup and digest:
+                    # 索引记录 OSS 上对象的大小，优化或压缩后与本地文件不同
+                    stored = job['compression']['size'] if job.get('compression') else \
+                        os.path.getsize(job.get('source') or file_path)
+                    DedupIndex.remember(self.dedup_scope(), digest, object_name,
+                                        stored, getattr(result, 'crc', None), source_size=size)
+
+            url = self.build_url(object_name)
+            self.mark(job, 'done')
+            if self.history:
+                HistoryManager.add_record(os.path.basename(file_path), url, self.config.get('bucket_name', ''))
+            return url
+        except UploadCancelled:
+            raise
+        except Exception:
+            self.mark(job, 'drop')
+            raise
+
+    def upload_many(self, items, concurrency=None, progress_interval=None, first_index=0):
+        """批量上传，按完成顺序产出事件（见类说明）；需要先调用 connect()。
+
+        items 可以是任意（可能阻塞的）可迭代对象，元素为路径、(路径, 相对目录)、
+        从任务日志恢复的任务 dict，或由它们组成的 list（同一批只写一次任务日志）。
+        按元素出现的顺序从 first_index 开始编号。输入在后台线程中读取，
+        等待新文件时进度照常产出；提前结束迭代会停止引擎。
+        已读到的文件按 UploadScheduler 的策略（配置 schedule_policy）决定开始顺序。
+        """
+        # 未配置并发数时保持逐个上传的行为
+        controller = ConcurrencyController.from_config(self.config, concurrency)
+        self.controller, self._concurrency = controller, concurrency
+        interval = self.PROGRESS_INTERVAL if progress_interval is None else progress_interval
+        events = queue.Queue()
+        progress = ProgressAggregator()
+        self.scheduler = UploadScheduler.from_config(self.config)
+        feeder = threading.Thread(target=self._feed, args=(items, controller, events, progress, first_index),
+                                  name="oss-upload-feeder", daemon=True)
+        feeder.start()
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=interval)
+                except queue.Empty:
+                    event = None
+                # 先发出累积的进度，保证结果事件之后不会再收到同一文件的旧进度
+                changed = progress.drain()
+                if changed:
+                    yield {'type': 'progress', 'updates': changed}
+                if controller.poll():
+                    yield {'type': 'concurrency', 'limit': controller.limit,
+                           'throughput': controller.throughput}
+                if event is None:
+                    continue
+                if event['type'] == 'finished':
+                    return
+                yield event
+        finally:
+            if feeder.is_alive():
+                self.stop()
+                feeder.join()
+
+    def _feed(self, items, controller, events, progress, first_index=0):
+        """后台读取输入、创建任务并交给调度器，按调度顺序提交到有界工作池，全部完成后放入 finished"""
+        scheduler = self.scheduler
+
+        def read():
+            # 输入可能阻塞（标准输入、边遍历边追加的文件夹），单独的线程读取，不耽误已有文件开始上传
+            index = first_index
+            try:
+                for item in items:
+                    jobs = self.jobs_for(item)
+                    if jobs:
+                        events.put({'type': 'queued',
+                                    'files': [(index + i, job.get('size')) for i, job in enumerate(jobs)]})
+                    for job in jobs:
+                        scheduler.add(index, job)
+                        index += 1
+                    if not self.is_running(): break
+                    prefetch()
+            except Exception as e:
+                # 读取输入失败（例如遍历文件夹出错），已读到的任务照常完成
+                events.put({'type': 'error', 'index': None, 'path': '', 'error': f"读取待上传文件失败: {e}"})
+            finally:
+                scheduler.close()
+
+        def run(idx, job, encoding=None):
+            # 续传的任务第一次回调就包含之前已传完的分片，从那里开始统计本次实际发送的字节
+            sent = [None if job.get('upload_id') else 0]
+
+            def percentage(consumed_bytes, total_bytes):
+                if total_bytes:
+                    progress.update(idx, consumed_bytes, total_bytes)
+                    if sent[0] is not None and consumed_bytes > sent[0]:
+                        controller.add_bytes(consumed_bytes - sent[0])
+                    if sent[0] is None or consumed_bytes > sent[0]:
+                        sent[0] = consumed_bytes
+            retries = [0]
+
+            def retried(error, delay, part_number):
+                retries[0] += 1
+                if ConcurrencyController.is_congestion(error):
+                    controller.on_congestion()
+                message = f"分片 {part_number}: {error}" if part_number else str(error)
+                events.put({'type': 'retry', 'index': idx, 'path': job['path'], 'retries': retries[0],
+                            'error': message, 'delay': delay})
+            try:
+                events.put({'type': 'started', 'index': idx, 'path': job['path'], 'resumed': bool(job.get('upload_id'))})
+                if self._reconnect:
+                    self._reconnect = False
+                    self.connect()
+                if encoding is not None:
+                    job = self.use_optimized(idx, job, encoding, events)
+                url = self.upload(job, percentage, retried)
+                if job.get('compression'):
+                    events.put({'type': 'compressed', 'index': idx, 'path': job['path'], **job['compression']})
+                events.put({'type': 'success', 'index': idx, 'path': job['path'], 'url': url})
+            except UploadCancelled:
+                events.put({'type': 'cancelled', 'index': idx, 'path': job['path']})
+            except Exception as e:
+                if ConcurrencyController.is_congestion(e):
+                    controller.on_congestion()
+                events.put({'type': 'error', 'index': idx, 'path': job['path'], 'error': str(e)})
+            finally:
+                if job.get('source'):
+                    ImageOptimizer.unpin(job['source'])
+                scheduler.finish(idx)
+                controller.release()
+
+        # 图片优化流水线：新文件加入和每开始一个文件时，把调度顺序上接下来的几张图提交给进程池，
+        # 编码与等待名额、上传重叠。运行中可能修改图片优化设置，每次都按当前的规则，
+        # 按旧规则提交的编码作废
+        encodings = {}  # index -> (规则, Future)
+        encodings_lock = threading.Lock()
+        submitted = [False]
+
+        def prefetch(current=None):
+            """返回 current (index, job) 的编码 Future，不需要优化时返回 None"""
+            rules = self.image_rules
+            lookahead = 2 * (os.cpu_count() or 1) if rules else 0
+            with encodings_lock:
+                for upcoming, job in ([current] if current and rules else []) + scheduler.upcoming(lookahead):
+                    entry = encodings.get(upcoming)
+                    if (entry is None or entry[0] != rules) and ImageOptimizer.wants(job['path']):
+                        if entry is not None:
+                            entry[1].cancel()
+                        encodings[upcoming] = (rules, ImageOptimizer.submit(job['path'], rules))
+                        submitted[0] = True
+                entry = encodings.pop(current[0], None) if current else None
+                if entry is not None and entry[0] != rules:
+                    entry[1].cancel()
+                    return None
+                return entry and entry[1]
+
+        reader = threading.Thread(target=read, name="oss-upload-reader", daemon=True)
+        reader.start()
+        try:
+            # 有界工作池：同时在途的任务不超过 controller.limit 个（线程按需创建，运行中调大上限也够用），
+            # 有空位时才向调度器取下一个文件，这样 stop() 之后不会再有新文件开始上传
+            workers = max(controller.maximum, ConcurrencyController.CEILING)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="oss-upload") as pool:
+                while self.is_running():
+                    if not controller.acquire(timeout=0.1):
+                        continue
+                    taken = scheduler.take(controller.limit, timeout=0.1)
+                    if not taken:
+                        controller.release()
+                        if taken is False: break
+                        continue
+                    pool.submit(run, *taken, prefetch(taken))
+            # 停止后不等待可能阻塞的输入，读取线程随后自行结束
+            if self.is_running():
+                reader.join()
+        finally:
+            with encodings_lock:
+                for _, future in encodings.values():
+                    future.cancel()
+            if submitted[0]:
+                ImageOptimizer.prune_cache()
+            events.put({'type': 'finished'})
+
+    def use_optimized(self, idx, job, encoding, events):
+        """等待这个文件的编码结果；变小了就改为上传优化后的文件，失败或没变小时上传原图"""
+        try:
+            optimized, original_size, size = encoding.result()
+        except Exception as e:
+            print(f"图片优化失败，上传原图: {e}", file=sys.stderr)
+            return job
+        # 上传完成前不让清理缓存删掉它（见 run 中的 unpin）
+        if optimized is not None and not ImageOptimizer.pin(optimized):
+            optimized = None  # 已经被其他线程清理缓存时删除，上传原图
+        ImageOptimizer.note_encoded()
+        if optimized is None:
+            return job
+        events.put({'type': 'optimized', 'index': idx, 'path': job['path'],
+                    'original': original_size, 'size': size})
+        return dict(job, source=optimized, object_name=ImageOptimizer.rename(job['object_name'], optimized))
+
+    def jobs_for(self, item):
+        """把 upload_many 的一个输入元素转换成任务列表（同一批中续传任务排在新文件前面）"""
+        batch = item if isinstance(item, list) else [item]
+        resumed = [i for i in batch if isinstance(i, dict)]
+        entries = [i if isinstance(i, tuple) else (i, '') for i in batch if not isinstance(i, dict)]
+        return resumed + self.create_jobs(entries)
+
+    async def aupload_many(self, items, concurrency=None, progress_interval=None):
+        """upload_many 的 asyncio 版本：
+
+            async for event in engine.aupload_many(paths):
+                ...
+
+        上传在后台线程中进行，事件通过 call_soon_threadsafe 送回事件循环，不阻塞循环。
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        done = object()
+
+        def pump():
+            try:
+                for event in self.upload_many(items, concurrency, progress_interval):
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, done)
+
+        worker = threading.Thread(target=pump, name="oss-upload-async", daemon=True)
+        worker.start()
+        try:
+            while True:
+                event = await events.get()
+                if event is done:
+                    return
+                yield event
+        finally:
+            if worker.is_alive():
+                # 调用方提前退出或任务被取消
+                self.stop()
+                await loop.run_in_executor(None, worker.join)
+
+    def is_multipart(self, size):
+        threshold = int(self.config.get('multipart_threshold', 100 * 1024 * 1024))
+        return threshold > 0 and size >= threshold
+
+    def transfer_file(self, job, progress_callback, retry_callback=None):
+        """把文件内容传到 OSS，返回 oss2 的上传结果；分片上传只重试失败的分片。
+        job 中有 source（例如优化后的图片）时上传它的内容"""
+        file_path, object_name = job.get('source') or job['path'], job['object_name']
+        multipart = self.is_multipart(os.path.getsize(file_path))
+        # 压缩后的大小事先未知，只能一次 PUT 传完；达到分片阈值的文件不压缩，保留分片并行、续传和单片重试
+        encoding = Compressor.choose(file_path, self.compression) if self.compression and not multipart else None
+        if encoding:
+            return self.put_compressed(job, file_path, encoding, progress_callback, retry_callback)
+        if multipart:
+            # 大文件走分片上传，各分片并行；文件未改动时从日志中的断点续传
+            stat = os.stat(file_path)
+            unchanged = (job.get('size'), job.get('mtime')) == (stat.st_size, stat.st_mtime)
+            uploader = MultipartUploader(
+                self.bucket, object_name, file_path,
+                part_size=int(self.config.get('multipart_part_size', 8 * 1024 * 1024)),
+                num_threads=int(self.config.get('multipart_threads', 4)),
+                progress_callback=progress_callback,
+                is_running=self.is_running,
+                checkpoint=job if unchanged else None,
+                on_init=lambda upload_id, part_size: self.mark(
+                    job, 'init', upload_id=upload_id, part_size=part_size),
+                on_part=lambda part: self.mark(
+                    job, 'part', part={'part_number': part.part_number, 'etag': part.etag,
+                                       'size': part.size, 'crc': part.part_crc}),
+                retry_policy=self.retry,
+                on_retry=retry_callback and (
+                    lambda part_number, attempt, error, delay: retry_callback(error, delay, part_number)))
+            result = uploader.upload()
+            if file_path == job['path']:
+                job['crc64'] = uploader.crc
+            return result
+        import oss2
+        # 与 put_object_from_file 一样按本地文件名设置 Content-Type
+        headers = oss2.utils.set_content_type(oss2.CaseInsensitiveDict(), file_path)
+
+        def put():
+            # 单次读取：发送的同时算出 MD5（去重用）和 CRC64（与服务端比较）
+            reader = HashingReader(file_path)
+            try:
+                result = self.bucket.put_object(object_name, reader, headers=headers,
+                                                progress_callback=progress_callback)
+            finally:
+                reader.close()
+            HashingReader.check('put object', reader.crc, result)
+            if file_path == job['path']:
+                job['md5'] = reader.md5
+            return result
+        return self.retry.run(
+            put, on_retry=retry_callback and (lambda attempt, error, delay: retry_callback(error, delay, 0)),
+            is_running=self.is_running)
+
+    def put_compressed(self, job, file_path, encoding, progress_callback, retry_callback=None):
+        """边压缩边上传，用一次分块传输的 PUT（压缩后的大小事先未知，无法分片，只用于分片阈值以下的文件）；
+        压缩前后的字节数记在 job['compression']"""
+        streams = []
+
+        def put():
+            # 每次重试重新从头读取和压缩
+            streams.append(CompressionStream(file_path, encoding, progress_callback))
+            result = self.bucket.put_object(object_name, streams[-1], headers={'Content-Encoding': encoding})
+            HashingReader.check('put object', streams[-1].crc, result)
+            return result
+        object_name = job['object_name']
+        result = self.retry.run(
+            put, on_retry=retry_callback and (lambda attempt, error, delay: retry_callback(error, delay, 0)),
+            is_running=self.is_running)
+        stream = streams[-1]
+        job['compression'] = {'encoding': encoding, 'original': stream.consumed, 'size': stream.size}
+        if file_path == job['path']:
+            job['md5'] = stream.md5
+        return result
+
+    def dedup_scope(self):
+        endpoint = self.config['endpoint'].replace('http://', '').replace('https://', '').strip('/')
+        return f"{endpoint}/{self.config['bucket_name']}"
+
+    def find_duplicate(self, digest):
+        """在去重索引中查找相同内容的已上传对象，开启校验时用 HEAD 确认索引没有过期"""
+        import oss2
+        scope = self.dedup_scope()
+        obj = DedupIndex.lookup(scope, digest)
+        if not obj:
+            return None
+        if not self.config.get('dedup_verify', True):
+            return obj
+        try:
+            if DedupIndex.verify(self.bucket, obj):
+                return obj
+        except oss2.exceptions.OssError:
+            # 网络等原因无法校验时按未命中处理，但保留索引
+            return None
+        # 对象已被删除或内容已变化，索引过期
+        DedupIndex.forget(scope, digest)
+        return None
+
+    def build_url(self, object_name):
+        # 生成链接
+        if self.expire_time > 0:
+            # == 私有模式：生成签名链接 ==
+            signed_url = self.bucket.sign_url('GET', object_name, self.expire_time, slash_safe=True)
+
+            # 如果配置了自定义域名，我们需要替换掉官方签名的 Host 部分
+            if (self.config.get('custom_domain') or '').strip():
+                if '?' in signed_url:
+                    query_params = signed_url.split('?')[1]
+                    return f"{self.domain}/{object_name}?{query_params}"
+            return signed_url
+        # == 公开模式：直接拼接 ==
+        return f"{self.domain}/{object_name}"
@@ -1,26 +1,29 @@
 import sys
 import os
-import json
-import uuid
-from functools import partial
+import time
+import queue
+import threading
+import multiprocessing
 from urllib.parse import quote
 
-import oss2
 import datetime
-import getpass
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QLabel, QPushButton, QDialog, QLineEdit, QFormLayout,
                              QMessageBox, QFileDialog, QComboBox, QCheckBox,
-                             QTabWidget, QGroupBox, QHBoxLayout, QTableWidget,
-                             QTableWidgetItem, QHeaderView, QAbstractItemView,
-                             QProgressBar, QMenu, QAction, QStyle, QSpinBox, QFrame)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QUrl
-from PyQt5.QtGui import QFont, QIcon, QDesktopServices, QCursor, QColor
-
-# --- 常量配置 ---
-CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".aliyun_oss_uploader_config.json")
-HISTORY_FILE = os.path.join(os.path.expanduser("~"), ".aliyun_oss_history.json")
-VERSION = "1.5.5"
+                             QTabWidget, QGroupBox, QHBoxLayout, QHeaderView,
+                             QAbstractItemView, QMenu, QAction, QStyle, QSpinBox, QFrame,
+                             QTableView, QStyledItemDelegate)
+from PyQt5.QtCore import (Qt, QThread, pyqtSignal, QTimer, QUrl, QAbstractTableModel,
+                          QModelIndex, QEvent, QRect)
+from PyQt5.QtGui import QFont, QIcon, QDesktopServices, QCursor, QColor, QPainter, QPen
+
+try:
+    from .core import (VERSION, HistoryManager, JobJournal, FolderScanner, ConfigManager,
+                       ClientCache, UploadEngine, TransferStats, ImageOptimizer)
+except ImportError:
+    # 直接运行 python src/main.py 或打包后没有上层包
+    from core import (VERSION, HistoryManager, JobJournal, FolderScanner, ConfigManager,
+                      ClientCache, UploadEngine, TransferStats, ImageOptimizer)
 
 STYLESHEET = """
 /* === 全局基础设置 === */
@@ -108,21 +111,6 @@ QSpinBox {
     background: #FFFFFF;
     selection-background-color: #409EFF;
 }
-/* === 表格内的按钮 (历史记录/操作列) === */
-QTableWidget QPushButton {
-    background-color: #FFFFFF;
-    border: 1px solid #DCDFE6;
-    color: #606266;
-    padding: 4px 8px; /* 减小内边距 */
-    font-size: 12px;  /* 减小字号 */
-    border-radius: 4px;
-    min-height: 20px;
-}
-QTableWidget QPushButton:hover {
-    border-color: #409EFF;
-    color: #409EFF;
-}
-
 /* === 拖拽区 === */
 QLabel#DropArea {
     border: 2px dashed #DCDFE6; border-radius: 12px; background-color: #FFFFFF;
@@ -172,200 +160,194 @@ ALIYUN_ENDPOINTS = [
 ]
 
 
-# --- 历史记录 ---
-class HistoryManager:
-    @staticmethod
-    def load_history():
-        if os.path.exists(HISTORY_FILE):
-            try:
-                with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                # 历史记录文件损坏，返回空列表
-                return []
-            except (IOError, OSError):
-                # 文件读取错误，返回空列表
-                return []
-        return []
-
-    @staticmethod
-    def add_record(filename, url):
-        records = HistoryManager.load_history()
-        new_record = {
-            "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "filename": filename,
-            "url": url
-        }
-        records.insert(0, new_record)
-        if len(records) > 500: records = records[:500]
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(records, f, indent=4, ensure_ascii=False)
-
-
-# --- 配置管理 ---
-class ConfigManager:
-    @staticmethod
-    def get_default_config():
-        return {
-            "access_key_id": "",
-            "access_key_secret": "",
-            "endpoint": "oss-cn-hangzhou.aliyuncs.com",
-            "bucket_name": "",
-            "custom_domain": "",
-            "upload_path": "uploads/{username}/{year}/{month}",
-            "use_random_name": False,
-            "auto_copy": True,
-            "url_expire_time": 2592000
-        }
-
-    @staticmethod
-    def load_config():
-        if os.path.exists(CONFIG_FILE):
-            try:
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    default = ConfigManager.get_default_config()
-                    default.update(config)
-                    return default
-            except json.JSONDecodeError as e:
-                # JSON 解析错误，返回默认配置
-                print(f"配置文件解析失败: {e}")
-                return ConfigManager.get_default_config()
-            except (IOError, OSError) as e:
-                # 文件读取错误，返回默认配置
-                print(f"配置文件读取失败: {e}")
-                return ConfigManager.get_default_config()
-        return ConfigManager.get_default_config()
-
-    @staticmethod
-    def save_config(data):
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
-
-    @staticmethod
-    def validate_clipboard_data(text):
-        try:
-            data = json.loads(text)
-            required_keys = ["access_key_id", "access_key_secret", "bucket_name"]
-            if all(k in data for k in required_keys):
-                return data
-        except:
-            pass
-        return None
-
-
 # --- 批量上传线程 ---
 class BatchUploadThread(QThread):
+    """界面用的上传线程：把文件交给 UploadEngine，再把引擎事件转成 Qt 信号。
+
+    streaming=True 时是常驻的上传队列：工作线程一直保留，随时可以通过 add_files() 追加文件，
+    队列中的文件都处理完时发出 idle_signal，调用 finish_input() 后线程才结束。
+    """
+    PROGRESS_INTERVAL = 1 / 30  # 秒，进度信号最多每帧发送一次
+
     # index: 列表中的索引
-    progress_signal = pyqtSignal(int, int)  # index, percent
+    progress_signal = pyqtSignal(int, int)  # index, percent（只在整数百分比变化时发送）
+    progress_batch_signal = pyqtSignal(list)  # [(index, consumed_bytes, total_bytes), ...]
     success_signal = pyqtSignal(int, str, str)  # index, filename, url
     error_signal = pyqtSignal(int, str)  # index, error_msg
+    retry_signal = pyqtSignal(int, int, str)  # index, 累计重试次数, 触发重试的错误
+    concurrency_signal = pyqtSignal(int, float)  # 当前并发数, 最近的总吞吐量（字节/秒）
+    idle_signal = pyqtSignal()  # 已追加的文件都处理完了，线程继续等待新文件
     all_finished_signal = pyqtSignal()
 
-    def __init__(self, file_paths, config):
+    def __init__(self, file_paths, config, jobs=None, streaming=False, stats=None, first_index=0):
         super().__init__()
         self.file_paths = file_paths
         self.config = config
+        # jobs: 从任务日志恢复的未完成任务，为 None 时在 run() 中为 file_paths 新建
+        self.jobs = jobs
         self.is_running = True
-
-    def get_object_name(self, original_path):
-        filename = os.path.basename(original_path)
-        ext = os.path.splitext(filename)[1]
-
-        if self.config.get('use_random_name'):
-            final_name = f"{uuid.uuid4().hex}{ext}"
-        else:
-            final_name = filename
-
-        path_pattern = self.config.get('upload_path', '')
-        now = datetime.datetime.now()
-        username = getpass.getuser()
-
-        folder = path_pattern.replace("{username}", username) \
-            .replace("{year}", now.strftime("%Y")) \
-            .replace("{month}", now.strftime("%m")) \
-            .replace("{day}", now.strftime("%d"))
-        folder = folder.strip('/')
-        if folder: return f"{folder}/{final_name}"
-        return final_name
+        self.engine = UploadEngine(config, is_running=lambda: self.is_running)
+        # 传输统计在本线程中更新，界面定时读取
+        self.stats = stats or TransferStats()
+        self._last_percent = {}
+        # 第一个文件的编号；队列中途重建线程时接着列表已有的行编号
+        self.first_index = first_index
+        # 待上传文件的收件箱：每项是一批 [(path, rel_dir)]，None 表示不会再有新文件。
+        # streaming=True 时文件夹边遍历边通过 add_files() 追加，遍历结束后调用 finish_input()
+        self.inbox = queue.Queue()
+        self._lock = threading.Lock()
+        self._accepting = True
+        self._pending = len(jobs or [])  # 已追加、还没有结果的文件数
+        if jobs is None and file_paths:
+            self.add_files([(p, '') for p in file_paths])
+        if not streaming:
+            self.finish_input()
+
+    def add_files(self, entries):
+        """追加 [(path, rel_dir)] 或从任务日志恢复的任务，按追加顺序紧接在已有任务之后编号（可在任意线程调用）。
+        已经调用过 finish_input() 或线程已结束时不再接收，返回 False"""
+        with self._lock:
+            if not self._accepting:
+                return False
+            if entries:
+                self.inbox.put(list(entries))
+                self._pending += len(entries)
+            return True
+
+    def finish_input(self):
+        with self._lock:
+            self._accepting = False
+            self.inbox.put(None)
+
+    def pending(self):
+        """已追加、还没有上传结果的文件数"""
+        with self._lock:
+            return self._pending
+
+    def get_object_name(self, original_path, rel_dir=''):
+        return self.engine.get_object_name(original_path, rel_dir)
+
+    def set_priority(self, index, priority):
+        """调整还没开始上传的文件的优先级（可在任意线程调用），已经开始或结束的返回 False"""
+        return self.engine.set_priority(index, priority)
 
     def run(self):
+        # oss2 导入较慢，推迟到第一次上传时在后台线程中导入
+        import oss2
         try:
-            auth = oss2.Auth(self.config['access_key_id'], self.config['access_key_secret'])
-            endpoint = self.config['endpoint']
-            if not endpoint.startswith('http'): endpoint = 'https://' + endpoint
-            bucket = oss2.Bucket(auth, endpoint, self.config['bucket_name'])
+            self.engine.connect()
         except oss2.exceptions.OssError as e:
             # OSS 认证或初始化错误
-            for i in range(len(self.file_paths)):
-                self.error_signal.emit(i, f"OSS 初始化失败: {str(e)}")
-            self.all_finished_signal.emit()
+            self.fail_all(f"OSS 初始化失败: {str(e)}")
             return
         except KeyError as e:
             # 配置缺失必需字段
-            for i in range(len(self.file_paths)):
-                self.error_signal.emit(i, f"配置缺失: {str(e)}")
-            self.all_finished_signal.emit()
+            self.fail_all(f"配置缺失: {str(e)}")
             return
         except Exception as e:
             # 其他未知错误
-            for i in range(len(self.file_paths)):
-                self.error_signal.emit(i, f"初始化失败: {str(e)}")
-            self.all_finished_signal.emit()
+            self.fail_all(f"初始化失败: {str(e)}")
             return
-        expire_time = int(self.config.get('url_expire_time', 2592000))
-        domain = self.config.get('custom_domain', '').strip()
-        if domain:
-            if not domain.startswith('http'): domain = 'https://' + domain
-            if domain.endswith('/'): domain = domain[:-1]
-        else:
-            # 如果没有自定义域名，使用默认 Endpoint
-            clean_endpoint = self.config['endpoint'].replace('http://', '').replace('https://', '')
-            domain = f"https://{self.config['bucket_name']}.{clean_endpoint}"
 
-        for idx, file_path in enumerate(self.file_paths):
-            if not self.is_running: break
+        # 上传期间保存的设置对尚未开始的文件生效
+        ConfigManager.add_listener(self.engine.reconfigure)
+        try:
+            self.forward_events()
+        finally:
+            ConfigManager.remove_listener(self.engine.reconfigure)
+
+        # 整批正常结束且日志里没有其他未完成任务时，删除日志文件
+        if self.is_running:
+            JobJournal.clear_if_idle()
+        self.close_input()
+        self.all_finished_signal.emit()
 
-            file_name = os.path.basename(file_path)
+    def close_input(self):
+        """线程即将结束：之后的 add_files() 返回 False，没有结果的文件不再等待"""
+        with self._lock:
+            self._accepting = False
+            self._pending = 0
+
+    def forward_events(self):
+        """上传流程都在引擎中，这里只把事件转成 Qt 信号"""
+        for event in self.engine.upload_many(self.iter_input(), progress_interval=self.PROGRESS_INTERVAL,
+                                             first_index=self.first_index):
+            self.stats.feed(event)
+            if event['type'] == 'progress':
+                self.flush_progress(event['updates'])
+            elif event['type'] == 'success':
+                self.success_signal.emit(event['index'], os.path.basename(event['path']), event['url'])
+            elif event['type'] == 'error' and event['index'] is not None:
+                self.error_signal.emit(event['index'], event['error'])
+            elif event['type'] == 'retry':
+                self.retry_signal.emit(event['index'], event['retries'], event['error'])
+            elif event['type'] == 'concurrency':
+                self.concurrency_signal.emit(event['limit'], event['throughput'])
+            # cancelled: 用户停止上传，任务保留在日志中，下次启动时续传
+            if event['type'] in ('success', 'error', 'cancelled') and event['index'] is not None:
+                self.file_done()
+
+    def iter_input(self):
+        """先交出从日志恢复的任务，再按顺序交出收件箱中陆续追加的文件"""
+        if self.jobs:
+            yield list(self.jobs)
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return
+            yield batch
+
+    def next_batch(self):
+        """取下一批文件，等待文件夹遍历时阻塞；输入结束或已停止时返回 None"""
+        while self.is_running:
             try:
-                object_name = self.get_object_name(file_path)
-
-                def percentage(consumed_bytes, total_bytes):
-                    if total_bytes:
-                        rate = int(100 * (float(consumed_bytes) / float(total_bytes)))
-                        self.progress_signal.emit(idx, rate)
-
-                bucket.put_object_from_file(object_name, file_path, progress_callback=percentage)
-
-                # 生成链接
-                if expire_time > 0:
-                    # == 私有模式：生成签名链接 ==
-                    signed_url = bucket.sign_url('GET', object_name, expire_time, slash_safe=True)
-
-                    # 如果配置了自定义域名，我们需要替换掉官方签名的 Host 部分
-                    if self.config.get('custom_domain', '').strip():
-                        if '?' in signed_url:
-                            query_params = signed_url.split('?')[1]
-                            url = f"{domain}/{object_name}?{query_params}"
-                        else:
-                            url = signed_url
-                    else:
-                        url = signed_url
-                else:
-                    # == 公开模式：直接拼接 ==
-                    url = f"{domain}/{object_name}"
-                HistoryManager.add_record(file_name, url)
-                self.success_signal.emit(idx, file_name, url)
-
-            except Exception as e:
-                self.error_signal.emit(idx, str(e))
+                return self.inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
 
+    def file_done(self):
+        with self._lock:
+            self._pending -= 1
+            idle = self._pending == 0
+        if idle:
+            # 常驻队列空闲时整理任务日志，工作线程保留着等待新文件
+            JobJournal.clear_if_idle()
+            self.idle_signal.emit()
+
+    def fail_all(self, msg):
+        """初始化失败时，已入队的每个文件都报告错误；之后追加的文件由调用方交给新的线程"""
+        with self._lock:
+            self._accepting = False
+        count = self.first_index
+        for _ in self.jobs or []:
+            self.error_signal.emit(count, msg)
+            count += 1
+        while True:
+            try:
+                batch = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None: break
+            for _ in batch:
+                self.error_signal.emit(count, msg)
+                count += 1
+        self.close_input()
         self.all_finished_signal.emit()
 
+    def flush_progress(self, changed):
+        self.progress_batch_signal.emit(changed)
+        for idx, consumed, total in changed:
+            percent = int(100 * consumed / total) if total else 0
+            if self._last_percent.get(idx) != percent:
+                self._last_percent[idx] = percent
+                self.progress_signal.emit(idx, percent)
+
     def stop(self):
         """停止上传线程并清理资源
 
-        设置 is_running 标志位，让上传循环在下一次迭代时退出。
+        设置 is_running 标志位，让上传循环停止提交新文件，
+        已提交但尚未开始的任务也会直接跳过。
         注意：OSS SDK 不支持中断正在进行的上传，但我们可以设置标志位
         让循环尽快退出。
         """
@@ -375,34 +357,280 @@ class BatchUploadThread(QThread):
         # 但我们可以设置标志位让循环尽快退出
 
 
+# --- 文件夹遍历线程 ---
+class FolderScanThread(QThread):
+    """在后台遍历拖入的文件和文件夹，分批发出找到的文件，界面不会因网络盘等慢速目录卡住"""
+    BATCH_SIZE = 200
+    BATCH_INTERVAL = 0.1  # 秒，遍历慢时也至少每 100ms 发出一批
+
+    files_found_signal = pyqtSignal(list)  # [(path, rel_dir), ...]
+    scan_finished_signal = pyqtSignal(int)  # 找到的文件总数
+
+    def __init__(self, paths, config):
+        super().__init__()
+        self.paths = paths
+        self.config = config
+        self.is_running = True
+
+    def run(self):
+        batch, total = [], 0
+        last_emit = time.monotonic()
+        for entry in FolderScanner.iter_files(self.paths,
+                                              include=self.config.get('folder_include', ''),
+                                              exclude=self.config.get('folder_exclude', ''),
+                                              is_running=lambda: self.is_running):
+            batch.append(entry)
+            if len(batch) >= self.BATCH_SIZE or time.monotonic() - last_emit >= self.BATCH_INTERVAL:
+                total += len(batch)
+                self.files_found_signal.emit(batch)
+                batch, last_emit = [], time.monotonic()
+        if batch and self.is_running:
+            total += len(batch)
+            self.files_found_signal.emit(batch)
+        self.scan_finished_signal.emit(total)
+
+    def stop(self):
+        self.is_running = False
+
+
+# --- 连接预热线程 ---
+class PrewarmThread(QThread):
+    """在后台提前建立到 OSS 的连接（顺带导入 oss2），不阻塞界面"""
+    warmed_signal = pyqtSignal(dict)  # {'connect_ms', 'saved_ms'}
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+
+    def run(self):
+        try:
+            result = ClientCache.prewarm(self.config)
+        except Exception as e:
+            # 预热失败不影响上传，上传时会照常建立连接
+            print(f"预热连接失败: {e}")
+            return
+        if result:
+            self.warmed_signal.emit(result)
+
+
+# --- 表格委托 ---
+class ButtonDelegate(QStyledItemDelegate):
+    """在单元格里直接绘制按钮，代替为每一行创建 QPushButton（样式与原表格内按钮一致）。
+
+    按钮文字取自模型的 DisplayRole，ButtonDelegate.EnabledRole 为 False 时绘制为禁用状态；
+    点击时发出 clicked(index)。
+    """
+    EnabledRole = Qt.UserRole + 100
+    clicked = pyqtSignal(QModelIndex)
+
+    def button_rect(self, rect):
+        return rect.adjusted(8, 5, -8, -5)
+
+    def paint(self, painter, option, index):
+        enabled = index.data(ButtonDelegate.EnabledRole) is not False
+        hover = enabled and bool(option.state & QStyle.State_MouseOver)
+        rect = self.button_rect(option.rect)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        if not enabled:
+            bg, border, fg = "#F2F6FC", "#EBEEF5", "#C0C4CC"
+        elif hover:
+            bg, border, fg = "#FFFFFF", "#409EFF", "#409EFF"
+        else:
+            bg, border, fg = "#FFFFFF", "#DCDFE6", "#606266"
+        painter.setPen(QPen(QColor(border)))
+        painter.setBrush(QColor(bg))
+        painter.drawRoundedRect(rect, 4, 4)
+        font = QFont(option.font)
+        font.setPixelSize(12)
+        painter.setFont(font)
+        painter.setPen(QColor(fg))
+        painter.drawText(rect, Qt.AlignCenter, index.data(Qt.DisplayRole) or "")
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            if index.data(ButtonDelegate.EnabledRole) is not False \
+                    and self.button_rect(option.rect).contains(event.pos()):
+                self.clicked.emit(index)
+                return True
+        return super().editorEvent(event, model, option, index)
+
+
+class ProgressDelegate(QStyledItemDelegate):
+    """绘制进度条，百分比取自模型的 ProgressDelegate.ProgressRole；
+    DisplayRole 有文字（速度、剩余时间）时画在进度条下方"""
+    ProgressRole = Qt.UserRole + 101
+
+    def paint(self, painter, option, index):
+        percent = max(0, min(100, index.data(ProgressDelegate.ProgressRole) or 0))
+        text = index.data(Qt.DisplayRole)
+        top = (option.rect.height() - 8) // 2 - (7 if text else 0)
+        rect = option.rect.adjusted(5, top, -5, 0)
+        rect.setHeight(8)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor("#EEEEEE"))
+        painter.drawRoundedRect(rect, 4, 4)
+        if percent:
+            chunk = QRect(rect)
+            chunk.setWidth(max(8, rect.width() * percent // 100))
+            painter.setBrush(QColor("#4CAF50"))
+            painter.drawRoundedRect(chunk, 4, 4)
+        if text:
+            font = painter.font()
+            if font.pointSizeF() > 0:
+                font.setPointSizeF(max(6.0, font.pointSizeF() - 2))
+            painter.setFont(font)
+            painter.setPen(QColor("#888888"))
+            text_rect = QRect(rect.left(), rect.bottom() + 3, rect.width(), option.rect.bottom() - rect.bottom() - 3)
+            painter.drawText(text_rect, Qt.AlignLeft | Qt.AlignTop,
+                             painter.fontMetrics().elidedText(text, Qt.ElideRight, text_rect.width()))
+        painter.restore()
+
+
 # --- 历史记录窗口 ---
+class LazyComboBox(QComboBox):
+    """第一次展开下拉列表时才调用 loader(combo) 填充选项，创建时不查询"""
+
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+
+    def showPopup(self):
+        if self.loader is not None:
+            loader, self.loader = self.loader, None
+            loader(self)
+        super().showPopup()
+
+
+class HistoryTableModel(QAbstractTableModel):
+    """历史记录表格模型，滚动到底部时才从数据库读取下一页"""
+    PAGE_SIZE = 200
+    HEADERS = ["时间", "文件名", "链接 (双击打开)", "操作"]
+    UrlRole = Qt.UserRole
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.records = []
+        self.exhausted = False
+        self.filters = {}
+
+    def set_filters(self, **filters):
+        """更换搜索条件后从第一页重新加载"""
+        self.beginResetModel()
+        self.filters = filters
+        self.records = []
+        self.exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record, col = self.records[index.row()], index.column()
+        if role == Qt.DisplayRole:
+            return (record['date'], record['filename'], record['url'], "复制")[col]
+        if role == Qt.ForegroundRole and col == 2:
+            return QColor("#409EFF")
+        if role == self.UrlRole:
+            return record['url']
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        before_id = self.records[-1]['id'] if self.records else None
+        page = HistoryManager.fetch_page(before_id, self.PAGE_SIZE, **self.filters)
+        if len(page) < self.PAGE_SIZE:
+            self.exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.records), len(self.records) + len(page) - 1)
+            self.records.extend(page)
+            self.endInsertRows()
+
+
 class HistoryWindow(QDialog):
+    # 时间范围选项：(显示文字, 天数)，None 表示不限，0 表示今天
+    DATE_RANGES = [("全部时间", None), ("今天", 0), ("最近 7 天", 7), ("最近 30 天", 30), ("最近一年", 365)]
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("上传历史记录")
         self.resize(800, 600)
         self.setup_ui()
-        self.load_data()
+
+    def load_buckets(self, combo):
+        for bucket in HistoryManager.buckets(): combo.addItem(bucket, bucket)
 
     def setup_ui(self):
         layout = QVBoxLayout(self)
         layout.setContentsMargins(20, 20, 20, 20)
-        self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["时间", "文件名", "链接 (双击打开)", "操作"])
-        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
+
+        # 搜索栏：输入停顿 200ms 后再查询，避免每个按键都查一次数据库
+        filter_layout = QHBoxLayout()
+        self.input_search = QLineEdit()
+        self.input_search.setPlaceholderText("搜索文件名或链接...")
+        self.input_search.setClearButtonEnabled(True)
+        self.combo_date = QComboBox()
+        for text, days in self.DATE_RANGES: self.combo_date.addItem(text, days)
+        # 列出 Bucket 要扫描整个历史表，等第一次展开时再查
+        self.combo_bucket = LazyComboBox(self.load_buckets)
+        self.combo_bucket.addItem("全部 Bucket", "")
+        filter_layout.addWidget(self.input_search, 1)
+        filter_layout.addWidget(self.combo_date)
+        filter_layout.addWidget(self.combo_bucket)
+        layout.addLayout(filter_layout)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+        self.search_timer.timeout.connect(self.apply_filters)
+        self.input_search.textChanged.connect(self.search_timer.start)
+        self.combo_date.currentIndexChanged.connect(self.apply_filters)
+        self.combo_bucket.currentIndexChanged.connect(self.apply_filters)
+        # 模型按页从数据库读取，打开窗口的耗时与历史记录总数无关
+        self.model = HistoryTableModel(self)
+        self.model.fetchMore()
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Interactive)
         self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Interactive)
         self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
         self.table.horizontalHeader().setSectionResizeMode(3, QHeaderView.Fixed)
+        self.table.setColumnWidth(0, 160)
         self.table.setColumnWidth(1, 200)
         self.table.setColumnWidth(3, 80)
+        self.table.verticalHeader().setDefaultSectionSize(40)
         # 美化表格
         self.table.verticalHeader().setVisible(False)
         self.table.setShowGrid(False)
         self.table.setAlternatingRowColors(False)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
-        self.table.cellDoubleClicked.connect(self.on_cell_double_clicked)
+        self.table.setMouseTracking(True)
+        self.table.doubleClicked.connect(self.on_cell_double_clicked)
+
+        self.copy_delegate = ButtonDelegate(self.table)
+        self.copy_delegate.clicked.connect(lambda index: self.copy_link(index.data(HistoryTableModel.UrlRole)))
+        self.table.setItemDelegateForColumn(3, self.copy_delegate)
 
         layout.addWidget(self.table)
 
@@ -411,31 +639,18 @@ class HistoryWindow(QDialog):
         btn_close.clicked.connect(self.close)
         layout.addWidget(btn_close, alignment=Qt.AlignRight)
 
-    def load_data(self):
-        records = HistoryManager.load_history()
-        self.table.setRowCount(len(records))
-        for row, record in enumerate(records):
-            self.table.setItem(row, 0, QTableWidgetItem(record.get('date', '')))
-            self.table.setItem(row, 1, QTableWidgetItem(record.get('filename', '')))
-            url_item = QTableWidgetItem(record.get('url', ''))
-            url_item.setForeground(QColor("#409EFF"))
-            url_item.setData(Qt.UserRole, record.get('url', ''))
-            self.table.setItem(row, 2, url_item)
-
-            btn_copy = QPushButton("复制")
-            btn_copy.setCursor(Qt.PointingHandCursor)
-            btn_copy.clicked.connect(lambda _, u=record.get('url', ''): self.copy_link(u))
-
-            container = QWidget()
-            l = QHBoxLayout(container)
-            l.setContentsMargins(4, 4, 4, 4)
-            l.setAlignment(Qt.AlignCenter)  # 居中对齐
-            l.addWidget(btn_copy)
-            self.table.setCellWidget(row, 3, container)
-
-    def on_cell_double_clicked(self, row, col):
-        if col == 2:
-            url = self.table.item(row, col).data(Qt.UserRole)
+    def apply_filters(self):
+        days = self.combo_date.currentData()
+        date_from = None
+        if days is not None:
+            start = datetime.datetime.combine(datetime.date.today(), datetime.time()) - datetime.timedelta(days=days)
+            date_from = start.strftime("%Y-%m-%d %H:%M:%S")
+        self.model.set_filters(text=self.input_search.text().strip(), date_from=date_from,
+                               bucket=self.combo_bucket.currentData())
+
+    def on_cell_double_clicked(self, index):
+        if index.column() == 2:
+            url = index.data(HistoryTableModel.UrlRole)
             if url: QDesktopServices.openUrl(QUrl(url))
 
     def copy_link(self, url):
@@ -447,7 +662,7 @@ class SettingsDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("OSS 配置")
-        self.resize(450, 420)
+        self.resize(480, 920)
         self.config = ConfigManager.load_config()
         self.init_ui()
 
@@ -526,6 +741,12 @@ class SettingsDialog(QDialog):
         form_path = QFormLayout(group_path)
         self.input_path = QLineEdit(self.config.get('upload_path'))
         form_path.addRow("保存规则:", self.input_path)
+        self.input_include = QLineEdit(self.config.get('folder_include', ''))
+        self.input_include.setPlaceholderText("留空 = 全部，例如 *.png;*.jpg")
+        form_path.addRow("文件夹包含:", self.input_include)
+        self.input_exclude = QLineEdit(self.config.get('folder_exclude', ''))
+        self.input_exclude.setPlaceholderText("例如 .git;node_modules;*.tmp")
+        form_path.addRow("文件夹排除:", self.input_exclude)
         layout.addWidget(group_path)
 
         group_behavior = QGroupBox("高级选项")
@@ -548,14 +769,178 @@ class SettingsDialog(QDialog):
         time_layout.addStretch()
 
         vbox.addLayout(time_layout)
+
+        concurrency_layout = QHBoxLayout()
+        self.spin_concurrency = QSpinBox()
+        self.spin_concurrency.setRange(1, 16)
+        self.spin_concurrency.setValue(int(self.config.get('upload_concurrency', 3)))
+        self.spin_concurrency.setFixedWidth(120)
+        concurrency_layout.addWidget(QLabel("并发上传数:"))
+        concurrency_layout.addWidget(self.spin_concurrency)
+        concurrency_layout.addWidget(QLabel("个文件"))
+        concurrency_layout.addStretch()
+        vbox.addLayout(concurrency_layout)
+
+        adaptive_layout = QHBoxLayout()
+        self.check_adaptive = QCheckBox("按网速自动调整，范围")
+        self.check_adaptive.setChecked(self.config.get('adaptive_concurrency', True))
+        self.spin_concurrency_min = QSpinBox()
+        self.spin_concurrency_min.setRange(1, 64)
+        self.spin_concurrency_min.setValue(int(self.config.get('concurrency_min', 1)))
+        self.spin_concurrency_max = QSpinBox()
+        self.spin_concurrency_max.setRange(1, 64)
+        self.spin_concurrency_max.setValue(int(self.config.get('concurrency_max', 16)))
+        for spin in (self.spin_concurrency_min, self.spin_concurrency_max):
+            spin.setEnabled(self.check_adaptive.isChecked())
+            self.check_adaptive.toggled.connect(spin.setEnabled)
+        adaptive_layout.addWidget(self.check_adaptive)
+        adaptive_layout.addWidget(self.spin_concurrency_min)
+        adaptive_layout.addWidget(QLabel("-"))
+        adaptive_layout.addWidget(self.spin_concurrency_max)
+        adaptive_layout.addStretch()
+        vbox.addLayout(adaptive_layout)
+
+        multipart_layout = QHBoxLayout()
+        self.spin_multipart = QSpinBox()
+        self.spin_multipart.setRange(0, 102400)  # 0 = 不使用分片上传
+        self.spin_multipart.setValue(int(self.config.get('multipart_threshold', 100 * 1024 * 1024)) // (1024 * 1024))
+        self.spin_multipart.setFixedWidth(120)
+        self.spin_part_threads = QSpinBox()
+        self.spin_part_threads.setRange(1, 16)
+        self.spin_part_threads.setValue(int(self.config.get('multipart_threads', 4)))
+        multipart_layout.addWidget(QLabel("分片上传阈值:"))
+        multipart_layout.addWidget(self.spin_multipart)
+        multipart_layout.addWidget(QLabel("MB  分片并发:"))
+        multipart_layout.addWidget(self.spin_part_threads)
+        multipart_layout.addStretch()
+        vbox.addLayout(multipart_layout)
+
+        retry_layout = QHBoxLayout()
+        self.spin_retry = QSpinBox()
+        self.spin_retry.setRange(0, 10)
+        self.spin_retry.setValue(int(self.config.get('retry_attempts', 3)))
+        self.spin_retry.setFixedWidth(120)
+        lbl_retry_hint = QLabel("(网络超时、5xx、限流时自动重试，分片上传只重试失败的分片)")
+        lbl_retry_hint.setStyleSheet("color: gray;")
+        retry_layout.addWidget(QLabel("失败重试:"))
+        retry_layout.addWidget(self.spin_retry)
+        retry_layout.addWidget(QLabel("次"))
+        retry_layout.addWidget(lbl_retry_hint)
+        retry_layout.addStretch()
+        vbox.addLayout(retry_layout)
+
+        schedule_layout = QHBoxLayout()
+        self.combo_schedule = QComboBox()
+        self.combo_schedule.addItem("小文件优先", "sjf")
+        self.combo_schedule.addItem("按添加顺序", "fifo")
+        index = self.combo_schedule.findData(self.config.get('schedule_policy', 'sjf'))
+        self.combo_schedule.setCurrentIndex(max(0, index))
+        lbl_schedule_hint = QLabel("(大文件单独排队，不会被小文件一直挤在后面；任务列表右键可调整优先级)")
+        lbl_schedule_hint.setStyleSheet("color: gray;")
+        schedule_layout.addWidget(QLabel("上传顺序:"))
+        schedule_layout.addWidget(self.combo_schedule)
+        schedule_layout.addWidget(lbl_schedule_hint)
+        schedule_layout.addStretch()
+        vbox.addLayout(schedule_layout)
+
         self.check_random = QCheckBox("启用随机文件名 (UUID)")
         self.check_random.setChecked(self.config.get('use_random_name', False))
         self.check_copy = QCheckBox("自动复制第一个文件的链接")
         self.check_copy.setChecked(self.config.get('auto_copy', True))
 
+        self.check_dedup = QCheckBox("相同内容已上传过时直接复用链接 (内容去重)")
+        self.check_dedup.setChecked(self.config.get('dedup_enabled', True))
+
+        self.check_prewarm = QCheckBox("启动后空闲时预热连接")
+        self.check_prewarm.setChecked(self.config.get('prewarm_on_launch', True))
+
         vbox.addWidget(self.check_random)
         vbox.addWidget(self.check_copy)
+        vbox.addWidget(self.check_dedup)
+        vbox.addWidget(self.check_prewarm)
         layout.addWidget(group_behavior)
+
+        group_image = QGroupBox("图片优化")
+        image_layout = QVBoxLayout(group_image)
+        self.check_image_optimize = QCheckBox("上传前压缩图片")
+        self.check_image_optimize.setChecked(self.config.get('image_optimize', False))
+        self.check_webp = QCheckBox("PNG/BMP/TIFF 转为 WebP")
+        self.check_webp.setChecked(self.config.get('image_to_webp', True))
+        self.check_strip_exif = QCheckBox("去掉 EXIF（拍摄信息、GPS 位置）")
+        self.check_strip_exif.setChecked(self.config.get('image_strip_exif', True))
+        image_options = QHBoxLayout()
+        self.spin_image_dimension = QSpinBox()
+        self.spin_image_dimension.setRange(0, 20000)
+        self.spin_image_dimension.setValue(int(self.config.get('image_max_dimension', 0)))
+        self.spin_image_quality = QSpinBox()
+        self.spin_image_quality.setRange(1, 100)
+        self.spin_image_quality.setValue(int(self.config.get('image_quality', 85)))
+        image_options.addWidget(QLabel("最长边:"))
+        image_options.addWidget(self.spin_image_dimension)
+        image_options.addWidget(QLabel("像素 (0 = 不缩放)  质量:"))
+        image_options.addWidget(self.spin_image_quality)
+        image_options.addStretch()
+        image_layout.addWidget(self.check_image_optimize)
+        image_layout.addWidget(self.check_webp)
+        image_layout.addLayout(image_options)
+        image_layout.addWidget(self.check_strip_exif)
+        for option in (self.check_webp, self.check_strip_exif, self.spin_image_dimension, self.spin_image_quality):
+            option.setEnabled(self.check_image_optimize.isChecked())
+            self.check_image_optimize.toggled.connect(option.setEnabled)
+        if not ImageOptimizer.available():
+            self.check_image_optimize.setEnabled(False)
+            lbl_image_hint = QLabel("(需要安装 Pillow: pip install Pillow)")
+            lbl_image_hint.setStyleSheet("color: gray;")
+            image_layout.addWidget(lbl_image_hint)
+        layout.addWidget(group_image)
+
+        group_compress = QGroupBox("传输压缩")
+        compress_layout = QVBoxLayout(group_compress)
+        compress_options = QHBoxLayout()
+        self.check_compress = QCheckBox("压缩文本类文件后上传，编码")
+        self.check_compress.setChecked(self.config.get('compress_enabled', False))
+        self.combo_compress = QComboBox()
+        self.combo_compress.addItem("gzip", "gzip")
+        self.combo_compress.addItem("brotli", "br")
+        index = self.combo_compress.findData(self.config.get('compress_encoding', 'gzip'))
+        self.combo_compress.setCurrentIndex(max(0, index))
+        self.spin_compress_min = QSpinBox()
+        self.spin_compress_min.setRange(0, 1024 * 1024)
+        self.spin_compress_min.setValue(int(self.config.get('compress_min_size', 1024)) // 1024)
+        compress_options.addWidget(self.check_compress)
+        compress_options.addWidget(self.combo_compress)
+        compress_options.addWidget(QLabel("不小于"))
+        compress_options.addWidget(self.spin_compress_min)
+        compress_options.addWidget(QLabel("KB"))
+        compress_options.addStretch()
+        self.input_compress_include = QLineEdit(self.config.get('compress_include', ''))
+        self.input_compress_include.setPlaceholderText("例如 *.log;*.json;*.svg（text/* 类型总是压缩）")
+        compress_layout.addLayout(compress_options)
+        compress_layout.addWidget(self.input_compress_include)
+        for option in (self.combo_compress, self.spin_compress_min, self.input_compress_include):
+            option.setEnabled(self.check_compress.isChecked())
+            self.check_compress.toggled.connect(option.setEnabled)
+        layout.addWidget(group_compress)
+
+        group_history = QGroupBox("历史记录")
+        history_layout = QHBoxLayout(group_history)
+        self.spin_history_days = QSpinBox()
+        self.spin_history_days.setRange(0, 36500)
+        self.spin_history_days.setValue(int(self.config.get('history_retention_days', 0)))
+        self.spin_history_max = QSpinBox()
+        self.spin_history_max.setRange(0, 10000000)
+        self.spin_history_max.setValue(int(self.config.get('history_max_records', 0)))
+        self.spin_history_max.setFixedWidth(120)
+        history_layout.addWidget(QLabel("保留"))
+        history_layout.addWidget(self.spin_history_days)
+        history_layout.addWidget(QLabel("天，最多"))
+        history_layout.addWidget(self.spin_history_max)
+        history_layout.addWidget(QLabel("条"))
+        lbl_history_hint = QLabel("(0 = 不限制)")
+        lbl_history_hint.setStyleSheet("color: gray;")
+        history_layout.addWidget(lbl_history_hint)
+        history_layout.addStretch()
+        layout.addWidget(group_history)
         layout.addStretch()
         return widget
 
@@ -598,10 +983,17 @@ class SettingsDialog(QDialog):
 
     def check_connection(self):
         try:
-            auth = oss2.Auth(self.input_ak.text().strip(), self.input_sk.text().strip())
-            ep = self.get_endpoint()
-            ep = ep if ep.startswith('http') else f'https://{ep}'
-            bucket = oss2.Bucket(auth, ep, self.input_bucket.text().strip())
+            # 与上传共用连接缓存，测试通过后第一次上传不用重新握手
+            bucket = ClientCache.get_bucket({
+                "access_key_id": self.input_ak.text().strip(),
+                "access_key_secret": self.input_sk.text().strip(),
+                "endpoint": self.get_endpoint(),
+                "bucket_name": self.input_bucket.text().strip(),
+                "upload_concurrency": self.spin_concurrency.value(),
+                "adaptive_concurrency": self.check_adaptive.isChecked(),
+                "concurrency_max": self.spin_concurrency_max.value(),
+                "multipart_threads": self.spin_part_threads.value()
+            })
             bucket.get_bucket_info()
             QMessageBox.information(self, "成功", "连接成功！")
         except Exception as e:
@@ -617,14 +1009,186 @@ class SettingsDialog(QDialog):
             "upload_path": self.input_path.text().strip(),
             "use_random_name": self.check_random.isChecked(),
             "auto_copy": self.check_copy.isChecked(),
-            "url_expire_time": self.spin_expire.value()
+            "url_expire_time": self.spin_expire.value(),
+            "upload_concurrency": self.spin_concurrency.value(),
+            "adaptive_concurrency": self.check_adaptive.isChecked(),
+            "concurrency_min": min(self.spin_concurrency_min.value(), self.spin_concurrency_max.value()),
+            "concurrency_max": max(self.spin_concurrency_min.value(), self.spin_concurrency_max.value()),
+            "multipart_threshold": self.spin_multipart.value() * 1024 * 1024,
+            "multipart_part_size": int(self.config.get('multipart_part_size', 8 * 1024 * 1024)),
+            "multipart_threads": self.spin_part_threads.value(),
+            "retry_attempts": self.spin_retry.value(),
+            "retry_backoff": float(self.config.get('retry_backoff', 0.5)),
+            "retry_max_delay": float(self.config.get('retry_max_delay', 10)),
+            "schedule_policy": self.combo_schedule.currentData(),
+            "schedule_large_size": int(self.config.get('schedule_large_size', 32 * 1024 * 1024)),
+            "dedup_enabled": self.check_dedup.isChecked(),
+            "dedup_verify": bool(self.config.get('dedup_verify', True)),
+            "history_retention_days": self.spin_history_days.value(),
+            "history_max_records": self.spin_history_max.value(),
+            "folder_include": self.input_include.text().strip(),
+            "folder_exclude": self.input_exclude.text().strip(),
+            "prewarm_on_launch": self.check_prewarm.isChecked(),
+            "image_optimize": self.check_image_optimize.isChecked(),
+            "image_to_webp": self.check_webp.isChecked(),
+            "image_max_dimension": self.spin_image_dimension.value(),
+            "image_quality": self.spin_image_quality.value(),
+            "image_strip_exif": self.check_strip_exif.isChecked(),
+            "compress_enabled": self.check_compress.isChecked(),
+            "compress_encoding": self.combo_compress.currentData(),
+            "compress_min_size": self.spin_compress_min.value() * 1024,
+            "compress_include": self.input_compress_include.text().strip()
         }
         ConfigManager.save_config(data)
+        HistoryManager.apply_retention(data)
         self.accept()
 
 
+# --- 上传任务表格 ---
+class TaskTableModel(QAbstractTableModel):
+    """上传任务表格模型。
+
+    入队时只保存文件路径，每行的状态在第一次有进度/结果时才创建，
+    绘制由 ProgressDelegate / ButtonDelegate 完成，不为任何一行创建控件。
+    """
+    HEADERS = ["文件名", "进度", "链接", "操作"]
+    PRIORITY_TEXT = {1: "等待中（优先上传）...", -1: "等待中（最后上传）..."}
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.paths = []
+        self.states = {}  # row -> {'consumed', 'total', 'url', 'error', 'retries', 'retry_error', 'copied', 'priority'}
+        self.stats = None  # 当前批次的 TransferStats，用于显示每行的速度和剩余时间
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, col = index.row(), index.column()
+        state = self.states.get(row, {})
+        if col == 0 and role == Qt.DisplayRole:
+            return os.path.basename(self.paths[row])
+        if col == 0 and role == Qt.ToolTipRole:
+            return self.paths[row]
+        if col == 1 and role == ProgressDelegate.ProgressRole:
+            total = state.get('total')
+            return int(100 * state.get('consumed', 0) / total) if total else 0
+        if col == 1 and role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self.transfer_text(row, role == Qt.ToolTipRole)
+        if col == 2:
+            retries = state.get('retries', 0)
+            if role == Qt.DisplayRole:
+                if state.get('url'): return state['url']
+                if state.get('error'):
+                    return f"失败（已重试 {retries} 次）: {state['error']}" if retries else f"失败: {state['error']}"
+                if retries: return f"第 {retries} 次重试... ({state['retry_error']})"
+                return self.PRIORITY_TEXT.get(state.get('priority', 0), "等待中...")
+            if role == Qt.ToolTipRole and retries:
+                return f"重试 {retries} 次，最近一次错误: {state['retry_error']}"
+            if role == Qt.ForegroundRole:
+                if state.get('url'): return QColor(Qt.blue)
+                if state.get('error'): return QColor(Qt.red)
+                if retries: return QColor(255, 140, 0)
+        if col == 3:
+            if role == Qt.DisplayRole:
+                return "已复制" if state.get('copied') else "复制"
+            if role == ButtonDelegate.EnabledRole:
+                return bool(state.get('url'))
+        return None
+
+    def _state(self, row):
+        return self.states.setdefault(row, {})
+
+    def transfer_text(self, row, detail=False):
+        """进度条下方的速度/剩余时间；detail=True 时给出提示框用的完整描述"""
+        info = self.stats.row(row) if self.stats is not None else None
+        if not info or info['elapsed'] is None:
+            return None
+        fmt_size, fmt_time = TransferStats.format_size, TransferStats.format_duration
+        if info['done']:
+            text = f"{fmt_size(info['total'])} · {fmt_time(info['elapsed'])}"
+            if detail and info['speed']:
+                text += f" · 平均 {fmt_size(info['speed'])}/s"
+            if detail and info['ratio'] is not None:
+                text += f" · 压缩后 {info['ratio']:.0%}"
+            return text
+        text = f"{fmt_size(info['speed'])}/s · 剩余 {fmt_time(info['eta'])}"
+        if detail:
+            text = f"{fmt_size(info['consumed'])} / {fmt_size(info['total'])} · {text}"
+        return text
+
+    def add_files(self, paths):
+        if not paths:
+            return
+        first = len(self.paths)
+        self.beginInsertRows(QModelIndex(), first, first + len(paths) - 1)
+        self.paths.extend(paths)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.paths = []
+        self.states = {}
+        self.stats = None
+        self.endResetModel()
+
+    def update_progress(self, updates):
+        """批量更新进度，只发一次 dataChanged"""
+        rows = [idx for idx, _, _ in updates if 0 <= idx < len(self.paths)]
+        if not rows:
+            return
+        for idx, consumed, total in updates:
+            if 0 <= idx < len(self.paths):
+                state = self._state(idx)
+                state['consumed'], state['total'] = consumed, total
+        self.dataChanged.emit(self.index(min(rows), 1), self.index(max(rows), 1),
+                              [ProgressDelegate.ProgressRole, Qt.DisplayRole])
+
+    def set_success(self, row, url):
+        state = self._state(row)
+        state['url'] = url
+        state['error'] = None
+        if state.get('total'):
+            state['consumed'] = state['total']
+        self.dataChanged.emit(self.index(row, 1), self.index(row, 3))
+
+    def set_error(self, row, msg):
+        self._state(row)['error'] = msg
+        self.dataChanged.emit(self.index(row, 2), self.index(row, 3))
+
+    def set_retry(self, row, retries, msg):
+        """临时性错误后正在重试，这一行不算失败"""
+        if 0 <= row < len(self.paths):
+            state = self._state(row)
+            state['retries'], state['retry_error'] = retries, msg
+            self.dataChanged.emit(self.index(row, 2), self.index(row, 2))
+
+    def set_priority(self, row, priority):
+        if 0 <= row < len(self.paths):
+            self._state(row)['priority'] = priority
+            self.dataChanged.emit(self.index(row, 2), self.index(row, 2))
+
+    def set_copied(self, row, copied):
+        if 0 <= row < len(self.paths):
+            self._state(row)['copied'] = copied
+            self.dataChanged.emit(self.index(row, 3), self.index(row, 3))
+
+
 # --- 主界面 ---
 class MainWindow(QMainWindow):
+    PREWARM_IDLE_DELAY = 1500  # 毫秒，启动后空闲多久再预热连接
+    STATS_INTERVAL = 500  # 毫秒，状态栏速度/剩余时间的刷新间隔
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle(f"阿里云 OSS 上传工具 v{VERSION}")
@@ -639,6 +1203,16 @@ class MainWindow(QMainWindow):
         QTimer.singleShot(100, self.startup_checks)
         self.tasks_data = {}
         self.thread = None  # 初始化线程属性，避免获取到 QObject.thread() 方法
+        self.scan_threads = []  # 正在遍历的文件夹，上传过程中可以继续拖入
+        self.prewarm_thread = None
+        self.queue_busy = False  # 队列中有文件在等待或上传
+        self.round_first = 0  # 队列这一轮（从空闲到再次空闲）的第一行，自动复制只复制这一轮的链接
+        self.batch_stats = None  # 当前列表的 TransferStats
+        self.concurrency = None  # 引擎最近报告的并发数
+        # 状态栏的速度和剩余时间按固定频率刷新，不随每个进度信号重绘
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(self.STATS_INTERVAL)
+        self.stats_timer.timeout.connect(self.refresh_status)
 
     def setup_ui(self):
         central = QWidget()
@@ -693,17 +1267,24 @@ class MainWindow(QMainWindow):
         self.drop_area.mousePressEvent = self.open_file_dialog
         card_layout.addWidget(self.drop_area)
 
-        # 表格
-        self.task_table = QTableWidget()
-        self.task_table.setColumnCount(4)
-        self.task_table.setHorizontalHeaderLabels(["文件名", "进度", "链接", "操作"])
+        # 表格：模型 + 委托绘制，入队上万个文件也不会创建控件
+        self.task_model = TaskTableModel(self)
+        self.task_table = QTableView()
+        self.task_table.setModel(self.task_model)
         self.task_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Interactive)
         self.task_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Fixed)
         self.task_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
         self.task_table.horizontalHeader().setSectionResizeMode(3, QHeaderView.Fixed)
         self.task_table.setColumnWidth(0, 240)
-        self.task_table.setColumnWidth(1, 140)
+        self.task_table.setColumnWidth(1, 170)
         self.task_table.setColumnWidth(3, 100)
+        self.task_table.verticalHeader().setDefaultSectionSize(40)
+
+        self.progress_delegate = ProgressDelegate(self.task_table)
+        self.copy_delegate = ButtonDelegate(self.task_table)
+        self.copy_delegate.clicked.connect(lambda index: self._on_copy_button_clicked(index.row()))
+        self.task_table.setItemDelegateForColumn(1, self.progress_delegate)
+        self.task_table.setItemDelegateForColumn(3, self.copy_delegate)
 
         # 表格美化
         self.task_table.verticalHeader().setVisible(False)
@@ -711,6 +1292,9 @@ class MainWindow(QMainWindow):
         self.task_table.setAlternatingRowColors(False)
         self.task_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.task_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.task_table.setMouseTracking(True)
+        self.task_table.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.task_table.customContextMenuRequested.connect(self.show_task_menu)
 
         card_layout.addWidget(self.task_table)
 
@@ -774,6 +1358,33 @@ class MainWindow(QMainWindow):
 
             # 5. 如果没有导入，则打开设置窗口让用户手动填写
             self.open_settings()
+            return
+
+        # 6. 按保留策略清理历史记录，并检查上次是否有未完成的上传任务
+        HistoryManager.apply_retention(config)
+        self.check_pending_jobs()
+
+        # 7. 空闲时预热连接，第一次上传不用等握手
+        if config.get('prewarm_on_launch', True):
+            QTimer.singleShot(self.PREWARM_IDLE_DELAY, self.prewarm_connection)
+
+    def check_pending_jobs(self):
+        """上次关闭或崩溃时留下的任务，询问是否续传"""
+        jobs = JobJournal.load_pending()
+        # 源文件已经被删除的任务无法续传，直接丢弃
+        resumable = [j for j in jobs if os.path.isfile(j['path'])]
+        if not resumable:
+            if jobs: JobJournal.compact([])
+            return
+
+        reply = QMessageBox.question(self, "未完成的上传",
+                                     f"检测到 {len(resumable)} 个上次未完成的上传任务，是否继续上传？",
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            JobJournal.compact(resumable)
+            self.start_batch_upload([j['path'] for j in resumable], jobs=resumable)
+        else:
+            JobJournal.compact([])
 
     def open_settings(self):
         SettingsDialog(self).exec_()
@@ -788,143 +1399,224 @@ class MainWindow(QMainWindow):
     def dragEnterEvent(self, e):
         if e.mimeData().hasUrls():
             e.accept()
+            # 拖入到松手之间通常有几百毫秒，正好用来建立连接
+            self.prewarm_connection()
         else:
             e.ignore()
 
+    def prewarm_connection(self):
+        if self.prewarm_thread is not None and self.prewarm_thread.isRunning():
+            return
+        config = ConfigManager.load_config()
+        if not config.get('access_key_id'):
+            return
+        self.prewarm_thread = PrewarmThread(config)
+        self.prewarm_thread.warmed_signal.connect(self.on_connection_warmed)
+        self.prewarm_thread.start()
+
+    def on_connection_warmed(self, result):
+        # 正在上传时不覆盖上传进度的状态
+        if not self.queue_busy:
+            self.lbl_status.setText(f"连接已预热：握手 {result['connect_ms']:.0f} ms，"
+                                    f"首个上传约节省 {result['saved_ms']:.0f} ms")
+
     def dropEvent(self, e):
-        files = [u.toLocalFile() for u in e.mimeData().urls() if os.path.isfile(u.toLocalFile())]
-        if files: self.start_batch_upload(files)
+        # 文件和文件夹都交给后台线程判断和遍历，这里不访问文件系统
+        paths = [u.toLocalFile() for u in e.mimeData().urls() if u.isLocalFile()]
+        if paths: self.start_batch_upload([], scan_paths=paths)
 
-    def start_batch_upload(self, file_paths):
+    def start_batch_upload(self, file_paths, jobs=None, scan_paths=None):
+        """把 file_paths 加入上传队列；scan_paths 中的文件夹在后台遍历，找到的文件陆续追加。
+        正在上传时新文件排在队列末尾、作为新行显示，已有的行和进行中的上传不受影响"""
         config = ConfigManager.load_config()
         if not config.get('access_key_id'): return QMessageBox.warning(self, "错误", "请先配置")
 
-        if not file_paths:
+        if not file_paths and not scan_paths:
             return  # Empty file list, nothing to do
 
-        self.drop_area.setEnabled(False)
-        self.tasks_data = {}  # 重置数据
-        self.task_table.setRowCount(0)  # 清空旧表
-        self.task_table.setRowCount(len(file_paths))
-
-        # 初始化表格行
-        for i, path in enumerate(file_paths):
-            fname = os.path.basename(path)
-            # 1. 文件名
-            self.task_table.setItem(i, 0, QTableWidgetItem(fname))
-            # 2. 进度条 (初始)
-            pbar = QProgressBar()
-            pbar.setRange(0, 100)
-            pbar.setValue(0)
-            pbar.setTextVisible(False)
-            pbar.setStyleSheet(
-                "QProgressBar { border: 0px; background-color: #eee; border-radius: 4px; } QProgressBar::chunk { background-color: #4CAF50; border-radius: 4px; }")
-            container = QWidget()
-            pl = QVBoxLayout(container)
-            pl.setContentsMargins(5, 5, 5, 5)
-            pl.addWidget(pbar)
-            self.task_table.setCellWidget(i, 1, container)
-            # 3. 链接 (空)
-            self.task_table.setItem(i, 2, QTableWidgetItem("等待中..."))
-            # 4. 操作 (禁用，但预先绑定点击事件)
-            btn = QPushButton("复制")
-            btn.setEnabled(False)
-            # 使用 functools.partial 固定索引和按钮引用，避免闭包问题
-            btn.clicked.connect(partial(self._on_copy_button_clicked, i, btn))
-            container_btn = QWidget()
-            bl = QVBoxLayout(container_btn)
-            bl.setContentsMargins(2, 2, 2, 2)
-            bl.addWidget(btn)
-            self.task_table.setCellWidget(i, 3, container_btn)
-
-        self.lbl_status.setText(f"正在上传 {len(file_paths)} 个文件...")
-
-        # === 清理旧线程和断开信号连接，防止重复上传时累积连接 ===
-        if hasattr(self, 'thread') and self.thread is not None:
-            # 如果旧线程仍在运行，先停止它
-            if self.thread.isRunning():
-                self.thread.stop()
-                self.thread.wait(2000)  # 等待最多 2 秒
+        if not self.queue_busy:
+            # 新的一轮：状态栏和自动复制从这里开始算
+            self.queue_busy = True
+            self.round_first = self.task_model.rowCount()
+            self.btn_clear.setEnabled(False)
+            self.stats_timer.start()
+        if self.batch_stats is None:
+            self.batch_stats = TransferStats()
+            self.task_model.stats = self.batch_stats
+        self.enqueue(jobs if jobs is not None else [(p, '') for p in file_paths], file_paths, config)
+
+        if scan_paths:
+            self.lbl_status.setText("正在扫描文件夹...")
+            # 边遍历边上传：每找到一批文件就加到表格并交给上传线程
+            scan_thread = FolderScanThread(scan_paths, config)
+            scan_thread.files_found_signal.connect(self.on_files_found)
+            scan_thread.scan_finished_signal.connect(self.on_scan_finished)
+            self.scan_threads.append(scan_thread)
+            scan_thread.start()
+        else:
+            self.lbl_status.setText(f"正在上传 {self.task_model.rowCount() - self.round_first} 个文件...")
+
+    def enqueue(self, items, paths, config=None):
+        """在表格末尾加入 paths 对应的行，并把 items（[(path, rel_dir)] 或恢复的任务）交给上传线程。
+        上传线程一直保留，只有还没有线程或它已经结束（例如初始化失败）时才新建，编号接着已有的行"""
+        first = self.task_model.rowCount()
+        self.task_model.add_files(paths)
+        if self.thread is not None and self.thread.isRunning() and self.thread.add_files(items):
+            return
 
-            # 断开信号连接
+        # === 清理旧线程和断开信号连接，防止重建线程时累积连接 ===
+        if self.thread is not None:
             try:
-                self.thread.progress_signal.disconnect(self.update_row_progress)
+                self.thread.progress_batch_signal.disconnect(self.update_rows_progress)
                 self.thread.success_signal.disconnect(self.on_row_success)
                 self.thread.error_signal.disconnect(self.on_row_error)
+                self.thread.retry_signal.disconnect(self.task_model.set_retry)
+                self.thread.concurrency_signal.disconnect(self.on_concurrency_changed)
+                self.thread.idle_signal.disconnect(self.on_all_finished)
                 self.thread.all_finished_signal.disconnect(self.on_all_finished)
             except TypeError:
                 # 如果信号未连接，disconnect 会抛出 TypeError，忽略即可
                 pass
 
-        self.thread = BatchUploadThread(file_paths, config)
-        self.thread.progress_signal.connect(self.update_row_progress)
+        self.concurrency = None
+        self.thread = BatchUploadThread([], config or ConfigManager.load_config(), streaming=True,
+                                        stats=self.batch_stats, first_index=first)
+        self.thread.add_files(items)
+        self.thread.progress_batch_signal.connect(self.update_rows_progress)
         self.thread.success_signal.connect(self.on_row_success)
         self.thread.error_signal.connect(self.on_row_error)
+        self.thread.retry_signal.connect(self.task_model.set_retry)
+        self.thread.concurrency_signal.connect(self.on_concurrency_changed)
+        self.thread.idle_signal.connect(self.on_all_finished)
         self.thread.all_finished_signal.connect(self.on_all_finished)
         self.thread.start()
 
-    def update_row_progress(self, idx, percent):
-        # 获取 CellWidget 里的 ProgressBar
-        widget = self.task_table.cellWidget(idx, 1)
-        if widget:
-            pbar = widget.findChild(QProgressBar)
-            if pbar: pbar.setValue(percent)
+    def stop_scan(self):
+        """停止所有文件夹遍历，并断开它们的信号，避免遍历结果混进清空后的表格"""
+        for scan_thread in self.scan_threads:
+            scan_thread.stop()
+            try:
+                scan_thread.files_found_signal.disconnect(self.on_files_found)
+                scan_thread.scan_finished_signal.disconnect(self.on_scan_finished)
+            except TypeError:
+                pass
+            scan_thread.wait(2000)
+        self.scan_threads = []
+
+    def on_files_found(self, entries):
+        # 已停止的遍历线程在断开前排进事件队列的批次直接丢弃
+        if self.sender() is not None and self.sender() not in self.scan_threads:
+            return
+        self.enqueue(entries, [path for path, _ in entries])
+        self.lbl_status.setText(f"正在扫描文件夹，已找到 {self.task_model.rowCount() - self.round_first} 个文件...")
+
+    def on_scan_finished(self, total):
+        if self.sender() is not None and self.sender() not in self.scan_threads:
+            return
+        if self.sender() is not None:
+            self.scan_threads.remove(self.sender())
+        if self.task_model.rowCount() > self.round_first:
+            self.lbl_status.setText(f"正在上传 {self.task_model.rowCount() - self.round_first} 个文件...")
+        # 文件夹里的文件可能在遍历结束前就已经传完
+        self.on_all_finished()
+
+    def update_rows_progress(self, updates):
+        """上传线程每帧合并发送一次 [(index, consumed, total)]"""
+        self.task_model.update_progress(updates)
 
     def on_row_success(self, idx, fname, url):
         # 只处理#,还有?没处理
         safe_url = url.replace('#', '%23')
-        # 更新链接列
-        item_url = QTableWidgetItem(safe_url)
-        item_url.setForeground(Qt.blue)
-        self.task_table.setItem(idx, 2, item_url)
+        # 更新链接列，复制按钮随之启用
+        self.task_model.set_success(idx, safe_url)
 
         # 记录数据
         self.tasks_data[idx] = {'filename': fname, 'url': safe_url}
 
-        # 启用按钮（点击事件已在初始化时绑定）
-        widget = self.task_table.cellWidget(idx, 3)
-        if widget:
-            btn = widget.findChild(QPushButton)
-            if btn:
-                btn.setEnabled(True)
-                btn.setCursor(Qt.PointingHandCursor)
-
-    def _on_copy_button_clicked(self, idx, btn):
+    def _on_copy_button_clicked(self, idx):
         """处理复制按钮点击事件"""
         if idx not in self.tasks_data:
             return
         url = self.tasks_data[idx]['url']
-        self._copy_to_clipboard(url, btn)
+        self._copy_to_clipboard(url)
+        # 按钮文字短暂显示“已复制”
+        self.task_model.set_copied(idx, True)
+        QTimer.singleShot(1000, lambda: self.task_model.set_copied(idx, False))
 
-    def _copy_to_clipboard(self, text, btn=None):
-        """复制文本到剪切板，可选显示按钮反馈"""
+    def _copy_to_clipboard(self, text):
+        """复制文本到剪切板"""
         QApplication.clipboard().setText(text)
-        if btn:
-            original_text = btn.text()
-            btn.setText("已复制")
-            # 使用弱引用避免 lambda 持有按钮引用导致内存问题
-            QTimer.singleShot(1000, lambda b=btn, t=original_text: b.setText(t) if b else None)
 
     def on_row_error(self, idx, msg):
-        self.task_table.setItem(idx, 2, QTableWidgetItem(f"失败: {msg}"))
-        self.task_table.item(idx, 2).setForeground(Qt.red)
+        self.task_model.set_error(idx, msg)
+
+    def show_task_menu(self, pos):
+        """任务列表右键菜单：调整选中的、还没开始上传的文件的优先级"""
+        rows = sorted({index.row() for index in self.task_table.selectionModel().selectedRows()})
+        if not rows:
+            index = self.task_table.indexAt(pos)
+            if not index.isValid():
+                return
+            rows = [index.row()]
+        running = getattr(self, 'thread', None) is not None and self.thread.isRunning()
+        menu = QMenu(self)
+        for text, priority in (("优先上传", 1), ("普通", 0), ("最后上传", -1)):
+            action = menu.addAction(text)
+            action.setEnabled(running)
+            action.triggered.connect(lambda _, p=priority: self.set_task_priority(rows, p))
+        menu.exec_(self.task_table.viewport().mapToGlobal(pos))
+
+    def set_task_priority(self, rows, priority):
+        for row in rows:
+            # 已经开始或结束的文件不受影响
+            if self.thread.set_priority(row, priority):
+                self.task_model.set_priority(row, priority)
+
+    def on_concurrency_changed(self, limit, throughput):
+        """引擎自动调整并发数后立即刷新状态栏"""
+        self.concurrency = limit
+        self.refresh_status()
+
+    def refresh_status(self):
+        """状态栏显示整批的进度、当前/平均速度、剩余时间和并发数"""
+        if not self.queue_busy or self.batch_stats is None:
+            return
+        snap = self.batch_stats.snapshot()
+        if not snap['elapsed']:
+            return  # 还没有文件开始上传，保留“正在扫描/正在上传”的提示
+        fmt_size, fmt_time = TransferStats.format_size, TransferStats.format_duration
+        text = (f"正在上传 {snap['done']}/{self.task_model.rowCount()} 个文件 · "
+                f"{fmt_size(snap['bytes_done'])} / {fmt_size(snap['bytes_total'])} · "
+                f"{fmt_size(snap['speed'])}/s（平均 {fmt_size(snap['avg_speed'])}/s）· "
+                f"剩余 {fmt_time(snap['eta'])}")
+        if self.concurrency:
+            text += f" · 并发 {self.concurrency}"
+        self.lbl_status.setText(text)
 
     def on_all_finished(self):
-        self.drop_area.setEnabled(True)
-        self.lbl_status.setText("✅ 队列处理完成")
+        """队列中的文件都处理完了（上传线程继续等待新文件），或者上传线程已经结束"""
+        if not self.queue_busy or self.scan_threads or (self.thread is not None and self.thread.pending()):
+            return  # 还有文件在遍历、排队或上传，或者这一轮已经结束
+        self.queue_busy = False
+        self.stats_timer.stop()
+        self.btn_clear.setEnabled(True)
+        # 保留本批次的汇总：总字节、用时、有效吞吐量和单文件耗时分位数
+        summary = TransferStats.describe_summary(self.batch_stats.summary()) if self.batch_stats else ""
+        self.lbl_status.setToolTip(summary)
+        self.lbl_status.setText(f"✅ 队列处理完成：{summary}" if summary else "✅ 队列处理完成")
 
         # 自动复制逻辑 (只复制链接)
         config = ConfigManager.load_config()
-        if config.get('auto_copy', True) and self.tasks_data:
-            self.copy_all(mode="url", silent=True)
-            self.lbl_status.setText("✅ 已自动复制链接到剪切板")
+        if config.get('auto_copy', True) and any(i >= self.round_first for i in self.tasks_data):
+            self.copy_all(mode="url", silent=True, first=self.round_first)
+            self.lbl_status.setText(f"✅ 已自动复制链接到剪切板（{summary}）" if summary else "✅ 已自动复制链接到剪切板")
 
-    def copy_all(self, mode="url", silent=False):
-        """批量复制所有文件的链接"""
+    def copy_all(self, mode="url", silent=False, first=0):
+        """批量复制所有文件的链接；first 之前的行不复制"""
         if not self.tasks_data: return
 
         # 按索引排序，保证顺序和上传顺序一致
-        sorted_indices = sorted(self.tasks_data.keys())
+        sorted_indices = sorted(i for i in self.tasks_data if i >= first)
         lines = []
         for i in sorted_indices:
             data = self.tasks_data[i]
@@ -943,25 +1635,41 @@ class MainWindow(QMainWindow):
             QMessageBox.information(self, "复制成功", f"已将 {len(lines)} 条记录复制为 {desc} 格式。")
 
     def clear_table(self):
-        self.task_table.setRowCount(0)
+        """清空列表；只在队列空闲时可用（上传中按钮禁用）。
+        空闲的上传线程随之结束，下次拖入时新建线程，编号从 0 开始"""
+        if self.queue_busy:
+            return
+        if self.thread is not None and self.thread.isRunning():
+            self.thread.finish_input()
+        self.task_model.clear()
         self.tasks_data = {}
+        self.batch_stats = None
+        self.round_first = 0
 
     def closeEvent(self, event):
         """窗口关闭时清理资源
 
         停止正在运行的上传线程，等待最多 2 秒让线程优雅退出。
         这样可以防止窗口关闭时线程仍在后台运行。
+        未完成的任务保留在任务日志中，下次启动时可以续传。
         """
-        # 停止正在运行的上传线程
+        # 停止文件夹遍历和正在运行的上传线程
+        self.stop_scan()
+        if self.prewarm_thread is not None:
+            self.prewarm_thread.wait(2000)
         if hasattr(self, 'thread') and self.thread is not None and hasattr(self.thread, 'isRunning'):
             if self.thread.isRunning():
                 self.thread.stop()
                 self.thread.wait(2000)  # 等待最多 2 秒
+        # 把尚未提交的历史记录写入磁盘
+        HistoryManager.flush()
         # 接受关闭事件
         event.accept()
 
 
 if __name__ == "__main__":
+    # 图片优化使用进程池，打包成 exe 后子进程需要这一行才不会再启动一个窗口
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setStyleSheet(STYLESHEET)
     font = QFont("Microsoft YaHei UI", 10)  # 统一字体
@@ -17,3 +17,25 @@ def qtbot(qapp, request):
     from pytestqt.qtbot import QtBot
     result = QtBot(request)
     return result
+
+
+@pytest.fixture(autouse=True)
+def isolated_data_files(tmp_path, monkeypatch):
+    """配置、历史记录、任务日志、去重索引、图片缓存写到临时目录，并清空 OSS 客户端和配置缓存，避免测试之间以及与本机真实数据互相影响"""
+    import src.core
+    monkeypatch.setattr(src.core, 'CONFIG_FILE', str(tmp_path / 'config.json'))
+    monkeypatch.setattr(src.core, 'HISTORY_FILE', str(tmp_path / 'history.json'))
+    monkeypatch.setattr(src.core, 'HISTORY_DB', str(tmp_path / 'history.db'))
+    monkeypatch.setattr(src.core, 'JOURNAL_FILE', str(tmp_path / 'jobs.jsonl'))
+    monkeypatch.setattr(src.core, 'DEDUP_FILE', str(tmp_path / 'dedup.jsonl'))
+    monkeypatch.setattr(src.core, 'IMAGE_CACHE_DIR', str(tmp_path / 'image_cache'))
+    # 预热会向 OSS 发真实的 HEAD 请求，测试中换成空操作；需要测试预热本身的用例自己换回来
+    monkeypatch.setattr(src.core.ClientCache, 'prewarm', staticmethod(lambda config, connections=None: None))
+    src.core.DedupIndex.reset()
+    src.core.ClientCache.invalidate()
+    src.core.ConfigManager.invalidate()
+    yield
+    src.core.HistoryManager.flush()
+    src.core.HistoryManager.close()
+    src.core.DedupIndex.reset()
+    src.core.ClientCache.invalidate()
@@ -0,0 +1,170 @@
+"""测试命令行上传入口"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from src import cli
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+
+def _write_config(tmp_path, **overrides):
+    config = {
+        'access_key_id': 'test_key',
+        'access_key_secret': 'test_secret',
+        'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+        'bucket_name': 'test-bucket',
+        'custom_domain': '',
+        'upload_path': 'uploads',
+        'use_random_name': False,
+        'url_expire_time': 0,
+        'dedup_enabled': False
+    }
+    config.update(overrides)
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_cli_does_not_import_qt_or_oss2():
+    """测试命令行模块不会导入 PyQt5，oss2 也只在真正上传时才导入"""
+    code = ("import sys; import src.cli; "
+            "print(sorted({m.split('.')[0] for m in sys.modules} & {'PyQt5', 'oss2'}))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_put_prints_urls_in_input_order(tmp_path, capsys):
+    """测试并发上传时仍按输入顺序每行输出一个链接"""
+    files = []
+    for i in range(5):
+        path = tmp_path / f"file{i}.txt"
+        path.write_text(f"content {i}")
+        files.append(str(path))
+
+    lock = threading.Lock()
+    in_flight, peak = [0], [0]
+
+    def put_object(key, path, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        # 第一个文件最慢，验证输出不会乱序
+        time.sleep(0.2 if key.endswith("file0.txt") else 0.02)
+        with lock:
+            in_flight[0] -= 1
+
+    mock_bucket = MagicMock()
+    mock_bucket.put_object.side_effect = put_object
+
+    with patch('oss2.Bucket', return_value=mock_bucket):
+        code = cli.main(["put", *files, "-j", "3", "--config", _write_config(tmp_path), "--no-history"])
+
+    assert code == cli.EXIT_OK
+    assert capsys.readouterr().out.splitlines() == [
+        f"https://test-bucket.oss-cn-hangzhou.aliyuncs.com/uploads/file{i}.txt" for i in range(5)]
+    assert 1 < peak[0] <= 3
+
+
+def test_put_jsonl_reports_failures_with_exit_code(tmp_path, capsys):
+    """测试 JSON 行输出以及有文件失败时退出码为 1"""
+    good = tmp_path / "good.txt"
+    good.write_text("ok")
+    bad = tmp_path / "bad.txt"
+    bad.write_text("bad")
+
+    def put_object(key, path, **kwargs):
+        if key.endswith("bad.txt"):
+            raise IOError("network down")
+
+    mock_bucket = MagicMock()
+    mock_bucket.put_object.side_effect = put_object
+
+    with patch('oss2.Bucket', return_value=mock_bucket):
+        code = cli.main(["put", str(good), str(bad), str(tmp_path / "missing.txt"),
+                         "-o", "jsonl", "--config", _write_config(tmp_path), "--no-history"])
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert code == cli.EXIT_FAILED
+    assert [(r['path'], r['ok']) for r in records] == [
+        (str(good), True), (str(bad), False), (str(tmp_path / "missing.txt"), False)]
+    assert records[0]['url'].endswith("/uploads/good.txt")
+    assert records[1]['error'] == "network down"
+
+
+def test_put_jsonl_stdout_has_only_records_when_core_warns(tmp_path, capsys):
+    """测试核心模块的警告（这里是没有 brotli 时改用 gzip）写到标准错误，标准输出每行都是 JSON"""
+    import importlib.util
+    path = tmp_path / "app.log"
+    path.write_text("line\n" * 1000)
+    find_spec = importlib.util.find_spec
+
+    def no_brotli(name, *args):
+        return None if name == "brotli" else find_spec(name, *args)
+
+    def read_all(key, data, **kwargs):
+        for _ in data:
+            pass
+    mock_bucket = MagicMock()
+    mock_bucket.put_object.side_effect = read_all
+
+    with patch('oss2.Bucket', return_value=mock_bucket), \
+            patch('importlib.util.find_spec', side_effect=no_brotli):
+        code = cli.main(["put", str(path), "--compress", "br", "-o", "jsonl",
+                         "--config", _write_config(tmp_path), "--no-history"])
+
+    out, err = capsys.readouterr()
+    assert code == cli.EXIT_OK
+    assert [json.loads(line)['ok'] for line in out.splitlines()] == [True]
+    assert "未安装 brotli" in err
+
+
+def test_stdin_paths_are_read_lazily(tmp_path, monkeypatch):
+    """测试从标准输入读取路径时边读边产出，不等上游结束"""
+    first = tmp_path / "a.txt"
+    first.write_text("a")
+    read = []
+
+    def stdin():
+        for line in (f"{first}\n", "\n", "late.txt\n"):
+            read.append(line)
+            yield line
+    monkeypatch.setattr(sys, 'stdin', stdin())
+
+    entries = cli.iter_entries(["-"], "", "")
+    assert next(entries) == (str(first), '')
+    assert read == [f"{first}\n"]
+    assert list(entries) == [("late.txt", '')]
+
+
+def test_put_stats_prints_summary_to_stderr(tmp_path, capsys):
+    """测试 --stats 在标准错误输出整批汇总，标准输出仍然只有链接"""
+    path = tmp_path / "a.txt"
+    path.write_text("x" * 2048)
+
+    with patch('oss2.Bucket', return_value=MagicMock()):
+        code = cli.main(["put", str(path), "--stats", "--config", _write_config(tmp_path), "--no-history"])
+
+    out, err = capsys.readouterr()
+    assert code == cli.EXIT_OK
+    assert out.splitlines() == ["https://test-bucket.oss-cn-hangzhou.aliyuncs.com/uploads/a.txt"]
+    assert "1 个文件，2.0 KB" in err and "p50" in err
+
+
+def test_put_without_config_is_usage_error(tmp_path, capsys, monkeypatch):
+    """测试缺少配置时退出码为 2，且不会尝试上传"""
+    import src.core
+    monkeypatch.setattr(src.core, 'CONFIG_FILE', str(tmp_path / "absent.json"))
+    for env in cli.ENV_OVERRIDES:
+        monkeypatch.delenv(env, raising=False)
+
+    with patch('oss2.Bucket') as mock_bucket_cls:
+        code = cli.main(["put", __file__])
+
+    assert code == cli.EXIT_USAGE
+    assert "未配置" in capsys.readouterr().err
+    assert not mock_bucket_cls.called
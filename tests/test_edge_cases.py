@@ -12,8 +12,10 @@ from src.main import MainWindow, BatchUploadThread, ConfigManager
 
 
 @pytest.fixture
-def main_window(qapp):
+def main_window(qapp, monkeypatch):
     """创建 MainWindow 实例用于测试"""
+    # 启动检查在没有配置时会弹出模态的设置窗口，测试中不执行
+    monkeypatch.setattr(MainWindow, 'startup_checks', MagicMock())
     window = MainWindow()
     yield window
     # Clean up
@@ -39,7 +41,7 @@ def test_upload_empty_file_list(main_window):
         main_window.start_batch_upload([])
 
         # Should handle empty list gracefully
-        assert main_window.task_table.rowCount() == 0
+        assert main_window.task_model.rowCount() == 0
 
 
 def test_upload_without_config(main_window):
@@ -76,7 +78,7 @@ def test_copy_empty_tasks_data(main_window):
     main_window.copy_all(mode="url", silent=True)
 
     # Verify table row count is still 0
-    assert main_window.task_table.rowCount() == 0
+    assert main_window.task_model.rowCount() == 0
 
 
 def test_special_characters_in_filename():
@@ -0,0 +1,782 @@
+"""测试不依赖 Qt 的上传引擎"""
+import asyncio
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+from src.core import UploadEngine, HistoryManager, ClientCache
+
+# conftest 会把预热换成空操作，这里在导入时留下真实实现
+REAL_PREWARM = ClientCache.__dict__['prewarm']
+
+CONFIG = {
+    'access_key_id': 'test_key',
+    'access_key_secret': 'test_secret',
+    'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+    'bucket_name': 'test-bucket',
+    'custom_domain': 'cdn.example.com',
+    'upload_path': 'uploads',
+    'use_random_name': False,
+    'url_expire_time': 0,
+    'upload_concurrency': 2
+}
+
+
+def _files(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"file{i}.txt"
+        path.write_text(f"content {i}")
+        paths.append(str(path))
+    return paths
+
+
+def _bucket(delay=0.0, fail=()):
+    def put_object(key, path, progress_callback=None, **kwargs):
+        if any(key.endswith(name) for name in fail):
+            raise IOError("boom")
+        progress_callback(5, 10)
+        time.sleep(delay)
+        progress_callback(10, 10)
+
+    bucket = MagicMock()
+    bucket.put_object.side_effect = put_object
+    return bucket
+
+
+def test_upload_many_yields_events_and_records_history(tmp_path):
+    """测试同步接口产出进度和结果事件，并写入历史记录"""
+    paths = _files(tmp_path, 4)
+    engine = UploadEngine(CONFIG)
+
+    with patch('oss2.Bucket', return_value=_bucket(delay=0.05, fail=("file2.txt",))):
+        engine.connect()
+        events = list(engine.upload_many(paths))
+
+    results = {e['index']: e for e in events if e['type'] in ('success', 'error')}
+    assert sorted(results) == [0, 1, 2, 3]
+    assert results[0]['url'] == "https://cdn.example.com/uploads/file0.txt"
+    assert results[2] == {'type': 'error', 'index': 2, 'path': paths[2], 'error': "boom"}
+    progress = [u for e in events if e['type'] == 'progress' for u in e['updates']]
+    assert (0, 10, 10) in progress
+
+    HistoryManager.flush()
+    assert sorted(r['filename'] for r in HistoryManager.load_history()) == ["file0.txt", "file1.txt", "file3.txt"]
+
+
+def test_aupload_many_is_an_async_iterator(tmp_path):
+    """测试 asyncio 接口：上传期间事件循环不被阻塞"""
+    paths = _files(tmp_path, 3)
+    engine = UploadEngine(CONFIG, history=False)
+
+    async def collect():
+        ticks = 0
+        results = []
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        async for event in engine.aupload_many(paths):
+            if event['type'] == 'success':
+                results.append(event['index'])
+        task.cancel()
+        return sorted(results), ticks
+
+    with patch('oss2.Bucket', return_value=_bucket(delay=0.1)):
+        engine.connect()
+        results, ticks = asyncio.run(collect())
+
+    assert results == [0, 1, 2]
+    assert ticks >= 5
+
+
+def test_breaking_out_of_upload_many_stops_engine(tmp_path):
+    """测试提前结束迭代会停止引擎，剩余文件不再上传"""
+    paths = _files(tmp_path, 10)
+    engine = UploadEngine(dict(CONFIG, upload_concurrency=1), history=False)
+    bucket = _bucket(delay=0.05)
+
+    with patch('oss2.Bucket', return_value=bucket):
+        engine.connect()
+        for event in engine.upload_many(paths):
+            if event['type'] == 'success':
+                break
+
+    assert not engine.is_running()
+    assert bucket.put_object.call_count < len(paths)
+
+
+def test_bucket_and_session_are_shared_across_batches(tmp_path, monkeypatch):
+    """测试连续几批上传复用同一个 Bucket/连接池，相关配置保存后缓存失效"""
+    import oss2
+    import src.core
+    from src.core import ClientCache, ConfigManager
+
+    monkeypatch.setattr(src.core, 'CONFIG_FILE', str(tmp_path / 'config.json'))
+    config = dict(CONFIG, upload_concurrency=3, multipart_threads=4)
+    ConfigManager.save_config(config)
+
+    with patch('oss2.Bucket', side_effect=lambda *a, **kw: MagicMock()) as bucket_cls:
+        first = UploadEngine(config, history=False)
+        first.connect()
+        second = UploadEngine(dict(config), history=False)
+        second.connect()
+
+        assert bucket_cls.call_count == 1
+        assert first.bucket is second.bucket
+        session = bucket_cls.call_args.kwargs['session']
+        assert isinstance(session, oss2.Session)
+        assert session.session.get_adapter('https://').__dict__['_pool_maxsize'] == 12
+
+        # 与连接无关的配置不影响缓存
+        ConfigManager.save_config(dict(config, upload_path='images'))
+        assert ClientCache.get_bucket(config) is first.bucket
+
+        ConfigManager.save_config(dict(config, access_key_secret='rotated'))
+        assert ClientCache.get_bucket(config) is not first.bucket
+        assert bucket_cls.call_count == 2
+
+
+def test_prewarm_opens_pooled_connections_and_reports_saving(monkeypatch):
+    """测试预热并行建立连接、报告节省的时间，短时间内不重复预热"""
+    monkeypatch.setattr(ClientCache, 'prewarm', REAL_PREWARM)
+
+    calls = []
+
+    def object_exists(key):
+        calls.append(key)
+        # 前两次是冷连接（含握手），之后的请求走已建立的连接
+        time.sleep(0.08 if len(calls) <= 2 else 0.005)
+        return False
+
+    bucket = MagicMock()
+    bucket.object_exists.side_effect = object_exists
+
+    with patch('oss2.Bucket', return_value=bucket):
+        result = ClientCache.prewarm(CONFIG)
+        assert ClientCache.prewarm(CONFIG) is None
+
+    assert calls == [ClientCache.PREWARM_KEY] * 3
+    assert result['connect_ms'] >= 70
+    assert 50 <= result['saved_ms'] < result['connect_ms']
+
+
+def test_concurrency_controller_probes_up_and_backs_off():
+    """测试 AIMD：吞吐量提高时逐个加并发，不再提高时退回，拥塞时减半且不低于下限"""
+    from src.core import ConcurrencyController
+
+    now = [0.0]
+    controller = ConcurrencyController(2, 1, 5, clock=lambda: now[0])
+    assert controller.poll() and controller.limit == 2
+
+    def window(throughput):
+        # 每个窗口都把并发用满，再按给定吞吐量发送数据
+        for _ in range(controller.limit - controller.in_flight):
+            assert controller.acquire(timeout=0)
+        controller.add_bytes(throughput)
+        now[0] += controller.INTERVAL
+        return controller.poll()
+
+    assert window(100) and controller.limit == 3
+    assert window(150) and controller.limit == 4
+    # 加到 4 之后吞吐量没有提高：退回 3，并保持一段时间
+    assert window(151) and controller.limit == 3
+    for _ in range(controller.HOLD_WINDOWS):
+        assert not window(150)
+    assert window(150) and controller.limit == 4
+
+    controller.on_congestion()
+    assert controller.limit == 2
+    assert not controller.acquire(timeout=0.01)  # 在途任务数降到新的上限以下之前不开始新任务
+    controller.on_congestion()
+    assert controller.limit == 2  # 同一个窗口内只减一次
+    now[0] += controller.INTERVAL
+    controller.on_congestion()
+    assert controller.limit == 1
+
+
+def test_congestion_errors_reduce_engine_concurrency(tmp_path):
+    """测试网络错误和 5xx 让引擎降低并发并报告，权限等普通错误不影响并发"""
+    import oss2
+
+    paths = _files(tmp_path, 6)
+    config = dict(CONFIG, upload_concurrency=4, adaptive_concurrency=True,
+                  concurrency_min=1, concurrency_max=8, retry_attempts=0)
+    errors = {"file1.txt": oss2.exceptions.RequestError(IOError("timed out")),
+              "file2.txt": oss2.exceptions.ServerError(503, {}, b'', {}),
+              "file3.txt": oss2.exceptions.ServerError(403, {}, b'', {})}
+
+    def put_object(key, path, progress_callback=None, **kwargs):
+        time.sleep(0.02)
+        for name, error in errors.items():
+            if key.endswith(name):
+                raise error
+        progress_callback(10, 10)
+
+    bucket = MagicMock()
+    bucket.put_object.side_effect = put_object
+    engine = UploadEngine(config, history=False)
+
+    with patch('oss2.Bucket', return_value=bucket):
+        engine.connect()
+        events = list(engine.upload_many(paths))
+
+    # 两个拥塞错误几乎同时发生，只减半一次；403 不影响并发
+    limits = [e['limit'] for e in events if e['type'] == 'concurrency']
+    assert limits == [4, 2]
+    assert sum(e['type'] == 'success' for e in events) == 3
+
+
+def test_transient_errors_are_retried_with_backoff(tmp_path):
+    """测试临时性错误按退避重试并产出 retry 事件，本地文件错误和 4xx 不重试"""
+    import oss2
+
+    paths = _files(tmp_path, 3)
+    engine = UploadEngine(dict(CONFIG, retry_attempts=2, retry_backoff=0.01), history=False)
+    attempts = {}
+
+    def put_object(key, path, progress_callback=None, **kwargs):
+        name = os.path.basename(key)
+        attempts[name] = attempts.get(name, 0) + 1
+        if name == "file0.txt" and attempts[name] <= 2:
+            raise oss2.exceptions.ServerError(503, {}, b'', {})
+        if name == "file1.txt":
+            raise oss2.exceptions.ServerError(403, {}, b'', {})
+        if name == "file2.txt":
+            raise oss2.exceptions.RequestError(TimeoutError("timed out"))
+        progress_callback(10, 10)
+
+    bucket = MagicMock()
+    bucket.put_object.side_effect = put_object
+
+    with patch('oss2.Bucket', return_value=bucket):
+        engine.connect()
+        events = list(engine.upload_many(paths))
+
+    assert attempts == {"file0.txt": 3, "file1.txt": 1, "file2.txt": 3}
+    retries = [(e['index'], e['retries']) for e in events if e['type'] == 'retry']
+    assert sorted(retries) == [(0, 1), (0, 2), (2, 1), (2, 2)]
+    results = {e['index']: e['type'] for e in events if e['type'] in ('success', 'error')}
+    assert results == {0: 'success', 1: 'error', 2: 'error'}
+
+
+def test_transfer_stats_rates_eta_and_summary():
+    """测试传输统计：滑动窗口速度、剩余时间、失败文件不计入剩余字节，以及结束后的分位数汇总"""
+    from src.core import TransferStats
+
+    now = [100.0]
+    stats = TransferStats(clock=lambda: now[0])
+    stats.feed({'type': 'queued', 'files': [(0, 1000), (1, 1000), (2, 4000), (3, None)]})
+    for idx in (0, 1, 2):
+        stats.feed({'type': 'started', 'index': idx, 'path': f"f{idx}"})
+
+    now[0] += 1
+    stats.feed({'type': 'progress', 'updates': [(0, 500, 1000), (2, 1000, 4000)]})
+    row = stats.row(2)
+    assert row['speed'] == 1000 and row['eta'] == 3.0
+    snap = stats.snapshot()
+    assert (snap['bytes_done'], snap['bytes_total']) == (1500, 6000)
+    assert snap['speed'] == 1500 and snap['eta'] == 3.0
+
+    now[0] += 1
+    stats.feed({'type': 'success', 'index': 0, 'path': "f0", 'url': "u"})
+    stats.feed({'type': 'error', 'index': 1, 'path': "f1", 'error': "x"})
+    now[0] += 2
+    stats.feed({'type': 'success', 'index': 2, 'path': "f2", 'url': "u"})
+    # 一直停顿时窗口内没有新数据，当前速度降为 0
+    now[0] += TransferStats.WINDOW + 1
+    snap = stats.snapshot()
+    assert (snap['done'], snap['failed'], snap['bytes_total'], snap['bytes_done']) == (2, 1, 5000, 5000)
+    assert snap['speed'] == 0 and snap['eta'] is None
+
+    summary = stats.summary()
+    assert summary['files'] == 2 and summary['failed'] == 1
+    assert summary['bytes'] == 5000 and summary['wall_time'] == 4.0
+    assert summary['throughput'] == 1250
+    assert (summary['p50'], summary['p95']) == (2.0, 4.0)
+    assert "p95 4.0 秒" in TransferStats.describe_summary(summary)
+
+    # 持续接收新文件的队列：空闲一段时间后再加入的文件，空闲时间不计入用时
+    now[0] += 100
+    stats.feed({'type': 'queued', 'files': [(4, 1000)]})
+    stats.feed({'type': 'started', 'index': 4, 'path': "f4"})
+    now[0] += 1
+    stats.feed({'type': 'success', 'index': 4, 'path': "f4", 'url': "u"})
+    assert stats.summary()['wall_time'] == 5.0 and stats.snapshot()['elapsed'] == 5.0
+
+
+def test_transfer_stats_resumed_job_does_not_count_existing_parts_as_speed():
+    """测试续传：第一次进度包含服务端已有的分片，计入进度但不计入速度和吞吐量"""
+    from src.core import TransferStats
+
+    now = [100.0]
+    stats = TransferStats(clock=lambda: now[0])
+    stats.feed({'type': 'queued', 'files': [(0, 10000)]})
+    stats.feed({'type': 'started', 'index': 0, 'path': "big", 'resumed': True})
+    stats.feed({'type': 'progress', 'updates': [(0, 8000, 10000)]})
+    assert stats.row(0)['consumed'] == 8000 and stats.row(0)['speed'] == 0
+    assert stats.snapshot()['speed'] == 0
+
+    now[0] += 1
+    stats.feed({'type': 'progress', 'updates': [(0, 9000, 10000)]})
+    row, snap = stats.row(0), stats.snapshot()
+    assert row['eta'] == 1.0
+    assert snap['bytes_done'] == 9000 and snap['speed'] == 1000
+
+    now[0] += 1
+    stats.feed({'type': 'success', 'index': 0, 'path': "big", 'url': "u"})
+    assert stats.row(0)['speed'] == 1000
+    assert stats.summary()['bytes'] == 10000 and stats.summary()['throughput'] == 1000
+
+
+def test_images_are_optimized_in_pipeline_before_upload(tmp_path, monkeypatch):
+    """测试图片优化：编码与上传重叠，上传的是变小后的文件且改用 .webp 对象名，没变小时上传原图"""
+    from concurrent.futures import ThreadPoolExecutor
+    from src.core import ImageOptimizer, TransferStats
+
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"shot{i}.png"
+        path.write_bytes(b"x" * 1000)
+        paths.append(str(path))
+    (tmp_path / "notes.txt").write_text("text")
+    paths.append(str(tmp_path / "notes.txt"))
+
+    timeline = []
+
+    def encode(path, rules, cache_dir):
+        timeline.append(("encode", os.path.basename(path)))
+        time.sleep(0.03)
+        if path.endswith("shot3.png"):
+            return None, 1000, 1000
+        out = os.path.join(str(tmp_path), os.path.basename(path) + ".webp")
+        with open(out, 'wb') as f:
+            f.write(b"w" * 400)
+        return out, 1000, 400
+
+    uploaded = {}
+
+    def put_object(key, data, progress_callback=None, **kwargs):
+        timeline.append(("upload", os.path.basename(key)))
+        uploaded[key] = data.path
+        time.sleep(0.03)
+        progress_callback(len(data), len(data))
+        timeline.append(("uploaded", os.path.basename(key)))
+
+    bucket = MagicMock()
+    bucket.put_object.side_effect = put_object
+    monkeypatch.setattr(ImageOptimizer, 'available', staticmethod(lambda: True))
+    monkeypatch.setattr(ImageOptimizer, 'encode', staticmethod(encode))
+    monkeypatch.setattr(ImageOptimizer, '_pool', ThreadPoolExecutor(max_workers=2))
+    engine = UploadEngine(dict(CONFIG, upload_concurrency=1, adaptive_concurrency=False,
+                               image_optimize=True, dedup_enabled=False), history=False)
+    stats = TransferStats()
+
+    with patch('oss2.Bucket', return_value=bucket):
+        engine.connect()
+        events = list(engine.upload_many(paths))
+    for event in events:
+        stats.feed(event)
+    ImageOptimizer.shutdown()
+
+    assert sum(e['type'] == 'success' for e in events) == 5
+    assert uploaded["uploads/shot0.webp"] == str(tmp_path / "shot0.png.webp")
+    assert uploaded["uploads/shot3.png"] == paths[3]
+    assert uploaded["uploads/notes.txt"] == paths[4]
+    assert sorted(e['index'] for e in events if e['type'] == 'optimized') == [0, 1, 2]
+    # 第一个文件上传完成之前，后面的图片已经开始编码
+    assert timeline.index(("encode", "shot1.png")) < timeline.index(("uploaded", "shot0.webp"))
+    summary = stats.summary()
+    assert summary['saved_bytes'] == 1800 and summary['bytes'] == 3 * 400 + 1000 + 4
+    assert "节省流量" in TransferStats.describe_summary(summary)
+
+
+def test_image_optimizer_encodes_and_caches_with_pillow(tmp_path):
+    """测试真实编码（需要 Pillow）：PNG 转 WebP、缩小最长边、相同内容命中缓存"""
+    import pytest
+    Image = pytest.importorskip("PIL.Image")
+    from src.core import ImageOptimizer
+
+    source = tmp_path / "big.png"
+    Image.effect_noise((800, 400), 64).convert("RGB").save(source)
+    cache = str(tmp_path / "cache")
+    rules = (True, 200, 80, True)
+
+    out, original, size = ImageOptimizer.encode(str(source), rules, cache)
+    assert out.endswith(".webp") and size < original
+    with Image.open(out) as img:
+        assert img.size == (200, 100)
+    assert ImageOptimizer.encode(str(source), rules, cache) == (out, original, size)
+    assert ImageOptimizer.rename("a/big.png", out) == "a/big.webp"
+
+
+def test_image_cache_is_pruned_while_queue_stays_open(monkeypatch):
+    """测试上传队列一直开着时，每用掉 PRUNE_EVERY 个编码结果清理一次缓存，删除最久未用的文件"""
+    import src.core
+    from src.core import ImageOptimizer
+
+    cache = src.core.IMAGE_CACHE_DIR
+    os.makedirs(cache)
+    for i in range(4):
+        path = os.path.join(cache, f"{i}.webp")
+        with open(path, 'wb') as f:
+            f.write(b"x" * 10)
+        os.utime(path, (1000 + i, 1000 + i))
+    monkeypatch.setattr(ImageOptimizer, 'PRUNE_EVERY', 3)
+    monkeypatch.setattr(ImageOptimizer, 'CACHE_LIMIT', 25)
+    monkeypatch.setattr(ImageOptimizer, '_since_prune', 0)
+    monkeypatch.setattr(ImageOptimizer, '_pinned', {})
+
+    ImageOptimizer.note_encoded()
+    ImageOptimizer.note_encoded()
+    assert len(os.listdir(cache)) == 4
+    # 正在上传的编码结果不删除，改为删除下一个最旧的
+    assert ImageOptimizer.pin(os.path.join(cache, "0.webp"))
+    ImageOptimizer.note_encoded()
+    assert sorted(os.listdir(cache)) == ["0.webp", "3.webp"]
+    ImageOptimizer.unpin(os.path.join(cache, "0.webp"))
+    assert ImageOptimizer._pinned == {}
+    assert not ImageOptimizer.pin(os.path.join(cache, "1.webp"))
+
+
+def test_turning_off_image_optimization_applies_to_running_queue(tmp_path, monkeypatch):
+    """测试上传过程中关闭图片优化：之后开始的图片上传原图，按旧设置提前提交的编码作废"""
+    from concurrent.futures import ThreadPoolExecutor
+    from src.core import ImageOptimizer
+
+    paths = []
+    for i in range(2):
+        path = tmp_path / f"shot{i}.png"
+        path.write_bytes(b"x" * 1000)
+        paths.append(str(path))
+
+    def encode(path, rules, cache_dir):
+        assert rules is not None
+        out = os.path.join(str(tmp_path), os.path.basename(path) + ".webp")
+        with open(out, 'wb') as f:
+            f.write(b"w" * 400)
+        return out, 1000, 400
+
+    uploaded = {}
+
+    def put_object(key, data, progress_callback=None, **kwargs):
+        uploaded[key] = data.path
+        if not uploaded.keys() - {key}:
+            # 第一个文件上传时关闭图片优化，第二个文件的编码已经提前提交
+            engine.reconfigure(dict(engine.config, image_optimize=False), {'image_optimize'})
+
+    bucket = MagicMock()
+    bucket.put_object.side_effect = put_object
+    monkeypatch.setattr(ImageOptimizer, 'available', staticmethod(lambda: True))
+    monkeypatch.setattr(ImageOptimizer, 'encode', staticmethod(encode))
+    monkeypatch.setattr(ImageOptimizer, '_pool', ThreadPoolExecutor(max_workers=2))
+    engine = UploadEngine(dict(CONFIG, upload_concurrency=1, adaptive_concurrency=False,
+                               image_optimize=True, dedup_enabled=False), history=False)
+
+    with patch('oss2.Bucket', return_value=bucket):
+        engine.connect()
+        events = list(engine.upload_many([paths]))
+
+    assert sum(e['type'] == 'success' for e in events) == 2
+    assert uploaded == {"uploads/shot0.webp": os.path.join(str(tmp_path), "shot0.png.webp"),
+                        "uploads/shot1.png": paths[1]}
+    assert ImageOptimizer._pinned == {}
+
+
+def test_compression_stream_is_valid_gzip_and_reports_source_progress(tmp_path):
+    """测试流式压缩：分多块读取，输出是完整的 gzip，进度按原文件字节回调"""
+    import gzip
+    from src.core import Compressor, CompressionStream
+
+    path = tmp_path / "app.log"
+    content = b"".join(f"line {i} ok\n".encode() for i in range(100000))
+    path.write_bytes(content)
+    assert Compressor.choose(str(path), Compressor.rules({'compress_enabled': True})) == 'gzip'
+    assert Compressor.choose(str(path), Compressor.rules({'compress_enabled': True,
+                                                          'compress_min_size': len(content) + 1})) is None
+    assert Compressor.rules({}) is None
+    for name in ("app.log.gz", "data.json.gz", "style.css.br"):
+        packed = tmp_path / name
+        packed.write_bytes(content[:4096])
+        assert Compressor.choose(str(packed), Compressor.rules({'compress_enabled': True})) is None
+
+    updates = []
+    stream = CompressionStream(str(path), 'gzip', lambda consumed, total: updates.append((consumed, total)))
+    chunks = list(stream)
+
+    assert len(updates) > 1 and updates[-1] == (len(content), len(content))
+    assert gzip.decompress(b"".join(chunks)) == content
+    assert stream.consumed == len(content) and stream.size == sum(len(c) for c in chunks)
+
+
+def test_hashing_reader_computes_digests_while_reading(tmp_path):
+    """测试单次读取：按 oss2 的小块大小读出原内容，读完后给出 MD5/CRC64，与服务端 CRC64 不一致时报错"""
+    import hashlib
+    import oss2
+    import pytest
+    from src.core import HashingReader
+
+    content = os.urandom(HashingReader.BUFFER_SIZE * 2 + 12345)
+    path = tmp_path / "data.bin"
+    path.write_bytes(content)
+    crc = oss2.utils.Crc64(0)
+    crc.update(content[100:])
+
+    reader = HashingReader(str(path), offset=100)
+    assert len(reader) == len(content) - 100
+    chunks = [reader.read(8192)]
+    assert reader.md5 is None and reader.crc is None  # 没读完时没有摘要
+    chunks.append(reader.read())
+    assert b"".join(chunks) == content[100:] and reader.read(8192) == b""
+    assert reader.md5 == hashlib.md5(content[100:]).hexdigest()
+    assert reader.crc == crc.crc
+
+    HashingReader.check('put object', reader.crc, MagicMock(crc=crc.crc))
+    HashingReader.check('put object', reader.crc, MagicMock(crc=None))
+    with pytest.raises(oss2.exceptions.InconsistentError):
+        HashingReader.check('put object', reader.crc, MagicMock(crc=crc.crc + 1))
+
+
+def test_dedup_uses_digest_computed_during_upload(tmp_path, monkeypatch):
+    """测试去重不再为新文件单独读一遍：MD5 在上传时算出，再次上传同一文件时命中索引"""
+    import oss2
+    from src.core import DedupIndex
+
+    path = tmp_path / "report.txt"
+    path.write_bytes(b"quarterly numbers" * 1000)
+    crc = oss2.utils.Crc64(0)
+    crc.update(path.read_bytes())
+    sent = []
+
+    def put_object(key, data, progress_callback=None, **kwargs):
+        sent.append((key, data.read()))
+        return MagicMock(crc=crc.crc)
+
+    bucket = MagicMock()
+    bucket.put_object.side_effect = put_object
+    bucket.head_object.return_value = MagicMock(server_crc=crc.crc)
+    engine = UploadEngine(dict(CONFIG, dedup_enabled=True), history=False)
+    real_hash = DedupIndex.file_hash
+
+    with patch('oss2.Bucket', return_value=bucket):
+        engine.connect()
+        with patch.object(DedupIndex, 'file_hash', side_effect=AssertionError("不应单独读取文件")):
+            first = list(engine.upload_many([str(path)]))
+        assert [e['type'] for e in first if e['type'] in ('success', 'error')] == ['success']
+        assert sent == [("uploads/report.txt", path.read_bytes())]
+        # 再次上传：索引里有同样大小的对象，从缓存取哈希，不重新上传
+        with patch.object(DedupIndex, 'file_hash', side_effect=real_hash) as file_hash:
+            second = list(engine.upload_many([str(path)]))
+        assert file_hash.call_count == 1
+
+    assert [e['url'] for e in second if e['type'] == 'success'] == \
+        [e['url'] for e in first if e['type'] == 'success']
+    assert len(sent) == 1
+
+
+def test_config_is_cached_until_file_changes(tmp_path, monkeypatch):
+    """测试配置缓存：文件没变时不重新解析，外部修改或保存后重新加载并通知监听者"""
+    import json
+    import src.core
+    from src.core import ClientCache, ConfigManager
+
+    path = tmp_path / 'config.json'
+    monkeypatch.setattr(src.core, 'CONFIG_FILE', str(path))
+    path.write_text(json.dumps(CONFIG))
+    changes = []
+
+    def listener(config, changed):
+        changes.append(changed)
+    ConfigManager.add_listener(listener)
+    try:
+        with patch('src.core.json.load', side_effect=json.load) as parse:
+            first = ConfigManager.load_config()
+            first['upload_path'] = 'mutated'  # 返回的是副本
+            assert ConfigManager.load_config()['upload_path'] == 'uploads'
+            assert parse.call_count == 1
+
+            # 外部修改了文件（大小不同）
+            path.write_text(json.dumps(dict(CONFIG, upload_path='images/2024')))
+            assert ConfigManager.load_config()['upload_path'] == 'images/2024'
+            assert parse.call_count == 2 and changes == [{'upload_path'}]
+
+            # 保存后直接更新缓存，不再读文件；连接相关字段变化时客户端缓存失效
+            with patch.object(ClientCache, 'invalidate') as invalidate:
+                ConfigManager.save_config(dict(CONFIG, bucket_name='other-bucket', upload_path='images/2024'))
+            assert ConfigManager.load_config()['bucket_name'] == 'other-bucket'
+            assert parse.call_count == 2 and changes[-1] == {'bucket_name'}
+            invalidate.assert_called_once()
+    finally:
+        ConfigManager.remove_listener(listener)
+
+    engine = UploadEngine(CONFIG, history=False)
+    engine.reconfigure(dict(CONFIG, upload_path='new', retry_attempts=7), {'upload_path', 'retry_attempts'})
+    assert engine.get_object_name("/tmp/a.png") == "new/a.png" and engine.retry.retries == 7
+    assert not engine._reconnect
+    engine.reconfigure(dict(CONFIG, bucket_name='other'), {'bucket_name'})
+    assert engine._reconnect
+
+
+def test_scheduler_orders_by_size_priority_and_keeps_large_lane():
+    """测试上传调度：小文件优先、按顺序、右键优先级，以及大文件通道不被饿死也不占满名额"""
+    from src.core import UploadScheduler
+
+    def drain(scheduler, limit=1):
+        order = []
+        while True:
+            taken = scheduler.take(limit, timeout=0)
+            if not taken:
+                return order
+            order.append(taken[0])
+            scheduler.finish(taken[0])
+
+    sizes = [300, 100, 200, 100]
+    for policy, expected in (("sjf", [1, 3, 2, 0]), ("fifo", [0, 1, 2, 3])):
+        scheduler = UploadScheduler(policy, large_size=0)
+        for i, size in enumerate(sizes):
+            scheduler.add(i, {'size': size})
+        assert [i for i, _ in scheduler.upcoming(4)] == expected
+        # 0 号优先、1 号最后，优先级先于大小和顺序
+        assert scheduler.set_priority(0, 1) and scheduler.set_priority(1, -1)
+        expected = [0] + [i for i in expected if i not in (0, 1)] + [1]
+        assert [i for i, _ in scheduler.upcoming(2)] == expected[:2]
+        scheduler.close()
+        assert drain(scheduler) == expected
+        assert scheduler.take(1, timeout=0) is False
+
+    # 大文件通道：3 个名额时大文件最多占 2 个，始终留一个给小文件
+    scheduler = UploadScheduler("sjf", large_size=1000)
+    for i in range(3):
+        scheduler.add(i, {'size': 5000})
+    for i in range(3, 6):
+        scheduler.add(i, {'size': 10})
+    # 有小文件在等时，大文件通道空着才开始一个大文件
+    assert [scheduler.take(3, timeout=0)[0] for _ in range(3)] == [0, 3, 4]
+    assert [scheduler.take(3, timeout=0)[0] for _ in range(2)] == [5, 1]
+    assert scheduler.take(3, timeout=0) is None  # 大文件通道已满，剩下的名额留给新来的小文件
+    assert not scheduler.set_priority(0, 1) and scheduler.set_priority(2, 1)
+    scheduler.finish(0)
+    assert scheduler.take(3, timeout=0)[0] == 2
+    scheduler.close()
+    assert scheduler.take(3, timeout=0) is False
+
+
+def test_reconfigure_updates_running_batch_concurrency_and_order():
+    """测试上传过程中修改设置：并发上下限和上传顺序作用于进行中的批次"""
+    from src.core import ConcurrencyController, UploadScheduler
+
+    engine = UploadEngine(CONFIG, journal=False, history=False)
+    engine.controller = ConcurrencyController.from_config(CONFIG)
+    engine.scheduler = UploadScheduler("sjf", large_size=0)
+    for i, size in enumerate([300, 100, 200]):
+        engine.scheduler.add(i, {'size': size})
+    assert engine.controller.limit == 2
+
+    config = dict(CONFIG, upload_concurrency=5, schedule_policy='fifo')
+    engine.reconfigure(config, {'upload_concurrency', 'schedule_policy'})
+    assert (engine.controller.minimum, engine.controller.limit, engine.controller.maximum) == (5, 5, 5)
+    assert [i for i, _ in engine.scheduler.upcoming(3)] == [0, 1, 2]
+
+    # 打开自动调整：当前并发保留，限制在新的上下限之间
+    config = dict(config, adaptive_concurrency=True, concurrency_min=1, concurrency_max=3)
+    engine.reconfigure(config, {'adaptive_concurrency', 'concurrency_min', 'concurrency_max'})
+    assert (engine.controller.minimum, engine.controller.limit, engine.controller.maximum) == (1, 3, 3)
+
+
+def test_upload_many_starts_small_files_first(tmp_path):
+    """测试引擎按调度顺序开始上传：同一批中小文件先开始，事件编号仍是输入顺序"""
+    paths = []
+    for i, size in enumerate([3000, 10, 2000, 500]):
+        path = tmp_path / f"file{i}.bin"
+        path.write_bytes(b"x" * size)
+        paths.append(str(path))
+    engine = UploadEngine(dict(CONFIG, upload_concurrency=1, adaptive_concurrency=False,
+                               dedup_enabled=False), history=False)
+
+    with patch('oss2.Bucket', return_value=_bucket()):
+        engine.connect()
+        # 作为一批传入，保证调度时四个文件都已经在队列中
+        events = list(engine.upload_many([[(p, '') for p in paths]]))
+
+    started = [e['index'] for e in events if e['type'] == 'started']
+    assert started == [1, 3, 2, 0]
+    assert {e['index']: e['path'] for e in events if e['type'] == 'success'} == dict(enumerate(paths))
+
+
+def test_job_journal_clear_if_idle_keeps_jobs_added_meanwhile():
+    """测试空闲时清理任务日志不会删掉回放之后、删除之前新入队的任务"""
+    import threading
+    from src.core import JobJournal
+
+    done = JobJournal.add_jobs([{'path': '/tmp/a.txt', 'object_name': 'uploads/a.txt'}])[0]
+    JobJournal.mark(done['id'], 'done')
+    replay, threads, added = JobJournal._replay, [], []
+
+    def replay_then_add():
+        # 回放刚结束时另一个线程拖入了新文件
+        pending = replay()
+        thread = threading.Thread(target=lambda: added.extend(
+            JobJournal.add_jobs([{'path': '/tmp/b.txt', 'object_name': 'uploads/b.txt'}])))
+        thread.start()
+        thread.join(0.2)
+        threads.append(thread)
+        return pending
+
+    with patch.object(JobJournal, '_replay', staticmethod(replay_then_add)):
+        assert JobJournal.clear_if_idle()
+    threads[0].join()
+
+    assert [job['id'] for job in JobJournal.load_pending()] == [added[0]['id']]
+    assert not JobJournal.clear_if_idle()
+
+
+def test_job_journal_syncs_only_checkpoints():
+    """测试任务日志只在入队、初始化、完成和每隔 PART_SYNC_EVERY 个分片时 fsync"""
+    from src.core import JobJournal
+
+    job = JobJournal.add_jobs([{'path': '/tmp/c.bin', 'object_name': 'uploads/c.bin'}])[0]
+    with patch('src.core.os.fsync') as fsync:
+        JobJournal.mark(job['id'], 'start')
+        assert fsync.call_count == 0
+        JobJournal.mark(job['id'], 'init', upload_id='u1', part_size=100)
+        assert fsync.call_count == 1
+        for i in range(JobJournal.PART_SYNC_EVERY):
+            JobJournal.mark(job['id'], 'part', part={'part_number': i + 1, 'etag': 'e', 'size': 100, 'crc': 1})
+        assert fsync.call_count == 2
+        JobJournal.mark(job['id'], 'done')
+        assert fsync.call_count == 3
+    assert JobJournal.load_pending() == []
+
+
+def test_job_journal_replay_ignores_truncated_line():
+    """测试任务日志最后一行写了一半（崩溃）时仍能正确回放"""
+    import src.core
+    from src.core import JobJournal
+
+    jobs = JobJournal.add_jobs([
+        {'path': '/tmp/a.txt', 'object_name': 'uploads/a.txt'},
+        {'path': '/tmp/b.bin', 'object_name': 'uploads/b.bin'},
+    ])
+    JobJournal.mark(jobs[0]['id'], 'done')
+    JobJournal.mark(jobs[1]['id'], 'start')
+    JobJournal.mark(jobs[1]['id'], 'init', upload_id='u1', part_size=100)
+    JobJournal.mark(jobs[1]['id'], 'part', part={'part_number': 1, 'etag': 'e1', 'size': 100, 'crc': 1})
+    with open(src.core.JOURNAL_FILE, 'a', encoding='utf-8') as f:
+        f.write('{"op": "part", "id": "' + jobs[1]['id'] + '", "part": {"part_nu')
+
+    pending = JobJournal.load_pending()
+
+    assert len(pending) == 1
+    assert pending[0]['object_name'] == 'uploads/b.bin'
+    assert pending[0]['state'] == 'uploading'
+    assert pending[0]['upload_id'] == 'u1'
+    assert [p['part_number'] for p in pending[0]['parts']] == [1]
+
+    JobJournal.compact(pending)
+    assert JobJournal.load_pending() == pending
+    JobJournal.compact([])
+    assert not os.path.exists(src.core.JOURNAL_FILE)
@@ -0,0 +1,131 @@
+"""测试本地 OSS 替身服务器：真实的 oss2 请求走本机 HTTP，覆盖普通上传、分片上传和故障注入"""
+import os
+
+from benchmarks.fake_oss import FakeOssServer, parse_rate
+from src.core import ClientCache, UploadEngine
+
+
+def _config(endpoint, **overrides):
+    config = {
+        'access_key_id': 'bench',
+        'access_key_secret': 'bench',
+        'endpoint': endpoint,
+        'bucket_name': 'bench-bucket',
+        'custom_domain': '',
+        'upload_path': 'bench',
+        'use_random_name': False,
+        'url_expire_time': 0,
+        'upload_concurrency': 2,
+        'multipart_threshold': 300 * 1024,
+        'multipart_part_size': 100 * 1024,
+        'multipart_threads': 2,
+        'retry_backoff': 0.01
+    }
+    config.update(overrides)
+    return config
+
+
+def test_put_and_multipart_against_fake_server(tmp_path):
+    """测试普通上传和分片上传都能通过替身服务器完成，服务端记录的大小和 CRC64 与本地一致"""
+    small = tmp_path / "small.txt"
+    small.write_bytes(b"hello" * 100)
+    big = tmp_path / "big.bin"
+    big.write_bytes(os.urandom(350 * 1024))
+
+    with FakeOssServer() as server:
+        config = _config(server.endpoint)
+        engine = UploadEngine(config, journal=False, history=False)
+        engine.connect()
+        events = list(engine.upload_many([str(small), str(big)]))
+
+        urls = sorted(e['url'] for e in events if e['type'] == 'success')
+        assert [url.rsplit('/', 2)[-2:] for url in urls] == [['bench', 'big.bin'], ['bench', 'small.txt']]
+        bucket = ClientCache.get_bucket(config)
+        assert bucket.head_object("bench/big.bin").content_length == 350 * 1024
+        assert not bucket.object_exists("bench/missing.txt")
+        # 4 个分片 + 初始化 + 合并 + 普通上传 + 两次 HEAD，连接被复用
+        assert server.stats['requests'] == 9
+        assert server.stats['connections'] <= 3
+        assert server.uploads == {}
+
+
+def test_injected_faults_are_retried(tmp_path):
+    """测试注入的 503 和断开连接由重试机制处理，文件最终全部上传成功"""
+    paths = []
+    for i in range(10):
+        path = tmp_path / f"file{i}.bin"
+        path.write_bytes(os.urandom(20 * 1024))
+        paths.append(str(path))
+
+    with FakeOssServer(error_rate=0.2, reset_rate=0.1, seed=7) as server:
+        engine = UploadEngine(_config(server.endpoint, retry_attempts=10), journal=False, history=False)
+        engine.connect()
+        events = list(engine.upload_many(paths))
+
+    assert sum(e['type'] == 'success' for e in events) == 10
+    retries = sum(e['type'] == 'retry' for e in events)
+    assert retries == server.stats['errors_injected'] + server.stats['resets_injected'] > 0
+
+
+def test_text_files_are_compressed_while_streaming(tmp_path):
+    """测试文本类文件边压缩边以分块传输上传，带 Content-Encoding，CRC64 校验通过；达到分片阈值的仍然分片上传"""
+    log = tmp_path / "server.log"
+    log.write_bytes(b"GET /index.html 200 0.003s\n" * 10000)
+    big_log = tmp_path / "big.log"
+    big_log.write_bytes(b"GET /index.html 200 0.003s\n" * 15000)
+    tiny = tmp_path / "tiny.json"
+    tiny.write_text('{"a": 1}')
+    binary = tmp_path / "data.bin"
+    binary.write_bytes(os.urandom(4096))
+
+    with FakeOssServer() as server:
+        config = _config(server.endpoint, compress_enabled=True, compress_min_size=1024)
+        engine = UploadEngine(config, journal=False, history=False)
+        engine.connect()
+        events = list(engine.upload_many([str(log), str(tiny), str(binary), str(big_log)]))
+
+        assert sum(e['type'] == 'success' for e in events) == 4
+        compressed = [e for e in events if e['type'] == 'compressed']
+        assert [(e['index'], e['encoding'], e['original']) for e in compressed] == [(0, 'gzip', log.stat().st_size)]
+        meta = server.objects[('bench-bucket', 'bench/server.log')]
+        assert meta['size'] == compressed[0]['size'] < log.stat().st_size // 20
+        assert meta['content_encoding'] == 'gzip'
+        assert server.objects[('bench-bucket', 'bench/tiny.json')]['content_encoding'] is None
+        assert server.objects[('bench-bucket', 'bench/data.bin')]['size'] == 4096
+        big = server.objects[('bench-bucket', 'bench/big.log')]
+        assert big['size'] == big_log.stat().st_size and big.get('content_encoding') is None
+        assert server.uploads == {}
+
+
+def test_parse_rate_units():
+    """测试带宽参数的单位换算"""
+    assert parse_rate("0") == 0
+    assert parse_rate("500K") == 500 * 1024
+    assert parse_rate("1.5M") == int(1.5 * 1024 * 1024)
+    assert parse_rate("2048") == 2048
+
+
+def test_multipart_dedup_uses_combined_part_crc(tmp_path):
+    """测试分片上传的文件按合并后的 CRC64 建去重索引：上传后不再读一遍文件，再次上传直接复用"""
+    from unittest.mock import patch
+    from src.core import DedupIndex
+
+    big = tmp_path / "big.bin"
+    big.write_bytes(os.urandom(350 * 1024))
+    real_hash = DedupIndex.file_hash
+
+    with FakeOssServer() as server:
+        engine = UploadEngine(_config(server.endpoint, dedup_enabled=True), journal=False, history=False)
+        engine.connect()
+        with patch.object(DedupIndex, 'file_hash', side_effect=AssertionError("不应单独读取文件")):
+            first = list(engine.upload_many([str(big)]))
+        requests = server.stats['requests']
+        with patch.object(DedupIndex, 'file_hash', side_effect=real_hash) as file_hash:
+            second = list(engine.upload_many([str(big)]))
+
+    assert [e['type'] for e in first if e['type'] in ('success', 'error')] == ['success']
+    assert [e['url'] for e in second if e['type'] == 'success'] == \
+        [e['url'] for e in first if e['type'] == 'success']
+    file_hash.assert_called_once_with(str(big), 'crc64')
+    # 第二次只发了校验索引的 HEAD
+    assert server.stats['requests'] == requests + 1
@@ -0,0 +1,194 @@
+"""测试拖入文件夹时的遍历、过滤和相对路径保留"""
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+from PyQt5.QtCore import QMimeData, QUrl, QPoint, Qt
+from PyQt5.QtGui import QDropEvent
+
+from src.core import FolderScanner
+from src.main import BatchUploadThread, MainWindow
+
+
+def _make_tree(root):
+    files = [
+        "photos/a.png",
+        "photos/b.jpg",
+        "photos/.DS_Store",
+        "photos/2024/c.png",
+        "photos/2024/notes.tmp",
+        "photos/node_modules/lib.png",
+    ]
+    for rel in files:
+        path = os.path.join(root, *rel.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(rel)
+    return os.path.join(root, "photos")
+
+
+def test_iter_files_keeps_relative_dirs_and_applies_filters(tmp_path):
+    """测试遍历保留相对目录，排除规则可以跳过文件和整个子目录"""
+    folder = _make_tree(str(tmp_path))
+    single = tmp_path / "single.txt"
+    single.write_text("x")
+
+    found = list(FolderScanner.iter_files([folder, str(single)],
+                                          exclude=".DS_Store; *.tmp; node_modules"))
+
+    assert [(os.path.relpath(p, str(tmp_path)).replace(os.sep, '/'), rel) for p, rel in found] == [
+        ("photos/a.png", "photos"),
+        ("photos/b.jpg", "photos"),
+        ("photos/2024/c.png", "photos/2024"),
+        ("single.txt", ""),
+    ]
+
+    pngs = list(FolderScanner.iter_files([folder], include="*.png", exclude="node_modules"))
+    assert [os.path.basename(p) for p, _ in pngs] == ["a.png", "c.png"]
+
+
+def test_streaming_batch_uploads_files_added_while_running(qapp, tmp_path):
+    """测试上传线程在遍历未结束时就开始上传，对象名保留相对目录"""
+    folder = _make_tree(str(tmp_path))
+    config = {
+        'access_key_id': 'test_key',
+        'access_key_secret': 'test_secret',
+        'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+        'bucket_name': 'test-bucket',
+        'upload_path': 'uploads',
+        'use_random_name': False,
+        'custom_domain': '',
+        'url_expire_time': 0,
+        'upload_concurrency': 2
+    }
+    mock_bucket = MagicMock()
+    uploaded = []
+    mock_bucket.put_object.side_effect = lambda key, path, **kw: uploaded.append(key)
+
+    thread = BatchUploadThread([], config, streaming=True)
+    with patch('oss2.Bucket', return_value=mock_bucket), \
+            patch('src.main.HistoryManager.add_record'):
+        thread.start()
+        thread.add_files([(os.path.join(folder, "a.png"), "photos")])
+        deadline = time.time() + 5
+        while not uploaded and time.time() < deadline:
+            time.sleep(0.01)
+        # 第一批已经上传，输入尚未结束，线程还在等待新文件
+        assert uploaded == ["uploads/photos/a.png"]
+        assert thread.isRunning()
+
+        thread.add_files([(os.path.join(folder, "2024", "c.png"), "photos/2024")])
+        thread.finish_input()
+        assert thread.wait(5000)
+
+    assert uploaded == ["uploads/photos/a.png", "uploads/photos/2024/c.png"]
+
+
+def test_drop_folder_scans_in_background(qapp, tmp_path, monkeypatch):
+    """测试拖入文件夹后在后台遍历，找到的文件陆续出现在任务表格中"""
+    folder = _make_tree(str(tmp_path))
+    monkeypatch.setattr(MainWindow, 'startup_checks', MagicMock())
+    window = MainWindow()
+    config = {
+        'access_key_id': 'test_key',
+        'access_key_secret': 'test_secret',
+        'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+        'bucket_name': 'test-bucket',
+        'custom_domain': '',
+        'upload_path': 'uploads',
+        'use_random_name': False,
+        'auto_copy': False,
+        'url_expire_time': 0,
+        'folder_include': '',
+        'folder_exclude': '.DS_Store;*.tmp'
+    }
+    mock_bucket = MagicMock()
+
+    mime = QMimeData()
+    mime.setUrls([QUrl.fromLocalFile(folder)])
+    event = QDropEvent(QPoint(10, 10), Qt.CopyAction, mime, Qt.LeftButton, Qt.NoModifier)
+
+    try:
+        with patch('src.main.ConfigManager') as mock_config_mgr, \
+                patch('oss2.Bucket', return_value=mock_bucket), \
+                patch('src.main.HistoryManager.add_record'):
+            mock_config_mgr.load_config.return_value = config
+            window.dropEvent(event)
+            deadline = time.time() + 5
+            while window.queue_busy and time.time() < deadline:
+                qapp.processEvents()
+                time.sleep(0.01)
+
+        names = sorted(call.args[0] for call in mock_bucket.put_object.call_args_list)
+        assert names == ["uploads/photos/2024/c.png", "uploads/photos/a.png",
+                         "uploads/photos/b.jpg", "uploads/photos/node_modules/lib.png"]
+        assert window.task_model.rowCount() == 4
+        assert len(window.tasks_data) == 4
+    finally:
+        window.close()
+
+
+def test_new_drops_join_the_running_queue(qapp, tmp_path, monkeypatch):
+    """测试上传中再次拖入的文件追加到同一个队列：已有的行保留，不重建上传线程，自动复制只复制这一轮的链接"""
+    from PyQt5.QtWidgets import QApplication
+
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"shot{i}.png"
+        path.write_text(str(i))
+        paths.append(str(path))
+    config = {
+        'access_key_id': 'test_key',
+        'access_key_secret': 'test_secret',
+        'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+        'bucket_name': 'test-bucket',
+        'custom_domain': 'cdn.example.com',
+        'upload_path': 'uploads',
+        'use_random_name': False,
+        'auto_copy': True,
+        'url_expire_time': 0,
+        'upload_concurrency': 1,
+        'dedup_enabled': False
+    }
+    mock_bucket = MagicMock()
+    mock_bucket.put_object.side_effect = lambda key, data, **kw: time.sleep(0.05)
+
+    def wait_idle(window):
+        deadline = time.time() + 5
+        while window.queue_busy and time.time() < deadline:
+            qapp.processEvents()
+            time.sleep(0.01)
+
+    monkeypatch.setattr(MainWindow, 'startup_checks', MagicMock())
+    window = MainWindow()
+    try:
+        with patch('src.main.ConfigManager') as mock_config_mgr, \
+                patch('oss2.Bucket', return_value=mock_bucket), \
+                patch('src.main.HistoryManager.add_record'):
+            mock_config_mgr.load_config.return_value = config
+            window.start_batch_upload(paths[:2])
+            thread = window.thread
+            # 第一批还在上传时拖入第二批
+            window.start_batch_upload(paths[2:3])
+            assert window.thread is thread and window.task_model.rowCount() == 3
+            assert not window.btn_clear.isEnabled()
+            wait_idle(window)
+            assert len(window.tasks_data) == 3
+
+            # 空闲后再拖入：仍是同一个线程，编号接着已有的行
+            window.start_batch_upload(paths[3:])
+            assert window.thread is thread and thread.isRunning()
+            wait_idle(window)
+
+        assert window.task_model.rowCount() == 4
+        assert window.task_model.index(0, 2).data() == "https://cdn.example.com/uploads/shot0.png"
+        assert window.task_model.index(3, 2).data() == "https://cdn.example.com/uploads/shot3.png"
+        assert QApplication.clipboard().text() == "https://cdn.example.com/uploads/shot3.png"
+        assert sorted(call.args[0] for call in mock_bucket.put_object.call_args_list) == \
+            [f"uploads/shot{i}.png" for i in range(4)]
+
+        window.clear_table()
+        assert window.task_model.rowCount() == 0
+        assert thread.wait(5000)
+    finally:
+        window.close()
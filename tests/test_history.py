@@ -0,0 +1,150 @@
+"""测试 SQLite 历史记录存储"""
+import json
+import os
+
+import src.core
+from src.main import HistoryManager
+
+
+def test_migrates_legacy_json_history():
+    """测试首次打开时把旧版 JSON 历史导入数据库，并且只迁移一次"""
+    legacy = [
+        {"date": "2024-01-02 12:00:00", "filename": "new.png", "url": "https://example.com/new.png"},
+        {"date": "2024-01-01 12:00:00", "filename": "old.png", "url": "https://example.com/old.png"},
+    ]
+    with open(src.core.HISTORY_FILE, 'w', encoding='utf-8') as f:
+        json.dump(legacy, f)
+
+    history = HistoryManager.load_history()
+
+    assert [r['filename'] for r in history] == ["new.png", "old.png"]
+    assert not os.path.exists(src.core.HISTORY_FILE)
+    assert os.path.exists(src.core.HISTORY_FILE + ".migrated")
+
+    # 重新打开数据库不会重复导入
+    HistoryManager.close()
+    assert len(HistoryManager.load_history()) == 2
+
+
+def test_add_record_is_group_committed_without_cap():
+    """测试批量写入的记录全部保留（不再截断到 500 条），新记录在前"""
+    for i in range(600):
+        HistoryManager.add_record(f"file{i}.png", f"https://example.com/file{i}.png")
+    HistoryManager.flush()
+
+    history = HistoryManager.load_history()
+
+    assert len(history) == 600
+    assert history[0]['filename'] == "file599.png"
+    assert history[-1]['filename'] == "file0.png"
+    assert HistoryManager.load_history(limit=10)[0]['filename'] == "file599.png"
+
+
+def test_retention_policy():
+    """测试按天数和条数清理历史记录"""
+    conn = HistoryManager._connect()
+    with conn:
+        conn.execute("INSERT INTO history (date, filename, url) VALUES (?, ?, ?)",
+                     ("2000-01-01 00:00:00", "ancient.png", "https://example.com/ancient.png"))
+    for i in range(5):
+        HistoryManager.add_record(f"file{i}.png", f"https://example.com/file{i}.png")
+
+    HistoryManager.apply_retention({'history_retention_days': 30, 'history_max_records': 0})
+    assert [r['filename'] for r in HistoryManager.load_history()][-1] == "file0.png"
+
+    HistoryManager.apply_retention({'history_retention_days': 0, 'history_max_records': 3})
+    assert [r['filename'] for r in HistoryManager.load_history()] == ["file4.png", "file3.png", "file2.png"]
+
+
+def test_history_window_loads_pages_lazily(qapp):
+    """测试历史窗口只按页读取记录，不为每一行创建控件"""
+    from src.main import HistoryWindow, HistoryTableModel
+
+    conn = HistoryManager._connect()
+    with conn:
+        conn.executemany("INSERT INTO history (date, filename, url) VALUES (?, ?, ?)",
+                         [("2024-01-01 00:00:00", f"file{i}.png", f"https://example.com/file{i}.png")
+                          for i in range(1000)])
+
+    window = HistoryWindow()
+    model = window.model
+
+    assert model.rowCount() == HistoryTableModel.PAGE_SIZE
+    assert model.index(0, 1).data() == "file999.png"
+    assert model.index(0, 3).data() == "复制"
+    assert window.table.indexWidget(model.index(0, 3)) is None
+
+    while model.canFetchMore():
+        model.fetchMore()
+    assert model.rowCount() == 1000
+    assert model.index(999, 2).data(HistoryTableModel.UrlRole) == "https://example.com/file0.png"
+    window.close()
+
+
+def test_history_window_lists_buckets_on_first_dropdown(qapp):
+    """测试打开历史窗口时不扫描 Bucket 列表，第一次展开下拉框时才查询"""
+    from unittest.mock import patch
+    from src.main import HistoryWindow
+
+    _insert_history([("2024-01-01 00:00:00", "a.png", "https://example.com/a.png", "bucket-a")])
+    with patch.object(HistoryManager, 'buckets', wraps=HistoryManager.buckets) as buckets:
+        window = HistoryWindow()
+        assert not buckets.called and window.combo_bucket.count() == 1
+        window.combo_bucket.showPopup()
+        window.combo_bucket.hidePopup()
+        window.combo_bucket.showPopup()
+        window.combo_bucket.hidePopup()
+    assert buckets.call_count == 1
+    assert window.combo_bucket.itemData(1) == "bucket-a"
+    window.close()
+
+
+def _insert_history(rows):
+    conn = HistoryManager._connect()
+    with conn:
+        conn.executemany("INSERT INTO history (date, filename, url, bucket) VALUES (?, ?, ?, ?)", rows)
+
+
+def test_search_by_text_date_and_bucket():
+    """测试按关键词、日期范围和 Bucket 搜索历史记录"""
+    _insert_history([
+        ("2024-01-01 10:00:00", "screenshot_login.png", "https://a.example.com/uploads/screenshot_login.png", "bucket-a"),
+        ("2024-02-01 10:00:00", "截图 2024-02-01.png", "https://a.example.com/uploads/jt.png", "bucket-a"),
+        ("2024-03-01 10:00:00", "report.pdf", "https://b.example.com/docs/report.pdf", "bucket-b"),
+        ("2024-03-02 10:00:00", "logo.svg", "https://b.example.com/img/logo.svg", "bucket-b"),
+    ])
+
+    def names(**filters):
+        return [r['filename'] for r in HistoryManager.fetch_page(**filters)]
+
+    assert names(text="shot") == ["screenshot_login.png"]
+    assert names(text="截图") == ["截图 2024-02-01.png"]
+    assert names(text="b.example docs") == ["report.pdf"]
+    assert names(text="png") == ["截图 2024-02-01.png", "screenshot_login.png"]
+    assert names(bucket="bucket-b") == ["logo.svg", "report.pdf"]
+    assert names(date_from="2024-02-01 00:00:00", date_to="2024-03-02 00:00:00") == \
+        ["report.pdf", "截图 2024-02-01.png"]
+    assert names(text="100%") == []
+    assert HistoryManager.buckets() == ["bucket-a", "bucket-b"]
+
+
+def test_search_pages_through_matches():
+    """测试搜索结果同样按 keyset 分页"""
+    _insert_history([("2024-01-01 00:00:00", f"{'cat' if i % 2 else 'dog'}{i}.png",
+                      f"https://example.com/{i}.png", "") for i in range(1000)])
+
+    first = HistoryManager.fetch_page(limit=100, text="cat")
+    second = HistoryManager.fetch_page(before_id=first[-1]['id'], limit=100, text="cat")
+
+    assert len(first) == len(second) == 100
+    assert all(r['filename'].startswith('cat') for r in first + second)
+    assert first[-1]['id'] > second[0]['id']
+
+
+def test_search_survives_retention_cleanup():
+    """测试清理历史记录后全文索引同步删除"""
+    _insert_history([("2000-01-01 00:00:00", "expired.png", "https://example.com/expired.png", "")])
+
+    HistoryManager.apply_retention({'history_retention_days': 30})
+
+    assert HistoryManager.fetch_page(text="expired") == []
@@ -12,8 +12,10 @@ from src.main import MainWindow, BatchUploadThread
 
 
 @pytest.fixture
-def main_window(qapp):
+def main_window(qapp, monkeypatch):
     """创建 MainWindow 实例"""
+    # 启动检查在没有配置时会弹出模态的设置窗口，测试中不执行
+    monkeypatch.setattr(MainWindow, 'startup_checks', MagicMock())
     window = MainWindow()
     yield window
     # 清理
@@ -24,16 +26,17 @@ def test_signal_connection_no_leak(main_window):
     """测试重复上传时不会累积信号连接"""
     # 创建模拟线程
     mock_thread = MagicMock(spec=BatchUploadThread)
+    mock_thread.isRunning.return_value = False  # 旧线程已经结束，需要新建
     main_window.thread = mock_thread
 
     # 设置 mock 的信号
-    mock_thread.progress_signal = MagicMock()
+    mock_thread.progress_batch_signal = MagicMock()
     mock_thread.success_signal = MagicMock()
     mock_thread.error_signal = MagicMock()
     mock_thread.all_finished_signal = MagicMock()
 
     # 模拟 disconnect 调用
-    mock_thread.progress_signal.disconnect = MagicMock()
+    mock_thread.progress_batch_signal.disconnect = MagicMock()
     mock_thread.success_signal.disconnect = MagicMock()
     mock_thread.error_signal.disconnect = MagicMock()
     mock_thread.all_finished_signal.disconnect = MagicMock()
@@ -66,13 +69,13 @@ def test_signal_connection_no_leak(main_window):
     os.unlink(test_file)
 
     # 验证所有旧的信号连接都被断开了
-    assert mock_thread.progress_signal.disconnect.called
+    assert mock_thread.progress_batch_signal.disconnect.called
     assert mock_thread.success_signal.disconnect.called
     assert mock_thread.error_signal.disconnect.called
     assert mock_thread.all_finished_signal.disconnect.called
 
     # 验证 disconnect 被调用时传入了正确的槽函数
-    mock_thread.progress_signal.disconnect.assert_any_call(main_window.update_row_progress)
+    mock_thread.progress_batch_signal.disconnect.assert_any_call(main_window.update_rows_progress)
     mock_thread.success_signal.disconnect.assert_any_call(main_window.on_row_success)
     mock_thread.error_signal.disconnect.assert_any_call(main_window.on_row_error)
     mock_thread.all_finished_signal.disconnect.assert_any_call(main_window.on_all_finished)
@@ -122,16 +125,17 @@ def test_signal_connection_handles_disconnect_error(main_window):
     """测试当 disconnect 抛出 TypeError 时的错误处理"""
     # 创建模拟线程
     mock_thread = MagicMock(spec=BatchUploadThread)
+    mock_thread.isRunning.return_value = False  # 旧线程已经结束，需要新建
     main_window.thread = mock_thread
 
     # 设置 mock 的信号
-    mock_thread.progress_signal = MagicMock()
+    mock_thread.progress_batch_signal = MagicMock()
     mock_thread.success_signal = MagicMock()
     mock_thread.error_signal = MagicMock()
     mock_thread.all_finished_signal = MagicMock()
 
     # 模拟 disconnect 抛出 TypeError（信号未连接时会发生）
-    mock_thread.progress_signal.disconnect = MagicMock(side_effect=TypeError("not connected"))
+    mock_thread.progress_batch_signal.disconnect = MagicMock(side_effect=TypeError("not connected"))
     mock_thread.success_signal.disconnect = MagicMock(side_effect=TypeError("not connected"))
     mock_thread.error_signal.disconnect = MagicMock(side_effect=TypeError("not connected"))
     mock_thread.all_finished_signal.disconnect = MagicMock(side_effect=TypeError("not connected"))
@@ -164,6 +168,85 @@ def test_signal_connection_handles_disconnect_error(main_window):
     os.unlink(test_file)
 
     # 验证 disconnect 被调用（即使抛出了异常）
-    assert mock_thread.progress_signal.disconnect.called
+    assert mock_thread.progress_batch_signal.disconnect.called
     # 验证新线程仍然被创建和启动
     assert mock_thread.start.called
+
+
+def test_large_batch_creates_no_row_widgets(main_window):
+    """测试上万个文件入队时只写入模型，不为任何一行创建控件"""
+    paths = [f"/tmp/screenshot_{i}.png" for i in range(10000)]
+    mock_config = {
+        'access_key_id': 'test_key',
+        'access_key_secret': 'test_secret',
+        'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+        'bucket_name': 'test-bucket',
+        'custom_domain': '',
+        'upload_path': 'uploads',
+        'use_random_name': False,
+        'auto_copy': False,
+        'url_expire_time': 3600
+    }
+
+    with patch('src.main.ConfigManager') as mock_config_mgr:
+        mock_config_mgr.load_config.return_value = mock_config
+        with patch('src.main.BatchUploadThread'):
+            main_window.start_batch_upload(paths)
+
+    model = main_window.task_model
+    assert model.rowCount() == 10000
+    assert main_window.task_table.indexWidget(model.index(0, 1)) is None
+    assert model.index(9999, 0).data() == "screenshot_9999.png"
+    assert model.index(9999, 2).data() == "等待中..."
+
+    main_window.update_rows_progress([(0, 50, 100), (9999, 100, 100)])
+    main_window.on_row_success(9999, "screenshot_9999.png", "https://example.com/a#b.png")
+    main_window.on_row_error(1, "timeout")
+
+    from src.main import ProgressDelegate, ButtonDelegate
+    assert model.index(0, 1).data(ProgressDelegate.ProgressRole) == 50
+    assert model.index(9999, 2).data() == "https://example.com/a%23b.png"
+    assert model.index(9999, 3).data(ButtonDelegate.EnabledRole) is True
+    assert model.index(0, 3).data(ButtonDelegate.EnabledRole) is False
+    assert model.index(1, 2).data() == "失败: timeout"
+
+    # 重试中的行不算失败，重试次数显示在链接列
+    model.set_retry(2, 1, "分片 3: connection reset")
+    assert model.index(2, 2).data() == "第 1 次重试... (分片 3: connection reset)"
+    model.set_retry(2, 2, "timed out")
+    main_window.on_row_error(2, "timed out")
+    assert model.index(2, 2).data() == "失败（已重试 2 次）: timed out"
+
+    main_window._on_copy_button_clicked(9999)
+    assert QApplication.clipboard().text() == "https://example.com/a%23b.png"
+    assert model.index(9999, 3).data() == "已复制"
+
+
+def test_main_module_defers_oss2_import():
+    """测试启动界面时不导入 oss2，第一次上传或测试连接时才导入"""
+    import subprocess
+    code = "import sys; import src.main; print('oss2' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=os.path.join(os.path.dirname(__file__), '..'),
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
+
+
+def test_drag_enter_prewarms_connection(main_window, qapp):
+    """测试拖入时在后台预热连接，并在状态栏显示节省的时间"""
+    from PyQt5.QtCore import QMimeData, QUrl, QPoint, Qt
+    from PyQt5.QtGui import QDragEnterEvent
+
+    mime = QMimeData()
+    mime.setUrls([QUrl.fromLocalFile(__file__)])
+    event = QDragEnterEvent(QPoint(10, 10), Qt.CopyAction, mime, Qt.LeftButton, Qt.NoModifier)
+
+    with patch('src.main.ConfigManager') as mock_config_mgr, \
+            patch('src.main.ClientCache.prewarm', return_value={'connect_ms': 180.0, 'saved_ms': 150.0}) as prewarm:
+        mock_config_mgr.load_config.return_value = {'access_key_id': 'test_key', 'upload_concurrency': 3}
+        main_window.dragEnterEvent(event)
+        assert event.isAccepted()
+        assert main_window.prewarm_thread.wait(2000)
+        qapp.processEvents()
+
+    prewarm.assert_called_once_with({'access_key_id': 'test_key', 'upload_concurrency': 3})
+    assert "首个上传约节省 150 ms" in main_window.lbl_status.text()
@@ -2,6 +2,7 @@ import pytest
 import time
 import tempfile
 import os
+import threading
 from unittest.mock import Mock, patch, MagicMock, call
 from PyQt5.QtCore import QThread
 
@@ -39,7 +40,7 @@ def test_thread_stops_cleanly(qapp):
             # 模拟上传需要时间
             time.sleep(0.2)
 
-        mock_bucket.put_object_from_file.side_effect = slow_put_object
+        mock_bucket.put_object.side_effect = slow_put_object
         mock_bucket.sign_url.return_value = "https://example.com/test.txt"
 
         with patch('oss2.Bucket', return_value=mock_bucket):
@@ -96,9 +97,9 @@ def test_thread_cleanup_on_error(qapp):
 
         # Mock OSS bucket - 在上传时抛出异常
         mock_bucket = MagicMock()
-        mock_bucket.put_object_from_file.side_effect = Exception("Upload failed")
+        mock_bucket.put_object.side_effect = Exception("Upload failed")
 
-        with patch('src.main.oss2.Bucket', return_value=mock_bucket):
+        with patch('oss2.Bucket', return_value=mock_bucket):
             thread.start()
             # 给 Qt 事件循环一些时间处理信号
             thread.wait(5000)
@@ -143,7 +144,7 @@ def test_stop_flag_behavior(qapp):
             upload_count[0] += 1
             time.sleep(0.1)
 
-        mock_bucket.put_object_from_file.side_effect = counting_put_object
+        mock_bucket.put_object.side_effect = counting_put_object
         mock_bucket.sign_url.return_value = "https://example.com/test.txt"
 
         with patch('oss2.Bucket', return_value=mock_bucket):
@@ -194,7 +195,7 @@ def test_stop_during_upload(qapp):
             uploaded_files.append(object_name)
             time.sleep(0.15)  # 每个上传需要时间
 
-        mock_bucket.put_object_from_file.side_effect = slow_put_object
+        mock_bucket.put_object.side_effect = slow_put_object
         mock_bucket.sign_url.return_value = "https://example.com/test.txt"
 
         with patch('oss2.Bucket', return_value=mock_bucket):
@@ -238,3 +239,370 @@ def test_stop_sets_flag_correctly(qapp):
 
     # 标志应该被设置为 False
     assert thread.is_running == False
+
+
+def test_concurrent_upload_respects_limit(qapp):
+    """测试并发上传时在途任务数不超过配置的并发数，且每个索引都有结果"""
+    test_files = []
+    for i in range(6):
+        fd, path = tempfile.mkstemp(suffix=f"_test{i}.txt")
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"test content {i}")
+        test_files.append(path)
+
+    config = {
+        'access_key_id': 'test_key',
+        'access_key_secret': 'test_secret',
+        'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+        'bucket_name': 'test-bucket',
+        'upload_path': 'uploads',
+        'use_random_name': False,
+        'custom_domain': '',
+        'url_expire_time': 0,
+        'upload_concurrency': 3
+    }
+
+    try:
+        thread = BatchUploadThread(test_files, config)
+
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+
+        def slow_put_object(*args, **kwargs):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.1)
+            with lock:
+                in_flight[0] -= 1
+
+        mock_bucket = MagicMock()
+        mock_bucket.put_object.side_effect = slow_put_object
+
+        succeeded = []
+        thread.success_signal.connect(lambda idx, name, url: succeeded.append(idx))
+
+        with patch('oss2.Bucket', return_value=mock_bucket), \
+                patch('src.main.HistoryManager.add_record'):
+            thread.start()
+            assert thread.wait(5000)
+            qapp.processEvents()
+
+        assert 1 < peak[0] <= 3
+        assert sorted(succeeded) == list(range(len(test_files)))
+
+    finally:
+        for path in test_files:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def test_large_file_uses_parallel_multipart(qapp):
+    """测试超过阈值的文件走分片上传，分片进度汇总为整体进度"""
+    fd, path = tempfile.mkstemp(suffix="_big.bin")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(os.urandom(250 * 1024))
+
+    config = {
+        'access_key_id': 'test_key',
+        'access_key_secret': 'test_secret',
+        'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+        'bucket_name': 'test-bucket',
+        'upload_path': 'uploads',
+        'use_random_name': False,
+        'custom_domain': '',
+        'url_expire_time': 0,
+        'multipart_threshold': 100 * 1024,
+        'multipart_part_size': 100 * 1024,
+        'multipart_threads': 3
+    }
+
+    try:
+        thread = BatchUploadThread([path], config)
+
+        def fake_upload_part(key, upload_id, part_number, data, progress_callback=None, **kwargs):
+            size = len(data.read())
+            progress_callback(size, size)
+            return MagicMock(etag=f"etag-{part_number}", crc=None)
+
+        mock_bucket = MagicMock()
+        mock_bucket.init_multipart_upload.return_value = MagicMock(upload_id="upload-1")
+        mock_bucket.upload_part.side_effect = fake_upload_part
+
+        progress = []
+        succeeded = []
+        thread.progress_signal.connect(lambda idx, percent: progress.append(percent))
+        thread.success_signal.connect(lambda idx, name, url: succeeded.append(idx))
+
+        with patch('oss2.Bucket', return_value=mock_bucket), \
+                patch('src.main.HistoryManager.add_record'):
+            thread.start()
+            assert thread.wait(5000)
+            qapp.processEvents()
+
+        mock_bucket.put_object.assert_not_called()
+        assert mock_bucket.upload_part.call_count == 3
+        parts = mock_bucket.complete_multipart_upload.call_args[0][2]
+        assert [p.part_number for p in parts] == [1, 2, 3]
+        assert sum(p.size for p in parts) == 250 * 1024
+        assert max(progress) == 100
+        assert succeeded == [0]
+
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_failed_part_is_retried_without_failing_the_file(qapp):
+    """测试分片遇到临时网络错误时只重试这个分片，重试次数通过信号报告，文件最终成功"""
+    import oss2
+
+    fd, path = tempfile.mkstemp(suffix="_big.bin")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(os.urandom(250 * 1024))
+
+    config = {
+        'access_key_id': 'test_key',
+        'access_key_secret': 'test_secret',
+        'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+        'bucket_name': 'test-bucket',
+        'upload_path': 'uploads',
+        'use_random_name': False,
+        'custom_domain': '',
+        'url_expire_time': 0,
+        'multipart_threshold': 100 * 1024,
+        'multipart_part_size': 100 * 1024,
+        'multipart_threads': 3,
+        'retry_attempts': 3,
+        'retry_backoff': 0.01
+    }
+
+    try:
+        thread = BatchUploadThread([path], config)
+        failures = {2: 2}  # 第 2 个分片前两次连接被重置
+
+        def flaky_upload_part(key, upload_id, part_number, data, progress_callback=None, **kwargs):
+            if failures.get(part_number):
+                failures[part_number] -= 1
+                raise oss2.exceptions.RequestError(ConnectionResetError("connection reset"))
+            size = len(data.read())
+            progress_callback(size, size)
+            return MagicMock(etag=f"etag-{part_number}", crc=None)
+
+        mock_bucket = MagicMock()
+        mock_bucket.init_multipart_upload.return_value = MagicMock(upload_id="upload-1")
+        mock_bucket.upload_part.side_effect = flaky_upload_part
+
+        retries, succeeded, errors = [], [], []
+        thread.retry_signal.connect(lambda idx, count, msg: retries.append((idx, count, msg)))
+        thread.success_signal.connect(lambda idx, name, url: succeeded.append(idx))
+        thread.error_signal.connect(lambda idx, msg: errors.append(msg))
+
+        with patch('oss2.Bucket', return_value=mock_bucket), \
+                patch('src.main.HistoryManager.add_record'):
+            thread.start()
+            assert thread.wait(5000)
+            qapp.processEvents()
+
+        numbers = sorted(c[0][2] for c in mock_bucket.upload_part.call_args_list)
+        assert numbers == [1, 2, 2, 2, 3]
+        assert [(idx, count) for idx, count, _ in retries] == [(0, 1), (0, 2)]
+        assert retries[0][2].startswith("分片 2:")
+        assert succeeded == [0] and errors == []
+        mock_bucket.abort_multipart_upload.assert_not_called()
+
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_resumed_multipart_uploads_only_missing_parts(qapp):
+    """测试从任务日志续传时只上传服务端缺失的分片"""
+    from oss2.models import PartInfo
+    from src.main import JobJournal
+
+    fd, path = tempfile.mkstemp(suffix="_big.bin")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(os.urandom(250 * 1024))
+
+    config = {
+        'access_key_id': 'test_key',
+        'access_key_secret': 'test_secret',
+        'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+        'bucket_name': 'test-bucket',
+        'upload_path': 'uploads',
+        'use_random_name': False,
+        'custom_domain': '',
+        'url_expire_time': 0,
+        'multipart_threshold': 100 * 1024,
+        'multipart_part_size': 100 * 1024,
+        'multipart_threads': 2
+    }
+
+    try:
+        job = JobJournal.add_jobs([{'path': path, 'object_name': 'uploads/big.bin'}])[0]
+        JobJournal.mark(job['id'], 'init', upload_id='upload-1', part_size=100 * 1024)
+        JobJournal.mark(job['id'], 'part', part={'part_number': 1, 'etag': 'etag-1',
+                                                 'size': 100 * 1024, 'crc': None})
+        jobs = JobJournal.load_pending()
+
+        mock_bucket = MagicMock()
+        mock_bucket.list_parts.return_value = MagicMock(
+            parts=[PartInfo(1, 'etag-1', size=100 * 1024)], is_truncated=False, next_marker='')
+        mock_bucket.upload_part.side_effect = \
+            lambda key, upload_id, number, data, **kwargs: MagicMock(etag=f"etag-{number}", crc=None)
+
+        thread = BatchUploadThread([path], config, jobs=jobs)
+        succeeded = []
+        thread.success_signal.connect(lambda idx, name, url: succeeded.append(url))
+
+        with patch('oss2.Bucket', return_value=mock_bucket), \
+                patch('src.main.HistoryManager.add_record'):
+            thread.start()
+            assert thread.wait(5000)
+            qapp.processEvents()
+
+        mock_bucket.init_multipart_upload.assert_not_called()
+        assert sorted(c[0][2] for c in mock_bucket.upload_part.call_args_list) == [2, 3]
+        parts = mock_bucket.complete_multipart_upload.call_args[0][2]
+        assert [p.etag for p in parts] == ['etag-1', 'etag-2', 'etag-3']
+        assert succeeded == ['https://test-bucket.oss-cn-hangzhou.aliyuncs.com/uploads/big.bin']
+        assert JobJournal.load_pending() == []
+
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _reading_bucket(content):
+    """put_object 像真实的一样读完数据（上传时顺带算出 MD5），返回内容的 CRC64"""
+    import oss2
+    crc = oss2.utils.Crc64(0)
+    crc.update(content)
+    bucket = MagicMock()
+    bucket.crc = crc.crc
+    bucket.put_object.side_effect = lambda key, data, **kwargs: (data.read(), MagicMock(crc=crc.crc))[1]
+    return bucket
+
+
+def _run_dedup_batch(qapp, path, mock_bucket):
+    config = {
+        'access_key_id': 'test_key',
+        'access_key_secret': 'test_secret',
+        'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+        'bucket_name': 'test-bucket',
+        'upload_path': 'uploads',
+        'use_random_name': True,
+        'custom_domain': '',
+        'url_expire_time': 0,
+        'dedup_enabled': True,
+        'dedup_verify': True
+    }
+    thread = BatchUploadThread([path], config)
+    urls = []
+    thread.success_signal.connect(lambda idx, name, url: urls.append(url))
+    with patch('oss2.Bucket', return_value=mock_bucket), \
+            patch('src.main.HistoryManager.add_record'):
+        thread.start()
+        assert thread.wait(5000)
+        qapp.processEvents()
+    return urls
+
+
+def test_dedup_reuses_existing_object(qapp):
+    """测试相同内容第二次上传时直接复用已有对象，不再传输"""
+    fd, path = tempfile.mkstemp(suffix="_logo.png")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b"same bytes")
+
+    try:
+        mock_bucket = _reading_bucket(b"same bytes")
+        mock_bucket.head_object.return_value = MagicMock(server_crc=mock_bucket.crc, content_length=10)
+
+        first = _run_dedup_batch(qapp, path, mock_bucket)
+        second = _run_dedup_batch(qapp, path, mock_bucket)
+
+        assert mock_bucket.put_object.call_count == 1
+        assert mock_bucket.head_object.call_count == 1
+        assert len(first) == 1 and first == second
+
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_dedup_detects_stale_entry(qapp):
+    """测试索引中的对象已被删除时重新上传"""
+    import oss2
+
+    fd, path = tempfile.mkstemp(suffix="_logo.png")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b"same bytes")
+
+    try:
+        mock_bucket = _reading_bucket(b"same bytes")
+        mock_bucket.head_object.side_effect = oss2.exceptions.NotFound(404, {}, b'', {})
+
+        first = _run_dedup_batch(qapp, path, mock_bucket)
+        second = _run_dedup_batch(qapp, path, mock_bucket)
+
+        assert mock_bucket.put_object.call_count == 2
+        assert mock_bucket.head_object.call_count == 1
+        assert first != second
+
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_progress_updates_are_coalesced(qapp):
+    """测试高频进度回调被合并：批量信号按帧发送，百分比信号只在变化时发送"""
+    fd, path = tempfile.mkstemp(suffix="_test.bin")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b"x" * 10000)
+
+    config = {
+        'access_key_id': 'test_key',
+        'access_key_secret': 'test_secret',
+        'endpoint': 'oss-cn-hangzhou.aliyuncs.com',
+        'bucket_name': 'test-bucket',
+        'upload_path': 'uploads',
+        'use_random_name': False,
+        'custom_domain': '',
+        'url_expire_time': 0
+    }
+
+    try:
+        thread = BatchUploadThread([path], config)
+
+        def chatty_put_object(object_name, file_path, progress_callback=None, **kwargs):
+            # 每个字节回调一次，并重复上报相同的值
+            for consumed in range(0, 10001):
+                progress_callback(consumed, 10000)
+                progress_callback(consumed, 10000)
+                if consumed % 2000 == 0:
+                    time.sleep(0.05)
+
+        mock_bucket = MagicMock()
+        mock_bucket.put_object.side_effect = chatty_put_object
+
+        batches = []
+        percents = []
+        thread.progress_batch_signal.connect(lambda updates: batches.append(updates))
+        thread.progress_signal.connect(lambda idx, percent: percents.append(percent))
+
+        with patch('oss2.Bucket', return_value=mock_bucket), \
+                patch('src.main.HistoryManager.add_record'):
+            thread.start()
+            assert thread.wait(5000)
+            qapp.processEvents()
+
+        assert 1 <= len(batches) < 100
+        assert batches[-1] == [(0, 10000, 10000)]
+        assert percents == sorted(set(percents))
+        assert percents[-1] == 100
+
+    finally:
+        if os.path.exists(path):
+            os.remove(path)